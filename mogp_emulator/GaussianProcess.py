@@ -1,6 +1,7 @@
 import numpy as np
 from .Kernel import SquaredExponential
-from .MCMC import sample_MCMC
+from .MCMC import sample_MCMC, sample_HMC, sample_MCMC_chains, sample_MCMC_file
+from .MCMC import autothin_samples, _first_lag_autocorrelation
 from scipy.optimize import minimize
 from scipy import linalg
 from scipy.linalg import lapack
@@ -400,6 +401,55 @@ class GaussianProcess(object):
         self.theta = theta
         self._prepare_likelihood()
 
+    def _get_factorization(self):
+        """
+        Returns the current hyperparameters along with the matrices pre-computed from them
+
+        This is used to transfer a fitted emulator between processes without repeating the
+        Cholesky decomposition of the covariance matrix (see ``_set_factorization``).
+
+        :returns: Current hyperparameters, lower triangular Cholesky factor of the
+                  covariance matrix, inverse covariance matrix applied to the targets, and
+                  log determinant of the covariance matrix
+        :rtype: tuple containing 3 ndarrays and a float
+        """
+
+        assert not self.theta is None, "Must set a parameter value to get the factorization"
+
+        return self.theta, self.L, self.invQt, self.logdetQ
+
+    def _set_factorization(self, theta, L, invQt, logdetQ):
+        """
+        Sets the hyperparameters along with matrices that have already been computed
+
+        Sets the state of the emulator in the same way as ``_set_params``, but uses a Cholesky
+        factor and related quantities that were computed elsewhere (i.e. by
+        ``_get_factorization`` on an identical emulator in another process) rather than
+        factorizing the covariance matrix again. The inputs are not checked for consistency
+        with the hyperparameters.
+
+        :param theta: Parameter values. Must be array-like with shape ``(D + 1,)``
+        :type theta: ndarray
+        :param L: Lower triangular Cholesky factor of the covariance matrix, with shape
+                  ``(n, n)``
+        :type L: ndarray
+        :param invQt: Inverse covariance matrix applied to the targets, with shape ``(n,)``
+        :type invQt: ndarray
+        :param logdetQ: Log determinant of the covariance matrix
+        :type logdetQ: float
+        :returns: None
+        """
+
+        theta = np.array(theta)
+        assert theta.shape == (self.D + 1,), "Parameter vector must have length number of inputs + 1"
+        assert np.shape(L) == (self.n, self.n), "Cholesky factor must have shape (n, n)"
+        assert np.shape(invQt) == (self.n,), "invQt must have shape (n,)"
+
+        self.theta = theta
+        self.L = L
+        self.invQt = invQt
+        self.logdetQ = float(logdetQ)
+
     def loglikelihood(self, theta):
         """
         Calculate the negative log-likelihood at a particular value of the hyperparameters
@@ -748,20 +798,63 @@ class GaussianProcess(object):
 
         self.samples = np.random.multivariate_normal(self.mle_theta, cov, size=n_samples)
 
-    def learn_hyperparameters_MCMC(self, n_samples = 1000, thin = 0):
+    def learn_hyperparameters_MCMC(self, n_samples = 1000, thin = 0, method = "MH", n_chains = 1,
+                                   processes = None, n_adapt = 0, use_hessian = True, chain_file = None,
+                                   target_ess = None, check_every = None):
         """
         Sample hyperparameters via MCMC estimation
 
-        Sample hyperparameters via MCMC estimation. Parameters are found by doing a random
-        walk in parameter space, choosing new points via the Metropolis-Hastings algorithm.
-        Steps are drawn from a multivariate normal distribution around the current parameters,
-        and the steps are accepted and rejected based on the marginal log-likelihood function.
-        The chain is started from the MLE parameter values, and the step sizes are estimated
-        by inverting the local Hessian at the MLE solution. Because of this, the MCMC chain
-        does not require a "burn-in" phase. Optional parameters specify the number of MCMC
+        Sample hyperparameters via MCMC estimation. Two samplers are available, selected using
+        the ``method`` argument. With ``method = "MH"`` (the default), parameters are found by
+        doing a random walk in parameter space, choosing new points via the Metropolis-Hastings
+        algorithm. Steps are drawn from a multivariate normal distribution around the current
+        parameters, and the steps are accepted and rejected based on the marginal log-likelihood
+        function. The chain is started from the MLE parameter values, and the step sizes are
+        estimated by inverting the local Hessian at the MLE solution. Because of this, the MCMC
+        chain does not require a "burn-in" phase. Optional parameters specify the number of MCMC
         steps to take (must be a positive integer, default is 1000) and information about
         how to thin the MCMC chain to obtain uncorrelated samples.
 
+        With ``method = "HMC"``, the chain is instead drawn using Hamiltonian Monte Carlo with
+        the No-U-Turn Sampler (see ``sample_HMC`` in the ``MCMC`` submodule), which uses the
+        partial derivatives of the log-likelihood to propose distant points that are still
+        likely to be accepted. The chain is started from the MLE parameter values and the
+        inverse of the local Hessian is used as the inverse mass matrix. The step size is tuned
+        during a short warm-up phase that is discarded. This usually produces many more
+        effective samples per log-likelihood evaluation than the Metropolis-Hastings sampler,
+        particularly when the number of inputs is large.
+
+        The Metropolis-Hastings sampler can also run ``n_chains`` independent chains in
+        parallel on ``processes`` processes (see ``sample_MCMC_chains`` in the ``MCMC``
+        submodule). The chains are started from points drawn from a normal distribution
+        around the MLE parameters with twice the standard deviation of the local covariance,
+        and the first half of each chain is discarded as burn-in before the chains are
+        thinned and merged. In this case, ``n_samples`` is the number of steps in each chain.
+        A warning is given if the split-:math:`\\hat{R}` diagnostic for any parameter
+        exceeds 1.05. If ``target_ess`` is given, the chains are advanced in blocks of
+        ``check_every`` steps and sampling stops as soon as the bulk effective sample size of
+        every hyperparameter (computed after discarding the first ``n_samples//2`` steps of
+        each chain) reaches ``target_ess`` and split-:math:`\\hat{R}` is below 1.05, so that
+        ``n_samples`` is only the maximum number of steps in each chain.
+
+        For a single Metropolis-Hastings chain, ``n_adapt`` can be set to a positive integer
+        to use adaptive Metropolis, which tunes the proposal covariance from the running
+        moments of the chain during a burn-in window of ``n_adapt`` steps (which are
+        discarded) and continues with vanishing adaptation afterwards (see ``sample_MCMC`` in
+        the ``MCMC`` submodule). This avoids rerunning chains whose acceptance rate is out of
+        bounds. If ``use_hessian = False``, the local Hessian is not computed; the initial
+        proposal covariance (or the inverse mass matrix for ``method = "HMC"``) is then a
+        multiple of the identity matrix, so this requires either ``n_adapt > 0`` or
+        ``method = "HMC"``.
+
+        For long chains, a single non-adaptive Metropolis-Hastings chain can be streamed to
+        disk by giving a file name as ``chain_file`` (see ``sample_MCMC_file`` in the ``MCMC``
+        submodule). The chain is then written in blocks without holding it in memory, and if
+        the run is interrupted, calling this method again with the same file resumes the chain
+        from the last block that was written. Only the thinned chain is loaded into the
+        ``samples`` attribute, and when autothinning, the stride is estimated from the last
+        100000 samples of the chain.
+
         Thinning may be specified with a non-negative integer. If a positive integer is
         given, the chain will be thinned by only keeping every ``thin`` steps. Note that
         ``thin = 1`` means that the chain will not be thinned. If ``thin = 0`` is given
@@ -781,11 +874,12 @@ class GaussianProcess(object):
 
         Note that at present, the return information from the MCMC sampler is not returned
         or cached. The code does give a warning if a problem arises, in particular if the
-        acceptance rate is not within the target range of 20% to 60% or if the final MCMC
-        chain has a first lag autocorrelation that indicates samples may not be independent.
-        If either of these warnings occur, the MCMC chain may require further inspection.
-        At the moment, this can only be done by re-running the MCMC samples using the function
-        ``sample_MCMC`` in the ``MCMC`` submodule manually.
+        acceptance rate is not within the target range of 20% to 60% (or the average acceptance
+        statistic is below 60% for HMC) or if the final MCMC chain has a first lag
+        autocorrelation that indicates samples may not be independent. If either of these
+        warnings occur, the MCMC chain may require further inspection. At the moment, this can
+        only be done by re-running the MCMC samples using the functions ``sample_MCMC`` or
+        ``sample_HMC`` in the ``MCMC`` submodule manually.
 
         :param n_samples: Number of MCMC steps to be taken. Must be a positive integer.
         :type n_samples: int
@@ -795,28 +889,120 @@ class GaussianProcess(object):
                      chain will not be thinned. ``thin = 0`` will attempt to autothin
                      the chain using the autocorrelation of the MCMC chain. Default is 0.
         :type thin: int
+        :param method: MCMC sampler to use. Must be ``"MH"`` (random walk Metropolis-Hastings)
+                       or ``"HMC"`` (Hamiltonian Monte Carlo with the No-U-Turn Sampler).
+                       Default is ``"MH"``.
+        :type method: str
+        :param n_chains: Number of independent chains to run. Must be a positive integer, and
+                         must be 1 if ``method = "HMC"``. Default is 1.
+        :type n_chains: int
+        :param processes: Number of processes to use when running multiple chains. Must be a
+                          positive integer or ``None`` to use the number of processors on the
+                          computer. Default is ``None``.
+        :type processes: int or None
+        :param n_adapt: Number of adaptive Metropolis burn-in steps for ``method = "MH"`` with
+                        a single chain. Must be a non-negative integer. Default is 0 (no
+                        adaptation).
+        :type n_adapt: int
+        :param use_hessian: Whether to compute the local Hessian at the MLE solution to set
+                            the initial proposal covariance. Default is ``True``.
+        :type use_hessian: bool
+        :param chain_file: File to which the chain is written, or ``None`` to keep the chain in
+                           memory. Only supported for a single non-adaptive MH chain. Default
+                           is ``None``.
+        :type chain_file: str or None
+        :param target_ess: Bulk effective sample size at which the chains are stopped early when
+                           running multiple chains. Must be positive or ``None`` to always take
+                           ``n_samples`` steps. Default is ``None``.
+        :type target_ess: float or None
+        :param check_every: Number of steps taken by each chain between convergence checks when
+                            ``target_ess`` is given. Must be a positive integer or ``None`` to
+                            check every ``n_samples//10`` steps (with a minimum of 100). Default
+                            is ``None``.
+        :type check_every: int or None
         :returns: None
         """
 
         n_samples = int(n_samples)
         thin = int(thin)
+        n_chains = int(n_chains)
+        n_adapt = int(n_adapt)
 
         assert n_samples > 0
         assert thin >= 0
+        assert method in ("MH", "HMC"), "MCMC method must be 'MH' or 'HMC'"
+        assert n_chains > 0, "number of chains must be positive"
+        assert n_chains == 1 or method == "MH", "multiple chains are only supported by the MH sampler"
+        assert n_adapt >= 0, "number of adaptation steps must be non-negative"
+        assert n_adapt == 0 or (method == "MH" and n_chains == 1), "adaptation requires a single MH chain"
+        assert use_hessian or n_adapt > 0 or method == "HMC", "skipping the Hessian requires adaptation"
+        assert chain_file is None or (method == "MH" and n_chains == 1 and n_adapt == 0), \
+            "writing the chain to a file requires a single non-adaptive MH chain"
+        assert target_ess is None or n_chains > 1, "stopping at a target ESS requires multiple chains"
 
         n_params = self.D + 1
 
         if self.mle_theta is None:
             self.learn_hyperparameters()
 
-        step_size = 2.4/np.sqrt(n_params)*self.compute_local_covariance()
+        if use_hessian:
+            cov = self.compute_local_covariance()
+        else:
+            cov = 0.01*np.eye(n_params)
+
+        if method == "HMC":
+            self.samples, acceptance, first_lag = sample_HMC(self.loglikelihood, self.partial_devs,
+                                                             self.mle_theta, n_samples, thin,
+                                                             loglike_sign = -1., inv_mass = cov)
+
+            if acceptance < 0.6:
+                warnings.warn("average acceptance statistic of "+str(100.*acceptance)+"% is too low")
+        elif n_chains > 1:
+            step_size = 2.4/np.sqrt(n_params)*cov
+            starts = np.random.multivariate_normal(self.mle_theta, 4.*cov, size = n_chains)
+
+            self.samples, acceptance, rhat, ess = sample_MCMC_chains(self.loglikelihood, starts, step_size,
+                                                                     n_samples, thin, loglike_sign = -1.,
+                                                                     processes = processes,
+                                                                     n_burn = n_samples//2,
+                                                                     target_ess = target_ess,
+                                                                     check_every = check_every)
+
+            chains = np.reshape(self.samples, (n_chains, -1, n_params))
+            first_lag = np.mean([_first_lag_autocorrelation(chain) for chain in chains], axis = 0)
+
+            if acceptance < 0.2 or acceptance > 0.6:
+                warnings.warn("acceptance rate of "+str(100.*acceptance)+"% not within bounds")
+
+            if np.any(rhat > 1.05):
+                warnings.warn("split-Rhat of "+str(np.nanmax(rhat))+" indicates chains have not converged")
+        elif not chain_file is None:
+            step_size = 2.4/np.sqrt(n_params)*cov
+
+            chain, rejected, acceptance, writer = sample_MCMC_file(self.loglikelihood, self.mle_theta,
+                                                                   step_size, chain_file, n_samples,
+                                                                   loglike_sign = -1.)
+
+            # autothin using the end of the chain only so that the chain is not loaded into memory
+
+            if thin == 0:
+                thin = autothin_samples(np.array(chain[-100000:]))
+
+            self.samples = np.array(chain[::thin])
+            first_lag = _first_lag_autocorrelation(self.samples)
+
+            if acceptance < 0.2 or acceptance > 0.6:
+                warnings.warn("acceptance rate of "+str(100.*acceptance)+"% not within bounds")
+        else:
+            step_size = 2.4/np.sqrt(n_params)*cov
 
-        self.samples, rejected, acceptance, first_lag = sample_MCMC(self.loglikelihood,
-                                                                    self.mle_theta, step_size,
-                                                                    n_samples, thin, loglike_sign = -1.)
+            self.samples, rejected, acceptance, first_lag = sample_MCMC(self.loglikelihood,
+                                                                        self.mle_theta, step_size,
+                                                                        n_samples, thin, loglike_sign = -1.,
+                                                                        n_adapt = n_adapt)
 
-        if acceptance < 0.2 or acceptance > 0.6:
-            warnings.warn("acceptance rate of "+str(100.*acceptance)+"% not within bounds")
+            if acceptance < 0.2 or acceptance > 0.6:
+                warnings.warn("acceptance rate of "+str(100.*acceptance)+"% not within bounds")
 
         if np.max(first_lag) > 3./np.sqrt(len(self.samples)):
             warnings.warn("autocorrelation of "+str(np.max(first_lag))+
@@ -877,8 +1063,8 @@ class GaussianProcess(object):
 
         var = None
         if do_unc:
-            var = np.maximum(exp_theta[self.D] - np.sum(Ktest *
-                                    linalg.cho_solve((self.L, True), Ktest), axis=0), 0.)
+            invL_Ktest = linalg.solve_triangular(self.L, Ktest, lower=True)
+            var = np.maximum(exp_theta[self.D] - np.sum(invL_Ktest**2, axis=0), 0.)
 
         deriv = None
         if do_deriv:
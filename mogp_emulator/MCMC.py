@@ -1,9 +1,12 @@
 import numpy as np
 from numpy.linalg import LinAlgError
+from scipy.stats import norm, rankdata
+from multiprocessing import Pool
 from inspect import signature
 import warnings
+import os
 
-def MH_proposal(current_params, step_sizes):
+def MH_proposal(current_params, step_sizes, random_state = None):
     """
     Propose an MCMC step using a Metropolis-Hastings method
     
@@ -20,6 +23,9 @@ def MH_proposal(current_params, step_sizes):
                        with both dimensions the same length as ``current_params``, and
                        must be positive definite.
     :type step_sizes: ndarray
+    :param random_state: Random number generator used to draw the proposal. Optional, default
+                         is ``None`` (use the global ``numpy.random`` generator).
+    :type random_state: numpy.random.RandomState or None
     :returns: New value of parameters, a 1D array with the same length as ``current_params``
     :rtype: ndarray
     """
@@ -33,10 +39,13 @@ def MH_proposal(current_params, step_sizes):
     assert len(current_params) == step_sizes.shape[0], "length of current parameters must match length of step sizes"
     assert np.all(np.diag(step_sizes) > 0.), "step sizes must be a positive definite matrix"
     
-    return np.random.multivariate_normal(mean=current_params, cov = step_sizes)
+    if random_state is None:
+        random_state = np.random
 
+    return random_state.multivariate_normal(mean=current_params, cov = step_sizes)
 
-def MCMC_step(loglikelihood, current_params, step_sizes, loglike_sign = 1.):
+
+def MCMC_step(loglikelihood, current_params, step_sizes, loglike_sign = 1., random_state = None):
     """
     Method to take a weak prior Metropolis-Hastings MCMC step
     
@@ -69,6 +78,10 @@ def MCMC_step(loglikelihood, current_params, step_sizes, loglike_sign = 1.):
                          ``loglikelihood`` function computes the negative log-likelihood,
                          pass ``-1.`` for this parameter. Optional, default value is ``1.``
     :type loglike_sign: float
+    :param random_state: Random number generator used to draw the proposal and decide whether
+                         it is accepted. Optional, default is ``None`` (use the global
+                         ``numpy.random`` generator).
+    :type random_state: numpy.random.RandomState or None
     :returns: Proposed next point and whether or not the point is accepted as a tuple.
               The first return item is the next point (as a 1D array with the same length\
               as ``current_params``) and the second item is a boolean indicating whether
@@ -80,21 +93,25 @@ def MCMC_step(loglikelihood, current_params, step_sizes, loglike_sign = 1.):
     assert len(signature(loglikelihood).parameters) == 1
     assert loglike_sign == 1. or loglike_sign == -1., "loglikelihood sign must be +/- 1"
     
-    next_point = MH_proposal(current_params, step_sizes)
+    if random_state is None:
+        random_state = np.random
+
+    next_point = MH_proposal(current_params, step_sizes, random_state)
 
     try:
         H = loglike_sign*(-loglikelihood(current_params) + loglikelihood(next_point))
     except (FloatingPointError, AssertionError, LinAlgError):
         H = np.nan
 
-    if H >= np.log(np.random.random()) and np.isfinite(H):
+    if H >= np.log(random_state.random_sample()) and np.isfinite(H):
         accept = True
     else:
         accept = False
 
     return next_point, accept
 
-def sample_MCMC(loglikelihood, start, step_sizes, n_samples = 1000, thin = 0, loglike_sign = 1.):
+def sample_MCMC(loglikelihood, start, step_sizes, n_samples = 1000, thin = 0, loglike_sign = 1.,
+                n_adapt = 0, target_accept = None, adapt_offset = 10.):
     """
     Draw MCMC samples for a given log-likelihood function with weak priors
     
@@ -128,6 +145,19 @@ def sample_MCMC(loglikelihood, start, step_sizes, n_samples = 1000, thin = 0, lo
     An optional parameter ``loglike_sign`` can be passed that must be a float with the
     value +/- 1. This is multiplied by the log-likelihood and thus allows methods that
     compute the negative log-likelihood to be used in this routine.
+
+    If ``n_adapt`` is positive, the sampler uses adaptive Metropolis (Andrieu and Thoms,
+    Statistics and Computing 18, 343-373, 2008). The proposal covariance is the running
+    covariance of the chain multiplied by a global scale factor, which is adjusted so that
+    the acceptance rate approaches ``target_accept``. During a burn-in window of ``n_adapt``
+    steps, the running moments and scale are updated with a gain that decays as
+    :math:`{(t + t_0)^{-0.6}}`, where :math:`{t}` is the number of steps taken, and
+    ``step_sizes`` is used as the initial proposal covariance. The offset :math:`{t_0}`
+    (``adapt_offset``) gives the initial covariance the weight of :math:`{t_0}` prior steps,
+    so that a few early rejections cannot collapse the proposal. The burn-in steps are
+    discarded. After the burn-in, the gain decays as :math:`{(t + t_0)^{-1}}`, so that the
+    adaptation vanishes and the chain samples the correct distribution. When ``n_adapt = 0`` (the default), the
+    proposal covariance is fixed at ``step_sizes``.
     
     Returns the final thinned MCMC chain (a 2D array, where the first dimension indicates
     the different samples and the second dimension indicates the different parameters),
@@ -160,6 +190,21 @@ def sample_MCMC(loglikelihood, start, step_sizes, n_samples = 1000, thin = 0, lo
                          ``loglikelihood`` function computes the negative log-likelihood,
                          pass ``-1.`` for this parameter. Optional, default value is ``1.``
     :type loglike_sign: float
+    :param n_adapt: Number of adaptive Metropolis burn-in steps. Must be a non-negative
+                    integer. If ``0``, the proposal covariance is fixed and no steps are
+                    discarded. Optional, default is ``0``.
+    :type n_adapt: int
+    :param target_accept: Target acceptance rate for adaptive Metropolis. Must be between
+                          0 and 1 or ``None``. Only used if ``n_adapt > 0``. If ``None``
+                          (default), the target is ``0.234 + 0.206/n_params``, which is
+                          0.44 for a single parameter (the optimal rate in one dimension)
+                          and approaches the asymptotic optimal rate of 0.234 for many
+                          parameters.
+    :type target_accept: float or None
+    :param adapt_offset: Number of prior steps given to the initial proposal covariance in
+                         adaptive Metropolis. Must be non-negative. Only used if
+                         ``n_adapt > 0``. Optional, default is ``10``.
+    :type adapt_offset: float
     :returns: MCMC chain (2D array), array of rejected points (2D array), acceptance rate
               (float), and first lag autocorrelation of the thinned MCMC chain (float)
     :rtype: tuple containing (ndarray, ndarray, float, float)
@@ -167,26 +212,57 @@ def sample_MCMC(loglikelihood, start, step_sizes, n_samples = 1000, thin = 0, lo
 
     n_samples = int(n_samples)
     thin = int(thin)
+    n_adapt = int(n_adapt)
 
     assert n_samples > 0, "number of samples must be a positive integer"
     assert thin >= 0, "thin must be a non-negative integer"
+    assert n_adapt >= 0, "number of adaptation steps must be a non-negative integer"
+    assert target_accept is None or (target_accept > 0. and target_accept < 1.), "target acceptance rate must be between 0 and 1"
+    assert adapt_offset >= 0., "adaptation offset must be non-negative"
     
     start = np.array(start)
     
     assert start.ndim == 1, "starting point must be a 1d array"
     n_params = len(start)
 
+    if target_accept is None:
+        target_accept = 0.234 + 0.206/float(n_params)
+
     samples = np.zeros((n_samples, n_params))
     samples[0] = start
     rejected = []
 
-    for i in range(n_samples - 1):
-        next_point, accept = MCMC_step(loglikelihood, samples[i], step_sizes, loglike_sign)
+    current = np.copy(start)
+    proposal_cov = np.array(step_sizes, dtype = float)
+
+    if n_adapt > 0:
+        log_scale = np.log(2.4**2/float(n_params))
+        running_mean = np.array(start, dtype = float)
+        running_cov = proposal_cov/np.exp(log_scale)
+
+    for i in range(n_adapt + n_samples - 1):
+        next_point, accept = MCMC_step(loglikelihood, current, proposal_cov, loglike_sign)
         if accept:
-            samples[i+1] = np.copy(next_point)
-        else:
-            samples[i+1] = np.copy(samples[i])
-            rejected.append(np.array(next_point))
+            current = np.copy(next_point)
+
+        if i >= n_adapt:
+            samples[i - n_adapt + 1] = np.copy(current)
+            if not accept:
+                rejected.append(np.array(next_point))
+
+        if n_adapt > 0:
+            gain = 1./(i + 1. + adapt_offset)
+            if i < n_adapt:
+                scale_gain = (i + 1. + adapt_offset)**(-0.6)
+            else:
+                scale_gain = gain
+            delta = current - running_mean
+            running_mean = running_mean + gain*delta
+            running_cov = running_cov + gain*((1. - gain)*np.outer(delta, delta) - running_cov)
+            log_scale += scale_gain*(float(accept) - target_accept)
+            proposal_cov = np.exp(log_scale)*running_cov + 1.e-10*np.eye(n_params)
+            if i == n_adapt - 1:
+                samples[0] = np.copy(current)
         
     acceptance = float(n_samples - len(rejected))/float(n_samples)
 
@@ -197,26 +273,749 @@ def sample_MCMC(loglikelihood, start, step_sizes, n_samples = 1000, thin = 0, lo
     
     thinned = samples[::thin_freq]
 
-    first_lag = np.zeros(n_params)
-
-    if n_samples > 1:
-        for i in range(n_params):
-            autocorr = np.correlate(thinned[:,i]-np.mean(thinned[:,i]), thinned[:,i]-np.mean(thinned[:,i]), mode="full")
-            if np.max(autocorr) > 0.:
-                first_lag[i] = autocorr[np.argmax(autocorr)+1]/np.max(autocorr)
+    first_lag = _first_lag_autocorrelation(thinned)
 
     return thinned, np.array(rejected), acceptance, first_lag
 
+def _first_lag_autocorrelation(thinned):
+    """
+    Compute the first lag autocorrelation of each parameter in a (thinned) MCMC chain
+
+    :param thinned: MCMC chain, a 2D array where the first dimension indicates the samples and
+                    the second dimension indicates the different parameters
+    :type thinned: ndarray
+    :returns: First lag autocorrelation for each parameter (zero if the chain has a single
+              sample or the parameter does not vary)
+    :rtype: ndarray
+    """
+
+    n_samples, n_params = thinned.shape
+
+    if n_samples < 2:
+        return np.zeros(n_params)
+
+    acov = _autocovariance(thinned)
+
+    return np.where(acov[0] > 0., acov[1]/np.where(acov[0] > 0., acov[0], 1.), 0.)
+
+class ChainWriter(object):
+    """
+    Class for writing a long MCMC chain to disk in fixed-size blocks
+
+    Samples appended to the writer are buffered in memory and written to ``filename`` in
+    blocks of ``block_size`` samples. The file holds the raw samples as 64-bit floats in C
+    order, so the chain can be accessed without loading it into memory using ``get_chain``
+    (which returns a read-only ``numpy.memmap`` with shape ``(n_written, n_params)``).
+    Rather than storing the full chain and all rejected proposals in memory, the writer keeps
+    running estimates of the mean and covariance of the chain and a bounded random sample
+    (reservoir) of at most ``n_reservoir`` rejected proposals.
+
+    The writer has its own random number generator (the ``random_state`` attribute), which
+    is used for the reservoir and should be used to draw the chain, so that the global
+    ``numpy.random`` generator of the caller is never reset. Each time a block is written,
+    the data is flushed to disk and the state of the writer (the number of samples written,
+    the running statistics, the rejection reservoir, the state of the random number
+    generator, and a fingerprint identifying the chain) is saved to
+    ``filename + ".state.npz"``. If a writer is created for a file that already has a state
+    file, it resumes from the last complete block: any samples written after the state was
+    saved are discarded, and the random number generator is restored, so that continuing a
+    chain after an interruption gives the same result as an uninterrupted run. If the
+    fingerprint of the existing chain does not match the one given, or if the chain file
+    is missing or holds fewer samples than recorded in the state file, a ``ValueError`` is
+    raised rather than extending a chain that was drawn with different settings.
+    """
+    def __init__(self, filename, n_params, block_size = 1000, n_reservoir = 1000, fingerprint = None,
+                 random_state = None):
+        """
+        Create a new chain writer, or resume from an existing file
+
+        :param filename: File where the chain will be written
+        :type filename: str
+        :param n_params: Number of parameters in the chain. Must be a positive integer, and
+                         must match the existing file when resuming.
+        :type n_params: int
+        :param block_size: Number of samples held in memory before writing to disk. Must be a
+                           positive integer. Optional, default is 1000.
+        :type block_size: int
+        :param n_reservoir: Maximum number of rejected proposals kept in memory. Must be a
+                            non-negative integer. Optional, default is 1000.
+        :type n_reservoir: int
+        :param fingerprint: Array identifying the settings used to draw the chain (for instance,
+                            the starting point and step sizes). When resuming, must match the
+                            fingerprint stored with the existing chain. Optional, default is
+                            ``None`` (no check is made).
+        :type fingerprint: ndarray or None
+        :param random_state: Random number generator used for a new chain. Ignored when
+                             resuming, as the saved generator is restored. Optional, default
+                             is ``None`` (create a generator seeded from the global
+                             ``numpy.random`` generator).
+        :type random_state: numpy.random.RandomState or None
+        :returns: New ``ChainWriter`` instance
+        :rtype: ChainWriter
+        """
+
+        n_params = int(n_params)
+        block_size = int(block_size)
+        n_reservoir = int(n_reservoir)
+
+        assert n_params > 0, "number of parameters must be positive"
+        assert block_size > 0, "block size must be positive"
+        assert n_reservoir >= 0, "reservoir size must be non-negative"
+
+        self.filename = filename
+        self.state_filename = filename + ".state.npz"
+        self.n_params = n_params
+        self.block_size = block_size
+        self.n_reservoir = n_reservoir
+
+        self._buffer = []
+
+        if fingerprint is None:
+            self.fingerprint = np.zeros(0)
+        else:
+            self.fingerprint = np.ravel(np.array(fingerprint, dtype = float))
+
+        if os.path.exists(self.state_filename):
+            state = np.load(self.state_filename)
+            assert int(state["n_params"]) == n_params, "number of parameters does not match existing chain"
+            if not fingerprint is None and "fingerprint" in state.files:
+                saved = np.array(state["fingerprint"])
+                if not (saved.shape == self.fingerprint.shape and
+                        np.allclose(saved, self.fingerprint, rtol = 1.e-12, atol = 0., equal_nan = True)):
+                    raise ValueError("existing chain in "+filename+" was drawn with different settings")
+            self.n_written = int(state["n_written"])
+            self.n_rejected = int(state["n_rejected"])
+            self._mean = np.array(state["mean"])
+            self._m2 = np.array(state["m2"])
+            self._reservoir = list(state["reservoir"])[:n_reservoir]
+            self.current = np.array(state["current"])
+            self.random_state = np.random.RandomState()
+            self.random_state.set_state(("MT19937", np.array(state["rng_keys"]), int(state["rng_pos"]),
+                                         int(state["rng_has_gauss"]), float(state["rng_gauss"])))
+            n_bytes = self.n_written*n_params*np.dtype(float).itemsize
+            if not os.path.exists(filename) or os.path.getsize(filename) < n_bytes:
+                raise ValueError("chain file "+filename+" is missing or shorter than recorded in "+
+                                 self.state_filename)
+            with open(filename, "r+b") as f:
+                f.truncate(n_bytes)
+        else:
+            self.n_written = 0
+            self.n_rejected = 0
+            self._mean = np.zeros(n_params)
+            self._m2 = np.zeros((n_params, n_params))
+            self._reservoir = []
+            self.current = None
+            if random_state is None:
+                random_state = np.random.RandomState(np.random.randint(2**31 - 1))
+            self.random_state = random_state
+            open(filename, "wb").close()
+
+    @property
+    def n_samples(self):
+        "Total number of samples in the chain, including those not yet written to disk"
+        return self.n_written + len(self._buffer)
+
+    @property
+    def mean(self):
+        "Running mean of the chain"
+        return np.copy(self._mean)
+
+    @property
+    def cov(self):
+        "Running covariance of the chain"
+        if self.n_samples < 2:
+            return np.zeros((self.n_params, self.n_params))
+        return self._m2/float(self.n_samples - 1)
+
+    @property
+    def rejected(self):
+        "Reservoir of rejected proposals, a 2D array with at most ``n_reservoir`` rows"
+        return np.reshape(np.array(self._reservoir), (len(self._reservoir), self.n_params))
+
+    @property
+    def acceptance(self):
+        "Fraction of samples in the chain that were not rejected proposals"
+        if self.n_samples == 0:
+            return 0.
+        return float(self.n_samples - self.n_rejected)/float(self.n_samples)
+
+    def append(self, sample):
+        """
+        Append a sample to the chain
+
+        Updates the running statistics and writes a block to disk if the buffer is full.
+
+        :param sample: Sample to be appended. Must be a 1D array of length ``n_params``.
+        :type sample: ndarray
+        :returns: None
+        """
+
+        sample = np.array(sample, dtype = float)
+        assert sample.shape == (self.n_params,), "sample must be a 1D array of length n_params"
+
+        self._buffer.append(sample)
+        self.current = np.copy(sample)
+
+        delta = sample - self._mean
+        self._mean += delta/float(self.n_samples)
+        self._m2 += np.outer(delta, sample - self._mean)
+
+        if len(self._buffer) >= self.block_size:
+            self.flush()
+
+    def reject(self, proposal):
+        """
+        Record a rejected proposal
+
+        The proposal is kept in the reservoir with a probability that ensures that the
+        reservoir holds a uniform random sample of all rejected proposals.
+
+        :param proposal: Rejected proposal. Must be a 1D array of length ``n_params``.
+        :type proposal: ndarray
+        :returns: None
+        """
+
+        self.n_rejected += 1
+
+        if self.n_reservoir == 0:
+            return
+
+        if len(self._reservoir) < self.n_reservoir:
+            self._reservoir.append(np.array(proposal, dtype = float))
+        else:
+            index = self.random_state.randint(self.n_rejected)
+            if index < self.n_reservoir:
+                self._reservoir[index] = np.array(proposal, dtype = float)
+
+    def flush(self):
+        """
+        Write any buffered samples to disk and save the state of the writer
+
+        :returns: None
+        """
+
+        if len(self._buffer) > 0:
+            with open(self.filename, "ab") as f:
+                f.write(np.array(self._buffer, dtype = float).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            self.n_written += len(self._buffer)
+            self._buffer = []
+
+        rng = self.random_state.get_state()
+        tmp_filename = self.state_filename + ".tmp.npz"
+        np.savez(tmp_filename, n_params = self.n_params, n_written = self.n_written,
+                 n_rejected = self.n_rejected, mean = self._mean, m2 = self._m2,
+                 reservoir = self.rejected,
+                 current = self.current if not self.current is None else np.zeros(self.n_params),
+                 fingerprint = self.fingerprint, rng_keys = rng[1], rng_pos = rng[2], rng_has_gauss = rng[3], rng_gauss = rng[4])
+        os.replace(tmp_filename, self.state_filename)
+
+    def get_chain(self):
+        """
+        Get a read-only memory map of the samples written to disk
+
+        :returns: Memory-mapped chain with shape ``(n_written, n_params)``
+        :rtype: numpy.memmap or ndarray
+        """
+
+        if self.n_written == 0:
+            return np.zeros((0, self.n_params))
+
+        return np.memmap(self.filename, dtype = float, mode = "r", shape = (self.n_written, self.n_params))
+
+def sample_MCMC_file(loglikelihood, start, step_sizes, filename, n_samples = 1000, loglike_sign = 1.,
+                     block_size = 1000, n_reservoir = 1000):
+    """
+    Draw MCMC samples, streaming the chain to disk so that it can be resumed
+
+    Runs the same Metropolis-Hastings sampler as ``sample_MCMC``, but writes the chain to
+    ``filename`` in blocks of ``block_size`` samples using a ``ChainWriter``, so that memory
+    use does not grow with the length of the chain. Only the running mean and covariance of
+    the chain and a random subset of at most ``n_reservoir`` rejected proposals are kept in
+    memory. If a chain has already been partially written to ``filename`` (for instance, if
+    a previous run was interrupted), sampling resumes from the last complete block, and
+    continues until the chain has ``n_samples`` points. If the existing chain already has
+    more than ``n_samples`` points, it is not extended and only its first ``n_samples``
+    points are returned (the acceptance rate, rejected points, and running statistics of the
+    writer still describe the whole chain in the file). The chain is stored with a
+    fingerprint made from the starting point, the step sizes, the sign of the log-likelihood,
+    and the log-likelihood at the starting point, and a ``ValueError`` is raised if an
+    existing chain has a different fingerprint. The chain is drawn with the random number
+    generator of the ``ChainWriter``, so the global ``numpy.random`` state is not reset when
+    resuming.
+
+    The chain is not thinned; the returned memory map can be thinned by the caller (for
+    instance using ``autothin_samples``).
+
+    :param loglikelihood: Log-likelihood function to be used in the MCMC step. Must be
+                          callable and must accept a single argument, which is the array
+                          holding the parameters. If this function computes the negative
+                          log-likelihood, pass ``loglike_sign = -1.`` to the function as well.
+    :type loglikelihood: function or other callable
+    :param start: Starting value of the parameters. Must be a 1D array. When resuming, must
+                  match the starting point of the existing chain.
+    :type start: ndarray
+    :param step_sizes: Covariance matrix from which steps are drawn. Must be a 2D array
+                       with both dimensions the same length as ``start``, and must be
+                       positive definite.
+    :type step_sizes: ndarray
+    :param filename: File where the chain is written
+    :type filename: str
+    :param n_samples: Number of points in the chain (including the starting point). Must be
+                      a positive integer. Optional, default value is 1000.
+    :type n_samples: int
+    :param loglike_sign: Sign for the log-likelihood function. If the provided
+                         ``loglikelihood`` function computes the negative log-likelihood,
+                         pass ``-1.`` for this parameter. Optional, default value is ``1.``
+    :type loglike_sign: float
+    :param block_size: Number of samples written to disk at once. Must be a positive integer.
+                       Optional, default is 1000.
+    :type block_size: int
+    :param n_reservoir: Maximum number of rejected proposals kept. Must be a non-negative
+                        integer. Optional, default is 1000.
+    :type n_reservoir: int
+    :returns: Memory-mapped MCMC chain (2D array), reservoir of rejected points (2D array),
+              acceptance rate (float), and the ``ChainWriter`` holding the running mean and
+              covariance of the chain
+    :rtype: tuple containing (numpy.memmap, ndarray, float, ChainWriter)
+    """
+
+    n_samples = int(n_samples)
+
+    assert n_samples > 0, "number of samples must be a positive integer"
+
+    start = np.array(start, dtype = float)
+
+    assert start.ndim == 1, "starting point must be a 1d array"
+
+    try:
+        start_loglike = float(loglikelihood(start))
+    except (FloatingPointError, AssertionError, LinAlgError):
+        start_loglike = np.nan
+
+    fingerprint = np.concatenate((start, np.ravel(np.array(step_sizes, dtype = float)),
+                                  [loglike_sign, start_loglike]))
+
+    writer = ChainWriter(filename, len(start), block_size, n_reservoir, fingerprint)
+
+    if writer.n_samples == 0:
+        writer.append(start)
+
+    current = writer.current
+
+    while writer.n_samples < n_samples:
+        next_point, accept = MCMC_step(loglikelihood, current, step_sizes, loglike_sign,
+                                       writer.random_state)
+        if accept:
+            current = np.copy(next_point)
+        else:
+            writer.reject(next_point)
+        writer.append(current)
+
+    writer.flush()
+
+    return writer.get_chain()[:n_samples], writer.rejected, writer.acceptance, writer
+
+def _run_chain_block(loglikelihood, start, step_sizes, n_steps, loglike_sign, seed):
+    """
+    Advance a single Metropolis-Hastings chain by a block of steps
+
+    Worker function used by ``sample_MCMC_chains`` to advance one chain in a separate
+    process. Each block uses its own random number generator created from ``seed``, so that
+    results do not depend on how the chains are distributed across processes and the global
+    random number generator is not reset when the block is run in the calling process.
+
+    :returns: Array of shape ``(n_steps, n_params)`` holding the chain after each step and
+              the number of rejected proposals
+    :rtype: tuple containing an ndarray and an int
+    """
+
+    random_state = np.random.RandomState(seed)
+
+    samples = np.zeros((n_steps, len(start)))
+    current = np.array(start)
+    n_rejected = 0
+
+    for i in range(n_steps):
+        next_point, accept = MCMC_step(loglikelihood, current, step_sizes, loglike_sign, random_state)
+        if accept:
+            current = np.copy(next_point)
+        else:
+            n_rejected += 1
+        samples[i] = current
+
+    return samples, n_rejected
+
+def sample_MCMC_chains(loglikelihood, starts, step_sizes, n_samples = 1000, thin = 0, loglike_sign = 1.,
+                       processes = None, n_burn = 0, target_ess = None, check_every = None):
+    """
+    Draw MCMC samples from several independent chains run in parallel
+
+    Runs ``n_chains`` independent Metropolis-Hastings chains (see ``sample_MCMC``) from the
+    given starting points, using a pool of ``processes`` processes. Starting points should be
+    dispersed relative to the posterior distribution so that the convergence diagnostics
+    are meaningful. Once the chains have been run, the first ``n_burn`` steps of each chain
+    are discarded, the split-:math:`\\hat{R}` statistic and bulk effective sample size are
+    computed for each parameter (see ``split_rhat`` and ``bulk_ess``), and each chain is
+    thinned and the thinned chains are merged.
+
+    If ``target_ess`` is given, the chains are advanced in blocks of ``check_every`` steps
+    and sampling stops early once the bulk effective sample size of every parameter exceeds
+    ``target_ess`` and :math:`\\hat{R}` is below 1.05 for every parameter. Otherwise, each
+    chain takes ``n_samples`` steps.
+
+    Thinning may be specified with a non-negative integer, with the same meaning as in
+    ``sample_MCMC``. If ``thin = 0``, the stride is estimated using ``autothin_samples`` for
+    each chain, and the largest stride is applied to all chains.
+
+    The log-likelihood function must be able to be pickled in order to be sent to the worker
+    processes. Bound methods of a ``GaussianProcess`` satisfy this requirement.
+
+    :param loglikelihood: Log-likelihood function to be used in the MCMC step. Must be
+                          callable and must accept a single argument, which is the array
+                          holding the parameters. If this function computes the negative
+                          log-likelihood, pass ``loglike_sign = -1.`` to the function as well.
+    :type loglikelihood: function or other callable
+    :param starts: Starting values of the parameters for each chain. Must be a 2D array with
+                   shape ``(n_chains, n_params)``, with at least two chains.
+    :type starts: ndarray
+    :param step_sizes: Covariance matrix from which steps are drawn. Must be a 2D array
+                       with both dimensions of length ``n_params``, and must be positive
+                       definite.
+    :type step_sizes: ndarray
+    :param n_samples: Maximum number of points in each chain (including the starting point).
+                      Must be a positive integer greater than ``n_burn``. Optional, default
+                      value is 1000.
+    :type n_samples: int
+    :param thin: Integer describing how to thin the MCMC chains. A positive integer
+                 indicates manual thinning by keeping every ``thin`` steps (note
+                 that ``thin = 1`` means the chains will not be thinned). A value
+                 of ``0`` will attempt to autothin the chains.
+    :type thin: int
+    :param loglike_sign: Sign for the log-likelihood function. If the provided
+                         ``loglikelihood`` function computes the negative log-likelihood,
+                         pass ``-1.`` for this parameter. Optional, default value is ``1.``
+    :type loglike_sign: float
+    :param processes: Number of processes to use. Must be a positive integer or ``None`` to
+                      use the number of processors on the computer (default is ``None``)
+    :type processes: int or None
+    :param n_burn: Number of initial points discarded from each chain before computing the
+                   diagnostics and merging the chains. Must be a non-negative integer.
+                   Optional, default is 0.
+    :type n_burn: int
+    :param target_ess: Bulk effective sample size at which sampling is stopped early. Must be
+                       positive or ``None`` to always take ``n_samples`` steps. Optional,
+                       default is ``None``.
+    :type target_ess: float or None
+    :param check_every: Number of steps taken by each chain between convergence checks when
+                        ``target_ess`` is given. Must be a positive integer or ``None`` to
+                        check every ``n_samples//10`` steps (with a minimum of 100).
+    :type check_every: int or None
+    :returns: Merged thinned MCMC chains (2D array), acceptance rate across all chains
+              (float), split-:math:`\\hat{R}` for each parameter (1D array), and bulk
+              effective sample size for each parameter (1D array)
+    :rtype: tuple containing (ndarray, float, ndarray, ndarray)
+    """
+
+    n_samples = int(n_samples)
+    thin = int(thin)
+    n_burn = int(n_burn)
+
+    assert n_samples > 0, "number of samples must be a positive integer"
+    assert thin >= 0, "thin must be a non-negative integer"
+    assert n_burn >= 0 and n_burn < n_samples, "number of burn-in steps must be non-negative and less than n_samples"
+    assert loglike_sign == 1. or loglike_sign == -1., "loglikelihood sign must be +/- 1"
+    if not processes is None:
+        processes = int(processes)
+        assert processes > 0, "number of processes must be positive"
+
+    starts = np.array(starts, dtype = float)
+
+    assert starts.ndim == 2, "starting points must be a 2d array"
+    n_chains, n_params = starts.shape
+    assert n_chains > 1, "must use at least two chains"
+
+    if target_ess is None:
+        check_every = n_samples - 1
+    else:
+        assert target_ess > 0., "target effective sample size must be positive"
+        if check_every is None:
+            check_every = max(n_samples//10, 100)
+        check_every = int(check_every)
+        assert check_every > 0, "check_every must be a positive integer"
+
+    chains = [np.reshape(start, (1, n_params)) for start in starts]
+    n_rejected = 0
+    n_steps = 0
+
+    with Pool(processes) as p:
+        while n_steps < n_samples - 1:
+            block = min(check_every, n_samples - 1 - n_steps)
+            seeds = np.random.randint(2**31 - 1, size = n_chains)
+            results = p.starmap(_run_chain_block,
+                                [(loglikelihood, chain[-1], step_sizes, block, loglike_sign, seed)
+                                 for chain, seed in zip(chains, seeds)])
+            chains = [np.concatenate((chain, result[0])) for chain, result in zip(chains, results)]
+            n_rejected += sum([result[1] for result in results])
+            n_steps += block
+
+            if not target_ess is None and n_steps + 1 - n_burn >= 4:
+                kept = np.array([chain[n_burn:] for chain in chains])
+                if (np.min(bulk_ess(kept)) >= target_ess and
+                    np.max(split_rhat(kept)) <= 1.05):
+                    break
+
+    acceptance = 1. - float(n_rejected)/float(max(n_chains*n_steps, 1))
+
+    kept = np.array([chain[n_burn:] for chain in chains])
+
+    if kept.shape[1] >= 4:
+        rhat = split_rhat(kept)
+        ess = bulk_ess(kept)
+    else:
+        rhat = np.full(n_params, np.nan)
+        ess = np.full(n_params, np.nan)
+
+    if thin == 0:
+        thin_freq = max([autothin_samples(chain) for chain in kept])
+    else:
+        thin_freq = thin
+
+    merged = np.concatenate([chain[::thin_freq] for chain in kept])
+
+    return merged, acceptance, rhat, ess
+
+def _split_chains(chains):
+    """
+    Check the shape of a set of MCMC chains and split each chain in half
+
+    :returns: Array of split chains with shape ``(2*n_chains, n_samples//2, n_params)``
+    :rtype: ndarray
+    """
+
+    chains = np.array(chains, dtype = float)
+    if chains.ndim == 2:
+        chains = np.reshape(chains, chains.shape + (1,))
+
+    assert chains.ndim == 3, "chains must be a 2d or 3d array"
+    assert chains.shape[1] >= 4, "chains must have at least four samples"
+
+    half = chains.shape[1]//2
+
+    return np.concatenate((chains[:, :half], chains[:, -half:]))
+
+def split_rhat(chains):
+    """
+    Compute the split-:math:`\\hat{R}` convergence diagnostic for a set of MCMC chains
+
+    Each chain is split into two halves, and the potential scale reduction factor is computed
+    from the between-chain and within-chain variances of the split chains (Gelman et al.,
+    Bayesian Data Analysis, 3rd edition). Values close to 1 indicate that the chains have
+    mixed; values larger than about 1.05 indicate that the chains have not converged to a
+    common distribution.
+
+    :param chains: MCMC chains. Must be a 3D array with shape ``(n_chains, n_samples, n_params)``
+                   or a 2D array with shape ``(n_chains, n_samples)`` for a single parameter.
+                   Each chain must have at least four samples.
+    :type chains: ndarray
+    :returns: split-:math:`\\hat{R}` for each parameter
+    :rtype: ndarray
+    """
+
+    split = _split_chains(chains)
+    n = split.shape[1]
+
+    between = n*np.var(np.mean(split, axis = 1), axis = 0, ddof = 1)
+    within = np.mean(np.var(split, axis = 1, ddof = 1), axis = 0)
+    var_plus = (n - 1.)/n*within + between/n
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        rhat = np.sqrt(var_plus/within)
+
+    return np.where(within > 0., rhat, np.nan)
+
+def bulk_ess(chains):
+    """
+    Compute the bulk effective sample size for a set of MCMC chains
+
+    Computes the bulk effective sample size of Vehtari et al. (2021). The pooled samples are
+    rank-normalized, each chain is split in half, and the multi-chain autocorrelation is
+    estimated (using FFTs) and summed using Geyer's initial monotone sequence estimator.
+
+    :param chains: MCMC chains. Must be a 3D array with shape ``(n_chains, n_samples, n_params)``
+                   or a 2D array with shape ``(n_chains, n_samples)`` for a single parameter.
+                   Each chain must have at least four samples.
+    :type chains: ndarray
+    :returns: Bulk effective sample size for each parameter
+    :rtype: ndarray
+    """
+
+    split = _split_chains(chains)
+    n_chains, n, n_params = split.shape
+
+    ranks = rankdata(np.reshape(split, (n_chains*n, n_params)), axis = 0)
+    z = np.reshape(norm.ppf((ranks - 0.375)/(n_chains*n + 0.25)), (n_chains, n, n_params))
+
+    acov = _autocovariance(np.transpose(z, (1, 0, 2)))
+    within = np.mean(acov[0], axis = 0)*n/(n - 1.)
+    var_plus = within*(n - 1.)/n + np.var(np.mean(z, axis = 1), axis = 0, ddof = 1)
+
+    ess = np.zeros(n_params)
+
+    for i in range(n_params):
+        if not var_plus[i] > 0.:
+            ess[i] = np.nan
+            continue
+        rho = 1. - (within[i] - np.mean(acov[:, :, i], axis = 1))/var_plus[i]
+        rho[0] = 1.
+        tau = _geyer_autocorr_time(rho)
+        ess[i] = n_chains*n/max(tau, 1./np.log10(n_chains*n))
+
+    return ess
+
+def _autocovariance(signal):
+    """
+    Compute the biased autocovariance of one or more signals along the first axis using FFTs
+
+    :param signal: Array whose first dimension indicates the samples. All other dimensions
+                   are treated as separate signals.
+    :type signal: ndarray
+    :returns: Autocovariance for lags ``0`` to ``n_samples - 1``, with the same shape as
+              ``signal``
+    :rtype: ndarray
+    """
+
+    n = signal.shape[0]
+    n_fft = 2**int(np.ceil(np.log2(2*n - 1))) if n > 1 else 1
+
+    centered = signal - np.mean(signal, axis = 0)
+    transform = np.fft.rfft(centered, n = n_fft, axis = 0)
+
+    return np.fft.irfft(transform*np.conj(transform), n = n_fft, axis = 0)[:n]/float(n)
+
+def _geyer_autocorr_time(rho):
+    """
+    Estimate the integrated autocorrelation time using Geyer's initial monotone sequence
+
+    Sums of adjacent pairs of autocorrelations are truncated at the first negative pair and
+    forced to be monotonically decreasing before summing.
+
+    :param rho: Autocorrelation for lags ``0`` to ``n - 1`` (``rho[0]`` must be 1)
+    :type rho: ndarray
+    :returns: Integrated autocorrelation time
+    :rtype: float
+    """
+
+    n_pairs = len(rho)//2
+    pairs = rho[:2*n_pairs:2] + rho[1:2*n_pairs:2]
+
+    negative = np.where(pairs < 0.)[0]
+    if len(negative) > 0:
+        pairs = pairs[:negative[0]]
+
+    pairs = np.minimum.accumulate(pairs)
+
+    return -1. + 2.*np.sum(pairs)
+
+def _autocorrelation(signal):
+    """
+    Compute the normalized autocorrelation of each column of a 2D array using FFTs
+
+    Columns with zero variance have an autocorrelation of zero at all lags.
+
+    :param signal: 2D array whose first dimension indicates the samples and second dimension
+                   indicates the different parameters
+    :type signal: ndarray
+    :returns: Autocorrelation for lags ``0`` to ``n_samples - 1`` for each parameter, with
+              the same shape as ``signal``
+    :rtype: ndarray
+    """
+
+    acov = _autocovariance(signal)
+    variance = acov[0]
+
+    return np.where(variance > 0., acov/np.where(variance > 0., variance, 1.), 0.)
+
+def _check_chain(signal):
+    """
+    Convert an MCMC chain to a 2D array with shape ``(n_samples, n_params)``
+    """
+
+    signal = np.array(signal, dtype = float)
+    if signal.ndim == 1:
+        signal = np.reshape(signal, (len(signal), 1))
+
+    assert signal.ndim == 2, "MCMC chain must be a 1d or 2d array"
+    assert signal.shape[0] >= 4, "MCMC chain must have at least four samples"
+
+    return signal
+
+def integrated_autocorr_time(signal):
+    """
+    Estimate the integrated autocorrelation time of an MCMC chain
+
+    Computes the autocorrelation of each parameter using FFTs and estimates the integrated
+    autocorrelation time :math:`{\\tau = 1 + 2\\sum_{k=1}^\\infty \\rho_k}` using Geyer's
+    initial monotone sequence estimator. The cost scales as :math:`{N\\log N}` in the length
+    of the chain and is vectorized across parameters. An autocorrelation time of 1 indicates
+    uncorrelated samples, while larger values indicate the number of steps needed to obtain
+    an independent sample.
+
+    :param signal: MCMC chain. Must be a 1D or 2D array. If 2D, the first dimension indicates
+                   the MCMC samples, and the second dimension indicates the different
+                   parameter values. Must contain at least four samples.
+    :type signal: ndarray
+    :returns: Integrated autocorrelation time for each parameter (``NaN`` for parameters
+              that do not vary)
+    :rtype: ndarray
+    """
+
+    signal = _check_chain(signal)
+    n_samples, n_params = signal.shape
+
+    rho = _autocorrelation(signal)
+
+    tau = np.full(n_params, np.nan)
+    for i in range(n_params):
+        if rho[0, i] > 0.:
+            tau[i] = max(_geyer_autocorr_time(rho[:, i]), 1./np.log10(n_samples))
+
+    return tau
+
+def effective_sample_size(signal):
+    """
+    Estimate the effective sample size of an MCMC chain
+
+    The effective sample size is the length of the chain divided by the integrated
+    autocorrelation time (see ``integrated_autocorr_time``), and estimates the number of
+    independent samples that would give the same Monte Carlo error in estimates of the mean
+    of each parameter.
+
+    :param signal: MCMC chain. Must be a 1D or 2D array. If 2D, the first dimension indicates
+                   the MCMC samples, and the second dimension indicates the different
+                   parameter values. Must contain at least four samples.
+    :type signal: ndarray
+    :returns: Effective sample size for each parameter (``NaN`` for parameters that do not
+              vary)
+    :rtype: ndarray
+    """
+
+    signal = _check_chain(signal)
+
+    return float(signal.shape[0])/integrated_autocorr_time(signal)
+
 def autothin_samples(signal):
     """
     Automatically estimate thinning needed to obtain uncorrelated samples
     
     This function attempts to estimate the thinning needed to obtain uncorrelated samples in an
-    MCMC chain. For each separate parameter, the function computes the autocorrelation and
-    estimates the lag needed to obtain uncorrelated samples. This is done by recognizing that
-    the standard deviation of the autocorrelation of a random signal scales inversely with the
-    square root of the number of samples, so when the autocorrelation drops below three times
-    this, we use this as a guess to when the signal is uncorrelated. The maximum lag across all
+    MCMC chain. For each separate parameter, the function computes the autocorrelation (using
+    FFTs, so the cost scales as :math:`{N\\log N}` in the chain length) and estimates the lag
+    needed to obtain uncorrelated samples. This is done by recognizing that the standard
+    deviation of the autocorrelation of a random signal scales inversely with the square root
+    of the number of samples, so when the autocorrelation drops below three times this, we use
+    this as a guess to when the signal is uncorrelated. The maximum lag across all
     parameters is returned. If the chain contains fewer than 10 points, or the autocorrelation
     never drops below the target value, the method gives a warning and
     returns 1.
@@ -240,22 +1039,399 @@ def autothin_samples(signal):
     n_samples, n_params = signal.shape
     
     maxthin = 0
-    
+
     if n_samples >= 10:
-        for i in range(n_params):
-            autocorr = np.correlate(signal[:,i]-np.mean(signal[:,i]), signal[:,i]-np.mean(signal[:,i]), mode="full")
-            start = np.argmax(autocorr)
-            if np.max(autocorr) > 0.:
-                autocorr = autocorr/np.max(autocorr)
-            for j in range(1, len(autocorr) - start):
-                if np.abs(autocorr[start + j]) < 3./np.sqrt(float(n_samples)):
-                    if j > maxthin:
-                        maxthin = j
-                    break
-    
+        rho = _autocorrelation(signal)
+        uncorrelated = np.abs(rho[1:]) < 3./np.sqrt(float(n_samples))
+        found = np.any(uncorrelated, axis = 0)
+        if np.any(found):
+            maxthin = int(np.max(np.argmax(uncorrelated, axis = 0)[found])) + 1
+
     if maxthin == 0:
         warnings.warn("automatic thinning failed, posterior distribution may be multimodal")
         maxthin = 1
         
     return maxthin
-    
\ No newline at end of file
+    
+def _logp_and_grad(loglikelihood, gradient, params, loglike_sign = 1.):
+    """
+    Evaluate the log-likelihood and its gradient for a gradient-based MCMC step
+
+    Evaluates the log-likelihood and gradient at the given parameters, applying
+    ``loglike_sign`` to both. The gradient is evaluated after the log-likelihood so that
+    any factorization cached by the log-likelihood (for instance, the Cholesky factor in
+    a ``GaussianProcess``) can be reused. If either evaluation fails or is not finite,
+    the point is treated as having zero probability by returning ``-inf`` and a zero
+    gradient.
+
+    :returns: log-likelihood (float) and its gradient (1D array)
+    :rtype: tuple containing a float and an ndarray
+    """
+
+    params = np.array(params)
+
+    try:
+        logp = loglike_sign*loglikelihood(params)
+        grad = loglike_sign*np.array(gradient(params), dtype = float)
+    except (FloatingPointError, AssertionError, LinAlgError):
+        return -np.inf, np.zeros(len(params))
+
+    if not (np.isfinite(logp) and np.all(np.isfinite(grad))):
+        return -np.inf, np.zeros(len(params))
+
+    return float(logp), grad
+
+def _leapfrog(loglikelihood, gradient, params, momentum, grad, step_size, inv_mass, loglike_sign):
+    """
+    Take a single leapfrog step for Hamiltonian dynamics
+
+    :returns: new parameters, new momentum, gradient at the new parameters, and
+              log-likelihood at the new parameters
+    :rtype: tuple containing (ndarray, ndarray, ndarray, float)
+    """
+
+    momentum = momentum + 0.5*step_size*grad
+    params = params + step_size*np.dot(inv_mass, momentum)
+    logp, grad = _logp_and_grad(loglikelihood, gradient, params, loglike_sign)
+    momentum = momentum + 0.5*step_size*grad
+
+    return params, momentum, grad, logp
+
+def _build_tree(loglikelihood, gradient, params, momentum, grad, log_slice, direction, depth,
+                step_size, joint0, inv_mass, loglike_sign, random_state):
+    """
+    Recursively build a balanced binary tree of leapfrog steps for the No-U-Turn Sampler
+
+    Implements the ``BuildTree`` recursion of the efficient No-U-Turn Sampler (Hoffman and
+    Gelman, 2014) including the statistics needed for dual averaging step size adaptation.
+    The U-turn criterion uses the velocity (inverse mass matrix times the momentum), so
+    that it remains valid for a non-identity mass matrix. The proposal within the tree is
+    chosen using ``random_state``.
+
+    :returns: Tuple holding the leftmost parameters, momentum and gradient, the rightmost
+              parameters, momentum and gradient, the proposed parameters, the gradient and
+              log-likelihood at the proposal, the number of valid points, a flag indicating if
+              the tree should continue to be extended, the sum of the acceptance probabilities,
+              and the number of leapfrog steps taken
+    :rtype: tuple
+    """
+
+    max_energy_error = 1000.
+
+    if depth == 0:
+        params_new, momentum_new, grad_new, logp_new = _leapfrog(loglikelihood, gradient, params, momentum,
+                                                                 grad, direction*step_size, inv_mass,
+                                                                 loglike_sign)
+        joint = logp_new - 0.5*np.dot(momentum_new, np.dot(inv_mass, momentum_new))
+        if not np.isfinite(joint):
+            joint = -np.inf
+        n_valid = int(log_slice <= joint)
+        keep_going = (log_slice < joint + max_energy_error)
+        alpha = min(1., np.exp(joint - joint0)) if np.isfinite(joint) else 0.
+        return (params_new, momentum_new, grad_new, params_new, momentum_new, grad_new,
+                params_new, grad_new, logp_new, n_valid, keep_going, alpha, 1)
+
+    (params_minus, momentum_minus, grad_minus, params_plus, momentum_plus, grad_plus,
+     params_prop, grad_prop, logp_prop, n_valid, keep_going, alpha, n_alpha) = _build_tree(loglikelihood,
+                gradient, params, momentum, grad, log_slice, direction, depth - 1, step_size, joint0,
+                inv_mass, loglike_sign, random_state)
+
+    if keep_going:
+        if direction == -1:
+            (params_minus, momentum_minus, grad_minus, _, _, _, params_prop2, grad_prop2, logp_prop2,
+             n_valid2, keep_going2, alpha2, n_alpha2) = _build_tree(loglikelihood, gradient, params_minus,
+                momentum_minus, grad_minus, log_slice, direction, depth - 1, step_size, joint0, inv_mass,
+                loglike_sign, random_state)
+        else:
+            (_, _, _, params_plus, momentum_plus, grad_plus, params_prop2, grad_prop2, logp_prop2,
+             n_valid2, keep_going2, alpha2, n_alpha2) = _build_tree(loglikelihood, gradient, params_plus,
+                momentum_plus, grad_plus, log_slice, direction, depth - 1, step_size, joint0, inv_mass,
+                loglike_sign, random_state)
+
+        if n_valid + n_valid2 > 0 and random_state.random_sample() < float(n_valid2)/float(n_valid + n_valid2):
+            params_prop = params_prop2
+            grad_prop = grad_prop2
+            logp_prop = logp_prop2
+
+        alpha += alpha2
+        n_alpha += n_alpha2
+        n_valid += n_valid2
+        keep_going = keep_going2 and _no_u_turn(params_minus, params_plus, momentum_minus,
+                                                momentum_plus, inv_mass)
+
+    return (params_minus, momentum_minus, grad_minus, params_plus, momentum_plus, grad_plus,
+            params_prop, grad_prop, logp_prop, n_valid, keep_going, alpha, n_alpha)
+
+def _no_u_turn(params_minus, params_plus, momentum_minus, momentum_plus, inv_mass):
+    """
+    Check that a NUTS trajectory has not started to double back on itself
+
+    :returns: ``True`` if the trajectory can continue to be extended
+    :rtype: bool
+    """
+
+    delta = params_plus - params_minus
+
+    return (np.dot(delta, np.dot(inv_mass, momentum_minus)) >= 0. and
+            np.dot(delta, np.dot(inv_mass, momentum_plus)) >= 0.)
+
+def _initial_step_size(loglikelihood, gradient, params, logp, grad, inv_mass, mass_chol, loglike_sign,
+                       random_state):
+    """
+    Heuristic for choosing a reasonable initial HMC step size
+
+    Starting from a step size of 1, the step size is repeatedly halved or doubled until the
+    acceptance probability of a single leapfrog step crosses 0.5 (Hoffman and Gelman, 2014,
+    Algorithm 4). The momentum is drawn using ``random_state``.
+
+    :returns: Initial step size
+    :rtype: float
+    """
+
+    step_size = 1.
+    momentum = np.dot(mass_chol, random_state.normal(size = len(params)))
+    joint0 = logp - 0.5*np.dot(momentum, np.dot(inv_mass, momentum))
+
+    def log_accept(step_size):
+        _, momentum_new, _, logp_new = _leapfrog(loglikelihood, gradient, params, momentum, grad,
+                                                 step_size, inv_mass, loglike_sign)
+        joint = logp_new - 0.5*np.dot(momentum_new, np.dot(inv_mass, momentum_new))
+        return joint - joint0 if np.isfinite(joint) else -np.inf
+
+    direction = 1. if log_accept(step_size) > np.log(0.5) else -1.
+
+    for i in range(100):
+        if not direction*log_accept(step_size) > direction*np.log(0.5):
+            break
+        step_size = step_size*2.**direction
+
+    return step_size
+
+def sample_HMC(loglikelihood, gradient, start, n_samples = 1000, thin = 0, loglike_sign = 1.,
+               inv_mass = None, step_size = None, n_adapt = 100, target_accept = 0.8, max_depth = 10,
+               random_state = None):
+    """
+    Draw MCMC samples using Hamiltonian Monte Carlo with the No-U-Turn Sampler
+
+    Compute an MCMC chain for a given log-likelihood function with weak priors using
+    Hamiltonian Monte Carlo (HMC). Rather than taking random-walk steps, HMC simulates
+    Hamiltonian dynamics using the gradient of the log-likelihood, which allows the sampler to
+    make large moves that are still accepted with high probability. The length of each
+    trajectory is chosen adaptively using the No-U-Turn Sampler (NUTS) of Hoffman and Gelman
+    (2014): the trajectory is doubled in length until it starts to turn back on itself, so no
+    path length needs to be tuned. This typically gives many more effective samples per
+    log-likelihood evaluation than a random-walk Metropolis-Hastings sampler, particularly
+    when there are many parameters.
+
+    The log-likelihood function and its gradient must be callables that accept a single
+    argument, a 1D array holding the current parameter values. The gradient is always evaluated
+    immediately after the log-likelihood at the same point, so a gradient function that reuses
+    information cached by the log-likelihood (such as ``GaussianProcess.partial_devs``)
+    is efficient. If either function raises a ``FloatingPointError``, ``AssertionError``,
+    or ``LinAlgError``, the point is treated as having zero probability.
+
+    The inverse mass matrix should approximate the covariance of the posterior distribution
+    (for instance, the inverse of the Hessian at the MLE solution), and is used to precondition
+    the dynamics. It must be a 2D positive definite array with both dimensions the same length
+    as ``start``. If it is not provided, the identity matrix is used.
+
+    The step size is tuned during a warm-up phase of ``n_adapt`` iterations using the dual
+    averaging scheme of Hoffman and Gelman (2014) to obtain an average acceptance statistic of
+    ``target_accept``. If ``step_size`` is not given, a heuristic is used to choose the initial
+    value. Warm-up iterations are discarded, so ``n_adapt = 0`` with a given ``step_size``
+    runs the sampler with a fixed step size.
+
+    Thinning is handled in the same way as in ``sample_MCMC``: a positive integer keeps every
+    ``thin`` steps, while ``thin = 0`` (the default) estimates the thinning needed from the
+    autocorrelation of the chain.
+
+    An optional parameter ``loglike_sign`` can be passed that must be a float with the
+    value +/- 1. This is multiplied by the log-likelihood and its gradient and thus allows
+    methods that compute the negative log-likelihood to be used in this routine.
+
+    All random numbers (the momenta, slice variables, trajectory directions, and proposals)
+    are drawn from ``random_state``. As in ``MCMC_step``, the global ``numpy.random``
+    generator is used if it is not given, so passing a ``numpy.random.RandomState`` gives a
+    reproducible chain without changing the state of the global generator.
+
+    Returns the final thinned MCMC chain (a 2D array, where the first dimension indicates
+    the different samples and the second dimension indicates the different parameters),
+    the average acceptance statistic over the sampling iterations (useful for diagnosing
+    problems with convergence, and should be close to ``target_accept``), and the first lag
+    autocorrelation of the thinned MCMC chain.
+
+    :param loglikelihood: Log-likelihood function to be sampled. Must be callable and must
+                          accept a single argument, which is the array holding the parameters.
+                          If this function computes the negative log-likelihood, pass
+                          ``loglike_sign = -1.`` to the function as well.
+    :type loglikelihood: function or other callable
+    :param gradient: Gradient of the log-likelihood function. Must be callable, accept a single
+                     argument (the array holding the parameters), and return a 1D array with
+                     the same length as the parameters.
+    :type gradient: function or other callable
+    :param start: Starting value of the parameters. Must be a 1D array.
+    :type start: ndarray
+    :param n_samples: Number of steps to be taken after the warm-up phase. Must be a positive
+                      integer. Optional, default value is 1000.
+    :type n_samples: int
+    :param thin: Integer describing how to thin the MCMC chain. A positive integer
+                 indicates manual thinning by keeping every ``thin`` steps (note
+                 that ``thin = 1`` means the chain will not be thinned). A value
+                 of ``0`` will attempt to autothin the chain.
+    :type thin: int
+    :param loglike_sign: Sign for the log-likelihood function. If the provided
+                         ``loglikelihood`` function computes the negative log-likelihood,
+                         pass ``-1.`` for this parameter. Optional, default value is ``1.``
+    :type loglike_sign: float
+    :param inv_mass: Inverse mass matrix used to precondition the dynamics. Must be a positive
+                     definite 2D array with both dimensions the same length as ``start`` or
+                     ``None`` to use the identity. Optional, default is ``None``.
+    :type inv_mass: ndarray or None
+    :param step_size: Leapfrog step size (or its initial value if ``n_adapt > 0``). Must be
+                      positive or ``None`` to choose it heuristically. Optional, default is
+                      ``None``.
+    :type step_size: float or None
+    :param n_adapt: Number of warm-up iterations used to tune the step size. These are
+                    discarded. Must be a non-negative integer. Optional, default is 100.
+    :type n_adapt: int
+    :param target_accept: Target average acceptance statistic for step size adaptation.
+                          Must be between 0 and 1. Optional, default is 0.8.
+    :type target_accept: float
+    :param max_depth: Maximum depth of the NUTS trajectory tree, so that at most
+                      ``2**max_depth - 1`` leapfrog steps are taken per sample. Must be a
+                      positive integer. Optional, default is 10.
+    :type max_depth: int
+    :param random_state: Random number generator used to draw the chain. Optional, default is
+                         ``None`` (use the global ``numpy.random`` generator).
+    :type random_state: numpy.random.RandomState or None
+    :returns: MCMC chain (2D array), average acceptance statistic (float), and first lag
+              autocorrelation of the thinned MCMC chain (1D array)
+    :rtype: tuple containing (ndarray, float, ndarray)
+    """
+
+    assert callable(loglikelihood), "loglikelihood must be a callable function"
+    assert callable(gradient), "gradient must be a callable function"
+    assert loglike_sign == 1. or loglike_sign == -1., "loglikelihood sign must be +/- 1"
+
+    n_samples = int(n_samples)
+    thin = int(thin)
+    n_adapt = int(n_adapt)
+    max_depth = int(max_depth)
+
+    assert n_samples > 0, "number of samples must be a positive integer"
+    assert thin >= 0, "thin must be a non-negative integer"
+    assert n_adapt >= 0, "number of adaptation steps must be a non-negative integer"
+    assert target_accept > 0. and target_accept < 1., "target acceptance must be between 0 and 1"
+    assert max_depth > 0, "maximum tree depth must be a positive integer"
+
+    if random_state is None:
+        random_state = np.random
+
+    start = np.array(start, dtype = float)
+
+    assert start.ndim == 1, "starting point must be a 1d array"
+    n_params = len(start)
+
+    if inv_mass is None:
+        inv_mass = np.eye(n_params)
+    inv_mass = np.array(inv_mass, dtype = float)
+
+    assert inv_mass.shape == (n_params, n_params), "inverse mass matrix must be a square array matching the parameters"
+
+    try:
+        mass_chol = np.linalg.cholesky(np.linalg.inv(inv_mass))
+    except LinAlgError:
+        raise LinAlgError("inverse mass matrix must be positive definite")
+
+    params = np.copy(start)
+    logp, grad = _logp_and_grad(loglikelihood, gradient, params, loglike_sign)
+
+    assert np.isfinite(logp), "log-likelihood must be finite at the starting point"
+
+    if step_size is None:
+        step_size = _initial_step_size(loglikelihood, gradient, params, logp, grad, inv_mass,
+                                       mass_chol, loglike_sign, random_state)
+    step_size = float(step_size)
+    assert step_size > 0., "step size must be positive"
+
+    # dual averaging parameters (Hoffman and Gelman, 2014)
+
+    mu = np.log(10.*step_size)
+    gamma = 0.05
+    t0 = 10.
+    kappa = 0.75
+    h_bar = 0.
+    log_step_bar = 0.
+
+    samples = np.zeros((n_samples, n_params))
+    accept_stats = np.zeros(n_samples)
+
+    for i in range(n_adapt + n_samples - 1):
+        momentum = np.dot(mass_chol, random_state.normal(size = n_params))
+        joint0 = logp - 0.5*np.dot(momentum, np.dot(inv_mass, momentum))
+        log_slice = joint0 + np.log(random_state.random_sample())
+
+        params_minus, momentum_minus, grad_minus = params, momentum, grad
+        params_plus, momentum_plus, grad_plus = params, momentum, grad
+        n_valid = 1
+        keep_going = True
+        depth = 0
+        alpha = 0.
+        n_alpha = 1
+
+        while keep_going and depth < max_depth:
+            direction = 1 if random_state.random_sample() < 0.5 else -1
+            if direction == -1:
+                (params_minus, momentum_minus, grad_minus, _, _, _, params_prop, grad_prop, logp_prop,
+                 n_valid2, keep_going2, alpha, n_alpha) = _build_tree(loglikelihood, gradient, params_minus,
+                    momentum_minus, grad_minus, log_slice, direction, depth, step_size, joint0, inv_mass,
+                    loglike_sign, random_state)
+            else:
+                (_, _, _, params_plus, momentum_plus, grad_plus, params_prop, grad_prop, logp_prop,
+                 n_valid2, keep_going2, alpha, n_alpha) = _build_tree(loglikelihood, gradient, params_plus,
+                    momentum_plus, grad_plus, log_slice, direction, depth, step_size, joint0, inv_mass,
+                    loglike_sign, random_state)
+
+            if keep_going2 and random_state.random_sample() < float(n_valid2)/float(n_valid):
+                params, grad, logp = params_prop, grad_prop, logp_prop
+
+            n_valid += n_valid2
+            keep_going = keep_going2 and _no_u_turn(params_minus, params_plus, momentum_minus,
+                                                    momentum_plus, inv_mass)
+            depth += 1
+
+        accept_stat = alpha/float(n_alpha)
+
+        if i < n_adapt:
+            m = float(i + 1)
+            h_bar = (1. - 1./(m + t0))*h_bar + (target_accept - accept_stat)/(m + t0)
+            log_step = mu - np.sqrt(m)/gamma*h_bar
+            log_step_bar = m**(-kappa)*log_step + (1. - m**(-kappa))*log_step_bar
+            if i == n_adapt - 1:
+                step_size = np.exp(log_step_bar)
+                samples[0] = params
+            else:
+                step_size = np.exp(log_step)
+        else:
+            j = i - n_adapt + 1
+            samples[j] = params
+            accept_stats[j] = accept_stat
+
+    if n_adapt == 0:
+        samples[0] = start
+
+    if n_samples > 1:
+        acceptance = float(np.mean(accept_stats[1:]))
+    else:
+        acceptance = 1.
+
+    if thin == 0:
+        thin_freq = autothin_samples(samples)
+    else:
+        thin_freq = thin
+
+    thinned = samples[::thin_freq]
+
+    first_lag = _first_lag_autocorrelation(thinned)
+
+    return thinned, acceptance, first_lag
@@ -1,7 +1,645 @@
-from multiprocessing import Pool
+import hashlib
+from multiprocessing import Pool, shared_memory
+from concurrent.futures import as_completed
 import numpy as np
+from scipy import linalg
 from .GaussianProcess import GaussianProcess
-from functools import partial
+from .utils import write_record, open_record_file
+
+_worker_state = {}
+
+def _emulator_from_arrays(inputs, targets, nugget = None):
+    """
+    Create a ``GaussianProcess`` that uses the given input and target arrays without copying
+
+    ``GaussianProcess`` makes its own copy of the inputs and targets. When many emulators are
+    fit to the same inputs, this helper instead creates the emulator from a single training
+    example and then attaches the full arrays, so that all emulators can share a single
+    inputs array (which may be held in shared memory).
+
+    :returns: New ``GaussianProcess`` instance referring to ``inputs`` and ``targets``
+    :rtype: GaussianProcess
+    """
+
+    gp = GaussianProcess(inputs[:1], targets[:1], nugget)
+    gp.inputs = inputs
+    gp.targets = targets
+    gp.n = inputs.shape[0]
+
+    return gp
+
+class _SharedThetaGP(GaussianProcess):
+    """
+    Gaussian process fit jointly to several targets that share the same hyperparameters
+
+    The targets are stored as an ``(n, m)`` array, where ``m`` is the number of targets in
+    the group. Because the covariance matrix only depends on the inputs and hyperparameters,
+    a single Cholesky factorization serves all targets, and the solves for all targets are
+    done with a single multi-RHS ``cho_solve`` call. The negative log-likelihood and its
+    derivatives are summed over the targets, so fitting this emulator finds the
+    hyperparameters that are optimal for the group as a whole. Only the methods needed for
+    fitting are implemented for multiple targets.
+    """
+    def __init__(self, inputs, targets, nugget = None):
+        """
+        Create a new emulator for a group of targets
+
+        :param inputs: Inputs with shape ``(n, D)``
+        :type inputs: ndarray
+        :param targets: Targets with shape ``(m, n)``
+        :type targets: ndarray
+        :param nugget: Nugget shared by all targets in the group
+        :type nugget: float or None
+        :returns: New ``_SharedThetaGP`` instance
+        :rtype: _SharedThetaGP
+        """
+
+        GaussianProcess.__init__(self, inputs[:1], targets[0, :1], nugget)
+        self.inputs = inputs
+        self.targets = np.transpose(targets)
+        self.n = inputs.shape[0]
+
+    def loglikelihood(self, theta):
+        """
+        Calculate the negative log-likelihood summed over all targets in the group
+
+        :param theta: Value of the hyperparameters. Must be array-like with shape ``(D + 1,)``
+        :type theta: ndarray
+        :returns: negative log-likelihood
+        :rtype: float
+        """
+
+        self._set_params(theta)
+
+        m = self.targets.shape[1]
+
+        return (0.5 * m * self.logdetQ +
+                0.5 * np.sum(self.targets * self.invQt) +
+                0.5 * m * self.n * np.log(2. * np.pi))
+
+    def partial_devs(self, theta):
+        """
+        Calculate the partial derivatives of the negative log-likelihood summed over all targets
+
+        :param theta: Value of the hyperparameters. Must be array-like with shape ``(D + 1,)``
+        :type theta: ndarray
+        :returns: partial derivatives of the negative log-likelihood (array with shape
+                  ``(D + 1,)``)
+        :rtype: ndarray
+        """
+
+        assert theta.shape == (self.D + 1,), "Parameter vector must have length number of inputs + 1"
+
+        if not np.allclose(np.array(theta), self.theta):
+            self._set_params(theta)
+
+        m = self.targets.shape[1]
+        partials = np.zeros(self.D + 1)
+
+        dKdtheta = self.kernel.kernel_deriv(self.inputs, self.inputs, self.theta)
+
+        for d in range(self.D + 1):
+            invQ_dot_dKdtheta_trace = np.trace(linalg.cho_solve((self.L, True), dKdtheta[d]))
+            partials[d] = -0.5 * (np.sum(self.invQt * np.dot(dKdtheta[d], self.invQt)) -
+                                  m * invQ_dot_dKdtheta_trace)
+
+        return partials
+
+def _batch_cholesky(Q, allow_jitter, maxtries = 5):
+    """
+    Cholesky decomposition of a stack of matrices, with jitter for members that fail
+
+    All matrices are first decomposed with a single batched call. If this fails, members
+    are decomposed individually, and members for which ``allow_jitter`` is ``True`` that
+    are not positive definite have noise added to the diagonal in the same way as
+    ``GaussianProcess._jit_cholesky`` (but without logging a warning).
+
+    :param Q: Stack of matrices with shape ``(B, n, n)``
+    :type Q: ndarray
+    :param allow_jitter: Boolean array of length ``B`` indicating which members may have
+                         jitter added to the diagonal
+    :type allow_jitter: ndarray
+    :param maxtries: Maximum number of attempts to stabilize each decomposition
+    :type maxtries: int
+    :returns: Stack of lower triangular factors with shape ``(B, n, n)`` (the identity for
+              members that could not be decomposed) and a boolean array indicating which
+              members could not be decomposed
+    :rtype: tuple containing 2 ndarrays
+    """
+
+    B, n, _ = Q.shape
+    failed = np.zeros(B, dtype = bool)
+
+    try:
+        return np.linalg.cholesky(Q), failed
+    except np.linalg.LinAlgError:
+        pass
+
+    L = np.zeros_like(Q)
+
+    for b in range(B):
+        try:
+            L[b] = np.linalg.cholesky(Q[b])
+            continue
+        except np.linalg.LinAlgError:
+            pass
+        diagQ = np.diag(Q[b])
+        jitter = diagQ.mean()*1.e-6
+        num_tries = 0
+        while allow_jitter[b] and num_tries < maxtries and np.all(diagQ > 0.) and np.isfinite(jitter):
+            try:
+                L[b] = np.linalg.cholesky(Q[b] + jitter*np.eye(n))
+                break
+            except np.linalg.LinAlgError:
+                jitter *= 10.
+                num_tries += 1
+        else:
+            L[b] = np.eye(n)
+            failed[b] = True
+
+    return L, failed
+
+def _batch_loglikelihood(theta, sqdist, targets, nugget, allow_jitter, do_grad = True):
+    """
+    Negative log-likelihood and its gradient for a batch of squared exponential emulators
+
+    Evaluates the same quantities as ``GaussianProcess.loglikelihood`` and
+    ``GaussianProcess.partial_devs`` for ``B`` emulators that share the same inputs, using
+    stacked ``(B, n, n)`` covariance matrices and a single batched Cholesky decomposition.
+    The inverse covariance matrix applied to the targets is found with triangular solves,
+    and the inverse covariance matrix itself (which is only needed for the gradient) is
+    computed from the Cholesky factor with LAPACK ``potri``, so no explicit inverse is formed
+    unless ``do_grad`` is ``True``. Members whose covariance matrix cannot be factorized (or
+    that give non-finite values) have a negative log-likelihood of ``inf`` and a gradient of
+    zero.
+
+    :param theta: Hyperparameters with shape ``(B, D + 1)``
+    :type theta: ndarray
+    :param sqdist: Squared differences between all pairs of inputs along each input dimension,
+                   with shape ``(D, n, n)``
+    :type sqdist: ndarray
+    :param targets: Targets with shape ``(B, n)``
+    :type targets: ndarray
+    :param nugget: Nugget for each emulator (zero for adaptive noise), with shape ``(B,)``
+    :type nugget: ndarray
+    :param allow_jitter: Boolean array of length ``B`` indicating which emulators may have
+                         noise added to stabilize the decomposition
+    :type allow_jitter: ndarray
+    :param do_grad: Flag indicating if the gradient is computed. If ``False``, ``None`` is
+                    returned in place of the gradient. Default is ``True``.
+    :type do_grad: bool
+    :returns: Negative log-likelihood ``(B,)``, gradient ``(B, D + 1)``, Cholesky factors
+              ``(B, n, n)``, inverse covariance applied to the targets ``(B, n)``, and log
+              determinants ``(B,)``
+    :rtype: tuple of 5 ndarrays
+    """
+
+    D, n, _ = sqdist.shape
+
+    with np.errstate(over = 'ignore', under = 'ignore', invalid = 'ignore', divide = 'ignore'):
+        exp_theta = np.exp(theta)
+        K = exp_theta[:, D, None, None]*np.exp(-0.5*np.einsum('bd,dij->bij', exp_theta[:, :D], sqdist))
+        Q = K + nugget[:, None, None]*np.eye(n)
+
+        finite = np.all(np.isfinite(Q), axis = (1, 2))
+        Q[~finite] = np.eye(n)
+
+        L, failed = _batch_cholesky(Q, allow_jitter)
+        failed = failed | ~finite
+
+        invQt = np.array([linalg.cho_solve((Lb, True), target, check_finite = False)
+                          for Lb, target in zip(L, targets)])
+        logdetQ = 2.*np.sum(np.log(np.diagonal(L, axis1 = 1, axis2 = 2)), axis = 1)
+
+        loglike = (0.5*logdetQ + 0.5*np.sum(targets*invQt, axis = 1) + 0.5*n*np.log(2.*np.pi))
+
+        if do_grad:
+            invQ = np.empty_like(L)
+            for b in range(len(L)):
+                invQ_lower = linalg.lapack.dpotri(L[b], lower = 1)[0]
+                invQ[b] = np.tril(invQ_lower) + np.transpose(np.tril(invQ_lower, -1))
+
+            WK = (invQt[:, :, None]*invQt[:, None, :] - invQ)*K
+            partials = np.zeros(theta.shape)
+            partials[:, :D] = 0.25*exp_theta[:, :D]*np.einsum('bij,dij->bd', WK, sqdist)
+            partials[:, D] = -0.5*np.sum(WK, axis = (1, 2))
+            failed = failed | ~np.all(np.isfinite(partials), axis = 1)
+        else:
+            partials = None
+
+    failed = failed | ~np.isfinite(loglike)
+    loglike[failed] = np.inf
+    if do_grad:
+        partials[failed] = 0.
+
+    return loglike, partials, L, invQt, logdetQ
+
+def _batch_minimize(fun, x0, maxiter = 1000, gtol = 1.e-5, ftol = 2.2e-9, memory = 10):
+    """
+    Minimize many independent functions at once using a vectorized L-BFGS method
+
+    Each row of ``x0`` is the starting point for a separate minimization problem. The
+    L-BFGS updates, two-loop recursion, and backtracking line search are carried out for all
+    problems at once using array operations, with separate step lengths and curvature
+    histories for each problem. Problems drop out of the batch as they converge, so the
+    objective is only evaluated for the problems that are still active. The line search only
+    evaluates the function at trial points, and the gradient is only computed once at the
+    accepted point of each problem.
+
+    :param fun: Function called as ``fun(x, active, do_grad)``, where ``x`` holds the current
+                points of the problems whose indices are in the integer array ``active``. Must
+                return the function values (shape ``(len(active),)``) and, if ``do_grad`` is
+                ``True``, the gradients (same shape as ``x``, otherwise the second return
+                value is ignored). Points where the function cannot be evaluated should return
+                ``inf``.
+    :type fun: function
+    :param x0: Starting points, with shape ``(B, P)``
+    :type x0: ndarray
+    :param maxiter: Maximum number of iterations
+    :type maxiter: int
+    :param gtol: A problem has converged when the largest gradient component is below ``gtol``
+    :type gtol: float
+    :param ftol: A problem has converged when the relative change in the function is below
+                 ``ftol``
+    :type ftol: float
+    :param memory: Number of previous steps used to approximate the inverse Hessian
+    :type memory: int
+    :returns: Final points ``(B, P)`` and function values ``(B,)``
+    :rtype: tuple containing 2 ndarrays
+    """
+
+    x = np.array(x0, dtype = float)
+    B, P = x.shape
+
+    f, g = fun(x, np.arange(B), True)
+    S = np.zeros((B, memory, P))
+    Y = np.zeros((B, memory, P))
+    rho = np.zeros((B, memory))
+
+    active = np.where(np.isfinite(f))[0]
+
+    for iteration in range(maxiter):
+        if len(active) == 0:
+            break
+
+        # two-loop recursion for the search direction of each active problem
+
+        q = np.copy(g[active])
+        alpha = np.zeros((len(active), memory))
+        for i in range(memory - 1, -1, -1):
+            alpha[:, i] = rho[active, i]*np.sum(S[active, i]*q, axis = 1)
+            q -= alpha[:, i, None]*Y[active, i]
+        sy = np.sum(S[active, -1]*Y[active, -1], axis = 1)
+        yy = np.sum(Y[active, -1]**2, axis = 1)
+        gamma = np.where(rho[active, -1] > 0., sy/np.where(yy > 0., yy, 1.),
+                         1./np.maximum(np.sum(np.abs(g[active]), axis = 1), 1.))
+        r = gamma[:, None]*q
+        for i in range(memory):
+            beta = rho[active, i]*np.sum(Y[active, i]*r, axis = 1)
+            r += S[active, i]*(alpha[:, i] - beta)[:, None]
+        direction = -r
+
+        slope = np.sum(direction*g[active], axis = 1)
+        reset = ~(slope < 0.)
+        direction[reset] = -g[active][reset]/np.maximum(np.sum(np.abs(g[active][reset]), axis = 1), 1.)[:, None]
+        slope[reset] = np.sum(direction[reset]*g[active][reset], axis = 1)
+        rho[active[reset]] = 0.
+
+        # backtracking line search, only evaluating problems that have not found a step
+
+        step = np.ones(len(active))
+        x_new = np.copy(x[active])
+        f_new = np.full(len(active), np.inf)
+        g_new = np.zeros((len(active), P))
+        searching = np.arange(len(active))
+
+        for n_backtrack in range(40):
+            trial = x[active[searching]] + step[searching, None]*direction[searching]
+            f_trial = fun(trial, active[searching], False)[0]
+            accept = f_trial <= f[active[searching]] + 1.e-4*step[searching]*slope[searching]
+            x_new[searching[accept]] = trial[accept]
+            f_new[searching[accept]] = f_trial[accept]
+            searching = searching[~accept]
+            if len(searching) == 0:
+                break
+            step[searching] *= 0.5
+
+        found = np.isfinite(f_new)
+
+        if np.any(found):
+            g_new[found] = fun(x_new[found], active[found], True)[1]
+
+        # update curvature histories for problems with a valid step
+
+        s_step = x_new[found] - x[active[found]]
+        y_step = g_new[found] - g[active[found]]
+        curvature = np.sum(s_step*y_step, axis = 1)
+        update = active[found][curvature > 1.e-10]
+        S[update] = np.concatenate((S[update, 1:], s_step[curvature > 1.e-10, None]), axis = 1)
+        Y[update] = np.concatenate((Y[update, 1:], y_step[curvature > 1.e-10, None]), axis = 1)
+        rho[update] = np.concatenate((rho[update, 1:], 1./curvature[curvature > 1.e-10, None]), axis = 1)
+
+        f_old = f[active[found]]
+        x[active[found]] = x_new[found]
+        f[active[found]] = f_new[found]
+        g[active[found]] = g_new[found]
+
+        converged = np.zeros(len(active), dtype = bool)
+        converged[~found] = True
+        converged[found] = ((np.max(np.abs(g_new[found]), axis = 1) < gtol) |
+                            (f_old - f_new[found] <= ftol*np.maximum(np.maximum(np.abs(f_old),
+                                                                                 np.abs(f_new[found])), 1.)))
+        active = active[~converged]
+
+    return x, f
+
+def _attach_shared(name, shape):
+    """
+    Attach to an existing shared memory block and view it as an array of floats
+
+    :returns: Shared memory block and an array of the given shape using its buffer
+    :rtype: tuple containing a SharedMemory and an ndarray
+    """
+
+    shm = shared_memory.SharedMemory(name = name)
+
+    return shm, np.ndarray(shape, dtype = float, buffer = shm.buf)
+
+def _init_worker(inputs_name, inputs_shape, targets_name, targets_shape, nugget):
+    """
+    Initialize a persistent worker process
+
+    Used as the initializer of the pool created by ``MultiOutputGP.start_pool``. The worker
+    attaches to the shared memory blocks holding the inputs and stacked targets and creates
+    emulators that use these arrays directly, so the training data is not copied into the
+    worker. The emulators are stored in a module-level variable, so that subsequent tasks
+    only need to specify the index of the emulator to use.
+
+    :returns: None
+    """
+
+    inputs_shm, inputs = _attach_shared(inputs_name, inputs_shape)
+    targets_shm, targets = _attach_shared(targets_name, targets_shape)
+
+    _worker_state["shared"] = [inputs_shm, targets_shm]
+    _worker_state["inputs"] = inputs
+    _worker_state["targets"] = targets
+    _worker_state["emulators"] = [_emulator_from_arrays(inputs, target, nuggetval)
+                                  for target, nuggetval in zip(targets, nugget)]
+    _worker_state["predict"] = None
+
+def _sync_emulator(gp, theta, nugget):
+    """
+    Update a resident emulator to match the parameters and nugget in the parent process
+
+    Parameters are only reset (requiring a new factorization of the covariance matrix) if
+    they differ from the ones already held by the emulator.
+
+    :returns: None
+    """
+
+    if gp.get_nugget() != nugget:
+        gp.set_nugget(nugget)
+        gp.theta = None
+    if not theta is None and (gp.theta is None or not np.array_equal(gp.theta, theta)):
+        gp._set_params(theta)
+
+def _fit_emulator(gp, n_tries, theta0, method, kwargs):
+    """
+    Fit the hyperparameters of an emulator in a worker process
+
+    Returns the factorization computed at the optimal hyperparameters along with the
+    fitting results, so that the parent process does not need to factorize the covariance
+    matrix again (see ``GaussianProcess._get_factorization``).
+
+    :returns: Minimum negative log-likelihood and a tuple holding the hyperparameters,
+              Cholesky factor, inverse covariance matrix applied to the targets, and log
+              determinant of the covariance matrix
+    :rtype: tuple containing a float and a tuple
+    """
+
+    loglike, theta = gp.learn_hyperparameters(n_tries, theta0, method, **kwargs)
+
+    return loglike, gp._get_factorization()
+
+def _fit_task(task):
+    """
+    Fit the hyperparameters of a single emulator or a group of emulators as a pool task
+
+    The task is a tuple ``(indices, gp, n_tries, theta0, method, kwargs, nugget)``, where
+    ``indices`` lists the emulators fit by the task. If ``gp`` is ``None``, the emulators
+    resident in a persistent worker process are used: a single emulator is fit directly
+    (after setting its nugget to ``nugget``, which is the current nugget in the parent
+    process, see ``_sync_emulator``), while a group is fit using a ``_SharedThetaGP`` built
+    from the shared training data with nugget ``nugget``. If ``gp`` is given, ``nugget`` is
+    ignored. The indices are returned with the results, so that tasks can be completed in
+    any order.
+
+    :returns: Indices of the emulators, minimum negative log-likelihood, and factorization
+              (see ``_fit_emulator``)
+    :rtype: tuple containing a list, a float, and a tuple
+    """
+
+    indices, gp, n_tries, theta0, method, kwargs, nugget = task
+
+    if gp is None:
+        if len(indices) == 1:
+            gp = _worker_state["emulators"][indices[0]]
+            _sync_emulator(gp, None, nugget)
+        else:
+            gp = _SharedThetaGP(_worker_state["inputs"], _worker_state["targets"][indices], nugget)
+
+    loglike, factorization = _fit_emulator(gp, n_tries, theta0, method, kwargs)
+
+    return indices, loglike, factorization
+
+def _prediction_arrays(buf, n_outputs, n_predict, D, do_deriv = True, do_unc = True):
+    """
+    Split a flat buffer into arrays for the prediction points and prediction outputs
+
+    Space is only reserved for the uncertainties and derivatives if they are requested.
+
+    :returns: Prediction points ``(n_predict, D)``, predictions and uncertainties
+              ``(n_outputs, n_predict)``, and derivatives ``(n_outputs, n_predict, D)``
+              (uncertainties and derivatives are ``None`` if not requested)
+    :rtype: tuple of 4 ndarrays
+    """
+
+    shapes = [(n_predict, D), (n_outputs, n_predict)]
+    if do_unc:
+        shapes.append((n_outputs, n_predict))
+    if do_deriv:
+        shapes.append((n_outputs, n_predict, D))
+
+    offsets = np.cumsum([0] + [int(np.prod(shape)) for shape in shapes])
+
+    arrays = [np.reshape(buf[start:stop], shape)
+              for start, stop, shape in zip(offsets[:-1], offsets[1:], shapes)]
+
+    if not do_unc:
+        arrays.insert(2, None)
+    if not do_deriv:
+        arrays.append(None)
+
+    return tuple(arrays)
+
+def _prediction_size(n_outputs, n_predict, D, do_deriv = True, do_unc = True):
+    """
+    Number of floats needed to hold the prediction points and outputs (see ``_prediction_arrays``)
+
+    :returns: Size of the buffer
+    :rtype: int
+    """
+
+    return n_predict*D + n_outputs*n_predict*(1 + int(do_unc) + D*int(do_deriv))
+
+def _predict_worker(index, slot, theta, nugget, buffer_name, n_outputs, n_predict, do_deriv, do_unc):
+    """
+    Make predictions with an emulator resident in a persistent worker process
+
+    The prediction points are read from, and the results for emulator ``index`` written to
+    position ``slot`` of, the shared memory block ``buffer_name`` (see ``_prediction_arrays``
+    for the layout). The worker keeps the block attached until a task refers to a different
+    block.
+
+    :returns: None
+    """
+
+    gp = _worker_state["emulators"][index]
+    _sync_emulator(gp, theta, nugget)
+
+    layout = (buffer_name, n_outputs, n_predict, do_deriv, do_unc)
+
+    if _worker_state["predict"] is None or _worker_state["predict"][0] != layout:
+        if not _worker_state["predict"] is None:
+            _worker_state["predict"][1].close()
+        _worker_state["predict"] = None
+        shm, buf = _attach_shared(buffer_name, (_prediction_size(n_outputs, n_predict, gp.D,
+                                                                 do_deriv, do_unc),))
+        _worker_state["predict"] = (layout, shm, _prediction_arrays(buf, n_outputs, n_predict, gp.D,
+                                                                    do_deriv, do_unc))
+
+    testing, mean, unc, deriv = _worker_state["predict"][2]
+
+    mean_val, unc_val, deriv_val = GaussianProcess.predict(gp, testing, do_deriv, do_unc)
+
+    mean[slot] = mean_val
+    if do_unc:
+        unc[slot] = unc_val
+    if do_deriv:
+        deriv[slot] = deriv_val
+
+class MultiOutputPrediction(object):
+    """
+    Predictions for a set of outputs of a ``MultiOutputGP`` that are computed on demand
+
+    Returned by ``MultiOutputGP.predict`` when ``lazy = True``. Indexing the object with
+    a position ``i`` (an integer between 0 and ``len(prediction) - 1``) returns the tuple
+    ``(mean, unc, deriv)`` for output ``outputs[i]``, in the same form as returned by
+    ``GaussianProcess.predict``. The prediction for an output is only made the first time
+    it is accessed and is then cached, so that only the outputs that are actually needed
+    are computed. Predictions are made in the current process using the hyperparameters
+    held by the emulators at the time of access.
+
+    The ``outputs`` attribute holds the indices of the emulators covered by the object, and
+    the full arrays (in the same form as the non-lazy predictions) can be assembled with
+    ``to_arrays``.
+    """
+
+    def __init__(self, emulators, outputs, testing, do_deriv = True, do_unc = True):
+        """
+        Create a new lazy prediction object
+
+        :param emulators: List of all emulators in the ``MultiOutputGP``
+        :type emulators: list
+        :param outputs: Indices of the emulators covered by the predictions
+        :type outputs: list
+        :param testing: Points where predictions will be made, shape ``(n_predict, D)``
+        :type testing: ndarray
+        :param do_deriv: Flag indicating if the derivatives are to be computed
+        :type do_deriv: bool
+        :param do_unc: Flag indicating if the uncertainties are to be computed
+        :type do_unc: bool
+        :returns: New ``MultiOutputPrediction`` instance
+        :rtype: MultiOutputPrediction
+        """
+
+        self.emulators = emulators
+        self.outputs = list(outputs)
+        self.testing = testing
+        self.do_deriv = do_deriv
+        self.do_unc = do_unc
+        self._cache = {}
+
+    def __len__(self):
+        """
+        Returns the number of outputs covered by the predictions
+
+        :returns: Number of outputs
+        :rtype: int
+        """
+
+        return len(self.outputs)
+
+    def __getitem__(self, i):
+        """
+        Returns the prediction for a single output, computing it if necessary
+
+        :param i: Position of the output in ``outputs``
+        :type i: int
+        :returns: Tuple holding the predictions, uncertainties, and derivatives for the output
+                  (see ``GaussianProcess.predict``)
+        :rtype: tuple
+        """
+
+        i = int(i)
+        assert i >= -len(self) and i < len(self), "index out of range"
+        i = i % len(self)
+
+        if not i in self._cache:
+            self._cache[i] = self.emulators[self.outputs[i]].predict(self.testing, self.do_deriv,
+                                                                     self.do_unc)
+
+        return self._cache[i]
+
+    def __iter__(self):
+        """
+        Iterate over the predictions for all outputs
+
+        :returns: Iterator over the tuples returned by ``__getitem__``
+        :rtype: iterator
+        """
+
+        for i in range(len(self)):
+            yield self[i]
+
+    def to_arrays(self):
+        """
+        Compute the predictions for all outputs and stack them into arrays
+
+        :returns: Tuple of numpy arrays holding the predictions, uncertainties, and derivatives
+                  in the same form as returned by ``MultiOutputGP.predict``
+        :rtype: tuple
+        """
+
+        return _stack_predictions(list(self), self.do_deriv, self.do_unc)
+
+def _stack_predictions(predict_vals, do_deriv, do_unc):
+    """
+    Stack the predictions from individual emulators into arrays
+
+    :returns: Tuple of numpy arrays holding the predictions, uncertainties, and derivatives,
+              with ``None`` in place of the arrays that were not requested
+    :rtype: tuple
+    """
+
+    predict_unpacked, unc_unpacked, deriv_unpacked = zip(*predict_vals)
+
+    predict_unpacked = np.array(predict_unpacked)
+    unc_unpacked = np.array(unc_unpacked) if do_unc else None
+    deriv_unpacked = np.array(deriv_unpacked) if do_deriv else None
+
+    return predict_unpacked, unc_unpacked, deriv_unpacked
 
 class MultiOutputGP(object):
     """
@@ -19,6 +657,18 @@ class MultiOutputGP(object):
     input parameters ``D``. These other variables are made available externally through
     the ``get_n_emulators``, ``get_n``, and ``get_D`` methods.
     
+    The worker processes hold their own emulators built on the training data in shared
+    memory, so fitting only requires sending the fitting options and predicting only
+    requires sending the current hyperparameters (so that the emulators in the workers are
+    kept up to date), with the prediction points and results exchanged through shared
+    memory. By default, each call to ``learn_hyperparameters`` or ``predict`` starts a
+    temporary pool in this way (copying the training data into shared memory once) and
+    shuts it down when the call returns. If many calls are to be made (for instance, when
+    making predictions repeatedly in an online setting), a persistent pool can instead be
+    started with ``start_pool`` so that the processes and shared memory are reused. The
+    pool is shut down with ``close_pool``, or automatically if the object is used as a
+    context manager.
+    
     Example: ::
     
         >>> import numpy as np
@@ -136,7 +786,10 @@ class MultiOutputGP(object):
         if not (inputs.shape[0] == targets.shape[1]):
             raise ValueError("the first dimension of inputs must be the same length as the second dimension of targets (or first if targets is 1D))")
 
-        self.emulators = [ GaussianProcess(inputs, single_target) for single_target in targets]
+        inputs = np.array(inputs, dtype = float)
+        targets = np.array(targets, dtype = float)
+
+        self.emulators = [ _emulator_from_arrays(inputs, single_target) for single_target in targets]
         
         self.n_emulators = targets.shape[0]
         self.n = inputs.shape[0]
@@ -150,6 +803,85 @@ class MultiOutputGP(object):
         
         if not (emulator_file is None or theta is None):
             self._set_params(theta)
+
+        self._pool = None
+        self._shared = []
+
+    def __getstate__(self):
+        """
+        Returns the state of the object for pickling, excluding any persistent worker pool
+        """
+
+        state = self.__dict__.copy()
+        state["_pool"] = None
+        state["_shared"] = []
+        return state
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close_pool()
+
+    def start_pool(self, processes = None):
+        """
+        Start a persistent pool of worker processes
+
+        Creates a pool of worker processes that is reused by subsequent calls to
+        ``learn_hyperparameters`` and ``predict`` until ``close_pool`` is called. The common
+        inputs and the stacked targets are copied into ``multiprocessing.shared_memory`` blocks
+        when the pool is started, and each worker creates its own emulators that use these
+        blocks directly, so the training data is neither pickled nor copied for each worker
+        or emulator. When making predictions, the prediction points are written to a shared
+        memory block and the workers write the predictions, uncertainties, and derivatives
+        into shared output arrays, so only the emulator index and current hyperparameters
+        are sent for each task. Any existing pool is closed first. Note that the pool must be
+        restarted if the training data is modified.
+
+        :param processes: (optional) Number of processes in the pool. Must be a positive
+                          integer or ``None`` to use the number of processors on the computer
+                          (default is ``None``)
+        :type processes: int or None
+        :returns: This ``MultiOutputGP`` instance, so that it can be used as a context manager
+        :rtype: MultiOutputGP
+        """
+
+        if not processes is None:
+            processes = int(processes)
+            assert processes > 0, "number of processes must be positive"
+
+        self.close_pool()
+
+        inputs = self.emulators[0].inputs
+        targets = np.array([emulator.targets for emulator in self.emulators], dtype = float)
+
+        for array in (inputs, targets):
+            shm = shared_memory.SharedMemory(create = True, size = max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype = float, buffer = shm.buf)[:] = array
+            self._shared.append(shm)
+
+        self._pool = Pool(processes, initializer = _init_worker,
+                          initargs = (self._shared[0].name, inputs.shape, self._shared[1].name,
+                                      targets.shape, self.get_nugget()))
+
+        return self
+
+    def close_pool(self):
+        """
+        Shut down the persistent pool of worker processes, if one is running
+
+        :returns: None
+        """
+
+        if not self._pool is None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+        for shm in self._shared:
+            shm.close()
+            shm.unlink()
+        self._shared = []
         
     def _load_emulators(self, filename):
         """
@@ -297,7 +1029,9 @@ class MultiOutputGP(object):
         for emulator, theta_val in zip(self.emulators, theta):
             emulator._set_params(theta_val)
         
-    def learn_hyperparameters(self, n_tries = 15, theta0 = None, processes = None, method = 'L-BFGS-B', **kwargs):
+    def learn_hyperparameters(self, n_tries = 15, theta0 = None, processes = None, method = 'L-BFGS-B',
+                              callback = None, groups = None, executor = None, checkpoint = None,
+                              checkpoint_factors = False, **kwargs):
         """
         Fit hyperparameters for each model
         
@@ -308,6 +1042,52 @@ class MultiOutputGP(object):
         processes to use when fitting the models. Since each model can be fit independently
         of the others, parallelization can significantly improve the speed at which
         the models are fit.
+
+        Unless an ``executor`` is given, the fitting is done by a pool of worker processes that
+        read the training data from shared memory, so the emulators are not pickled for each
+        task (see ``start_pool``; if no persistent pool has been started, a temporary one is
+        started for this call). Emulators are sent to the worker processes one at a time and
+        are collected in the order that they finish (see ``iter_learn_hyperparameters``), so emulators that take
+        much longer to fit than others do not leave processes idle. If a ``callback``
+        function is given, it is called in this process as soon as each emulator has been
+        fit, with the index of the emulator, the minimum negative log-likelihood, and the
+        hyperparameters as arguments. The emulator has already been updated with the new
+        hyperparameters when the callback is made, so it can be used to make predictions.
+
+        If the targets have been standardized, it is often reasonable for groups of emulators
+        to share the same hyperparameters. Groups can be specified with ``groups``, a list of
+        lists of emulator indices. All emulators in a group are fit together, using a single
+        Cholesky factorization of the common covariance matrix per likelihood evaluation and
+        maximizing the likelihood summed over the targets in the group. The emulators in a
+        group share the same Cholesky factor after fitting. All emulators in a group must have
+        the same nugget, and emulators that do not appear in any group are fit individually.
+        The negative log-likelihood reported for each emulator in a group is its individual
+        value at the shared hyperparameters.
+
+        Instead of a pool of processes on this machine, the fitting can be carried out by any
+        ``concurrent.futures.Executor`` (or other object with a ``submit`` method returning
+        ``concurrent.futures.Future`` objects) passed as ``executor``. Each emulator (or group)
+        is submitted as a separate task, so an executor whose workers run on other machines,
+        such as ``SocketExecutor``, spreads the fitting across those machines.
+
+        Long fits can be made resumable by giving a ``checkpoint`` filename. The results for
+        each emulator are appended to the file (and forced to disk) as soon as the emulator
+        has been fit, optionally including the factorization of the covariance matrix if
+        ``checkpoint_factors`` is ``True`` (which avoids factorizing the matrix again when
+        resuming, at the cost of a larger file). If the file already holds results, for
+        instance because a previous run was interrupted, those emulators are restored from
+        the file rather than being fit again (and are reported to ``callback`` first), and
+        only the remaining emulators are fit. Each result records the group of emulators
+        that was fit together, and results are only restored if they were found by fitting
+        the same group as in ``groups``. If the file holds results for only some members of a
+        group, the remaining members are set using the hyperparameters recorded for the
+        group rather than fitting the group again, so each emulator is recorded once. A
+        group for which the file holds results from a different grouping is fit again, and
+        the new results replace the earlier ones when resuming. The file records a
+        fingerprint of the training data, and resuming from a checkpoint written for
+        different data raises a ``ValueError``.
+        Any incomplete record at the end of the file (from a run killed while writing) is
+        discarded.
         
         Returns a list holding ``n_emulators`` tuples, each of which contains the minimum
         negative log-likelihood and a numpy array holding the optimal parameters found for
@@ -329,11 +1109,31 @@ class MultiOutputGP(object):
         :type theta0: ndarray or None
         :param processes: (optional) Number of processes to use when fitting the model.
                           Must be a positive integer or ``None`` to use the number of
-                          processors on the computer (default is ``None``)
+                          processors on the computer (default is ``None``). Ignored if
+                          a persistent pool has been started with ``start_pool``.
         :type processes: int or None
         :param method: Minimization method to be used. Can be any gradient-based optimization
                        method available in ``scipy.optimize.minimize``. (Default is ``'L-BFGS-B'``)
         :type method: str
+        :param callback: (optional) Function called as ``callback(index, loglike, theta)`` each
+                         time an emulator has been fit. Default is ``None``.
+        :type callback: function or other callable or None
+        :param groups: (optional) List of lists of indices of emulators that share the same
+                       hyperparameters, or ``None`` to fit all emulators individually. Each
+                       emulator can appear in at most one group. Default is ``None``.
+        :type groups: list or None
+        :param executor: (optional) Executor used to fit the emulators instead of a pool of
+                         processes. If given, ``processes`` and any persistent pool are
+                         ignored. Default is ``None``.
+        :type executor: concurrent.futures.Executor or None
+        :param checkpoint: (optional) Name of a file in which the results are recorded as each
+                           emulator is fit, and from which the results of a previous run are
+                           restored. Default is ``None`` (no checkpointing).
+        :type checkpoint: str or None
+        :param checkpoint_factors: (optional) Flag indicating if the factorization of the
+                                   covariance matrix of each emulator is included in the
+                                   checkpoint file. Default is ``False``.
+        :type checkpoint_factors: bool
         :param ``**kwargs``: Additional keyword arguments to be passed to the minimization routine.
                          see available parameters in ``scipy.optimize.minimize`` for details.
         :returns: List holding ``n_emulators`` tuples of length 2. Each tuple contains
@@ -342,6 +1142,45 @@ class MultiOutputGP(object):
         :rtype: list
         
         """
+
+        assert callback is None or callable(callback), "callback must be callable"
+
+        likelihood_theta_vals = [None]*self.n_emulators
+
+        for index, loglike, theta in self.iter_learn_hyperparameters(n_tries, theta0, processes,
+                                                                     method, groups, executor,
+                                                                     checkpoint, checkpoint_factors,
+                                                                     **kwargs):
+            likelihood_theta_vals[index] = (loglike, theta)
+            if not callback is None:
+                callback(index, loglike, theta)
+
+        return likelihood_theta_vals
+
+    def iter_learn_hyperparameters(self, n_tries = 15, theta0 = None, processes = None,
+                                   method = 'L-BFGS-B', groups = None, executor = None,
+                                   checkpoint = None, checkpoint_factors = False, **kwargs):
+        """
+        Fit hyperparameters for each model, yielding results as each emulator is fit
+
+        Generator version of ``learn_hyperparameters`` (see that method for a description of
+        the arguments). Emulators are distributed to the worker processes one at a time using
+        ``imap_unordered``, so that a process that finishes an emulator immediately starts on
+        the next one. As each emulator finishes, its hyperparameters and factorization are
+        set in this process and the generator yields a tuple holding the index of the
+        emulator, the minimum negative log-likelihood, and the hyperparameters. The results
+        are yielded in the order in which the emulators finish, which need not be the order
+        of the emulators, so fitted emulators can be used while others are still being fit.
+
+        If the generator is not run to completion, the remaining emulators are not fit (if a
+        temporary pool was created, it is terminated when the generator is closed, while if
+        an ``executor`` is used, tasks that have not started are cancelled). If a
+        ``checkpoint`` file is used, the emulators restored from the file are yielded first.
+
+        :returns: Generator yielding a tuple of the emulator index (int), minimum negative
+                  log-likelihood (float), and hyperparameters (ndarray) for each emulator
+        :rtype: generator
+        """
         
         assert int(n_tries) > 0, "n_tries must be a positive integer"
         if not theta0 is None:
@@ -352,23 +1191,320 @@ class MultiOutputGP(object):
             assert processes > 0, "number of processes must be positive"
         
         n_tries = int(n_tries)
-        
-        with Pool(processes) as p:
-            likelihood_theta_vals = p.starmap(partial(GaussianProcess.learn_hyperparameters, **kwargs),
-                                          [(gp, n_tries, theta0, method) for gp in self.emulators])
-        
-        # re-evaluate log likelihood for each emulator to update current parameter values
-        # (needed because of how multiprocessing works -- the bulk of the work is done in
-        # parallel, but this step ensures that the results are gathered correctly for each
-        # emulator)
-        
-        loglike_unpacked, theta_unpacked = [np.array(t) for t in zip(*likelihood_theta_vals)]
-        
-        self._set_params(theta_unpacked)
+
+        groups = self._check_groups(groups)
+        assert executor is None or hasattr(executor, "submit"), "executor must have a submit method"
+
+        if checkpoint is None:
+            for result in self._fit_groups(groups, n_tries, theta0, processes, method, executor, kwargs):
+                yield result
+            return
+
+        records, f = open_record_file(checkpoint)
+
+        try:
+            fingerprint = self._checkpoint_fingerprint()
+            if len(records) == 0:
+                write_record(f, fingerprint)
+            elif records[0] != fingerprint:
+                raise ValueError("checkpoint file was written for different training data")
+
+            restored = {}
+            for index, loglike, theta, factorization, group in records[1:]:
+                restored[index] = (loglike, theta, factorization, group)
+
+            # results are only reused if they come from a fit of the same group
+
+            group_of = {}
+            fit_groups = []
+            completed = []
+            for indices in groups:
+                group = tuple(sorted(indices))
+                group_of.update((index, group) for index in indices)
+                recorded = [index for index in indices if index in restored]
+                if (len(recorded) == 0 or
+                    not all([restored[index][3] == group for index in recorded])):
+                    fit_groups.append(indices)
+                    for index in recorded:
+                        del restored[index]
+                elif len(recorded) < len(indices):
+                    completed.append(([index for index in indices if not index in restored],
+                                      restored[recorded[0]][1]))
+
+            for index, (loglike, theta, factorization, group) in restored.items():
+                emulator = self.emulators[index]
+                if factorization is None:
+                    emulator._set_params(theta)
+                else:
+                    emulator._set_factorization(theta, *factorization)
+                emulator.mle_theta = np.copy(emulator.theta)
+                yield index, loglike, emulator.theta
+
+            def record_fit(index, loglike, theta):
+                if checkpoint_factors:
+                    emulator = self.emulators[index]
+                    factorization = (emulator.L, emulator.invQt, emulator.logdetQ)
+                else:
+                    factorization = None
+                write_record(f, (index, loglike, theta, factorization, group_of[index]))
+
+            for missing, theta in completed:
+                for index in missing:
+                    emulator = self.emulators[index]
+                    loglike = emulator.loglikelihood(theta)
+                    emulator.mle_theta = np.copy(emulator.theta)
+                    record_fit(index, loglike, emulator.theta)
+                    yield index, loglike, emulator.theta
+
+            for index, loglike, theta in self._fit_groups(fit_groups, n_tries, theta0, processes,
+                                                          method, executor, kwargs):
+                record_fit(index, loglike, theta)
+                yield index, loglike, theta
+        finally:
+            f.close()
+
+    def _checkpoint_fingerprint(self):
+        """
+        Summary of the training data used to check that a checkpoint file matches the emulators
+
+        :returns: Tuple holding the number of emulators, training examples, and inputs, the
+                  nugget values, and a hash of the inputs and targets
+        :rtype: tuple
+        """
+
+        digest = hashlib.sha256(np.ascontiguousarray(self.emulators[0].inputs).tobytes())
+        for emulator in self.emulators:
+            digest.update(np.ascontiguousarray(emulator.targets).tobytes())
+
+        return ("MultiOutputGP checkpoint", self.n_emulators, self.n, self.D,
+                tuple(self.get_nugget()), digest.hexdigest())
+
+    def _fit_groups(self, groups, n_tries, theta0, processes, method, executor, kwargs):
+        """
+        Fit groups of emulators using an executor, a temporary pool, or the persistent pool
+
+        :returns: Generator yielding the emulator index, minimum negative log-likelihood, and
+                  hyperparameters for each emulator (see ``_collect_fits``)
+        :rtype: generator
+        """
+
+        if len(groups) == 0:
+            return
+        elif not executor is None:
+            futures = [executor.submit(_fit_task, (indices, self._group_emulator(indices), n_tries,
+                                                   theta0, method, kwargs, None))
+                       for indices in groups]
+            try:
+                for result in self._collect_fits(future.result() for future in as_completed(futures)):
+                    yield result
+            finally:
+                for future in futures:
+                    future.cancel()
+        elif self._pool is None:
+            self.start_pool(processes)
+            try:
+                for result in self._fit_groups(groups, n_tries, theta0, processes, method, None, kwargs):
+                    yield result
+            finally:
+                self._pool.terminate()
+                self.close_pool()
+        else:
+            tasks = [(indices, None, n_tries, theta0, method, kwargs,
+                      self.emulators[indices[0]].get_nugget()) for indices in groups]
+            for result in self._collect_fits(self._pool.imap_unordered(_fit_task, tasks)):
+                yield result
+
+    def _check_groups(self, groups):
+        """
+        Check groups of emulators that share hyperparameters and add single emulator groups
+
+        :param groups: List of lists of emulator indices, or ``None``
+        :type groups: list or None
+        :returns: List of lists of emulator indices, where each emulator appears exactly once
+        :rtype: list
+        """
+
+        if groups is None:
+            groups = []
+
+        groups = [[int(index) for index in group] for group in groups]
+        grouped = [index for group in groups for index in group]
+
+        assert all([len(group) > 0 for group in groups]), "groups must not be empty"
+        assert len(grouped) == len(set(grouped)), "each emulator can only appear in one group"
+        assert all([index >= 0 and index < self.n_emulators for index in grouped]), "bad emulator index in groups"
+
+        for group in groups:
+            nuggets = [self.emulators[index].get_nugget() for index in group]
+            assert all([nugget == nuggets[0] for nugget in nuggets]), "emulators in a group must have the same nugget"
+
+        return groups + [[index] for index in range(self.n_emulators) if not index in set(grouped)]
+
+    def _group_emulator(self, indices):
+        """
+        Returns the emulator used to fit a group of emulators
+
+        :param indices: Indices of the emulators in the group
+        :type indices: list
+        :returns: The emulator itself for a single emulator, or a ``_SharedThetaGP`` for a group
+        :rtype: GaussianProcess
+        """
+
+        if len(indices) == 1:
+            return self.emulators[indices[0]]
+
+        return _SharedThetaGP(self.emulators[indices[0]].inputs,
+                              np.array([self.emulators[index].targets for index in indices]),
+                              self.emulators[indices[0]].get_nugget())
+
+    def _collect_fits(self, fit_vals):
+        """
+        Update emulators with fitting results as they arrive from the worker processes
+
+        The workers return the factorization at the optimal parameters along with the
+        parameters themselves, so the state of each emulator can be updated without
+        factorizing the covariance matrix again in this process.
+
+        :param fit_vals: Iterable of results from ``_fit_task``
+        :type fit_vals: iterable
+        :returns: Generator yielding the emulator index, minimum negative log-likelihood, and
+                  hyperparameters for each result
+        :rtype: generator
+        """
+
+        for indices, loglike, (theta, L, invQt, logdetQ) in fit_vals:
+            if len(indices) == 1:
+                invQt = np.reshape(invQt, (self.n, 1))
+            for j, index in enumerate(indices):
+                emulator = self.emulators[index]
+                emulator._set_factorization(theta, L, invQt[:, j], logdetQ)
+                emulator.mle_theta = np.copy(emulator.theta)
+                if len(indices) > 1:
+                    loglike = (0.5 * logdetQ + 0.5 * np.dot(emulator.targets, emulator.invQt) +
+                               0.5 * self.n * np.log(2. * np.pi))
+                yield index, loglike, emulator.theta
+        
+    def learn_hyperparameters_batch(self, n_tries = 15, theta0 = None, batch_size = 100,
+                                    maxiter = 1000, gtol = 1.e-5):
+        """
+        Fit hyperparameters for all models in this process using batched linear algebra
+
+        For moderate numbers of training examples and many emulators, the overhead of
+        distributing emulators to separate processes can exceed the cost of fitting them.
+        This method instead fits the emulators in batches of ``batch_size`` in the current
+        process. The covariance matrices for all emulators in a batch are stacked into a
+        single ``(batch_size, n, n)`` array and factorized with a batched Cholesky
+        decomposition. The negative log-likelihood is found with triangular solves, and the
+        inverse covariance matrix needed for the gradient is only computed at the points
+        accepted by the line search. The minimization is done with a vectorized L-BFGS method
+        that keeps a separate search direction, step length, and curvature history for each
+        emulator, and emulators are removed from the batch as they converge.
+
+        As a rough guide, fitting squared exponential emulators with 3 inputs, ``n_tries = 2``,
+        and a single process, this method took 2.0 s for 200 emulators with ``n = 20`` (6.8 s
+        when fitting each emulator with ``GaussianProcess.learn_hyperparameters``), 3.5 s for
+        100 emulators with ``n = 50`` (5.8 s), 5.2 s for 50 emulators with ``n = 100`` (7.6 s),
+        and 11.5 s for 10 emulators with ``n = 400`` (38.6 s). The advantage is largest when
+        there are many emulators with few training examples each, as the per-emulator Python
+        overhead of the serial fit dominates; for large ``n`` the cost of both methods is
+        dominated by the same ``O(n**3)`` factorizations, and the gain comes mainly from
+        needing fewer of them. If several processes are available, fitting with
+        ``learn_hyperparameters`` and a process pool may be faster for large ``n``.
+
+        As with ``learn_hyperparameters``, ``n_tries`` minimization attempts are made from
+        different starting points (the first using ``theta0``, if given), and the best result
+        for each emulator is kept. During the minimization, noise is added to the diagonal of
+        any covariance matrix that cannot be factorized so that one emulator does not stop
+        the minimization for the whole batch; the final values are evaluated with the nugget
+        of each emulator. Any emulator for which no attempt gives a valid result is fit on
+        its own using ``GaussianProcess.learn_hyperparameters`` with the default options. After fitting, the factors
+        computed in the batch are used to set the state of each emulator, so no additional
+        factorizations are needed.
+
+        :param n_tries: (optional) The number of different initial conditions to try when
+                        optimizing over the hyperparameters (must be a positive integer,
+                        default = 15)
+        :type n_tries: int
+        :param theta0: (optional) Initial value of the hyperparameters to use in the optimization
+                   routine (must be array-like with a length of ``D + 1``, where ``D`` is
+                   the number of input parameters to each model). Default is ``None``.
+        :type theta0: ndarray or None
+        :param batch_size: (optional) Number of emulators fit together. Must be a positive
+                           integer (default is 100). Memory use scales as
+                           ``batch_size*n**2``.
+        :type batch_size: int
+        :param maxiter: (optional) Maximum number of iterations for each minimization attempt.
+                        Must be a positive integer (default is 1000).
+        :type maxiter: int
+        :param gtol: (optional) Minimization stops for an emulator when the largest component
+                     of the gradient of its negative log-likelihood is below ``gtol``
+                     (default is ``1.e-5``)
+        :type gtol: float
+        :returns: List holding ``n_emulators`` tuples of length 2. Each tuple contains
+                  the minimum negative log-likelihood for that particular emulator and a
+                  numpy array of length ``D + 1`` holding the corresponding hyperparameters
+        :rtype: list
+        """
+
+        assert int(n_tries) > 0, "n_tries must be a positive integer"
+        assert int(batch_size) > 0, "batch_size must be a positive integer"
+        assert int(maxiter) > 0, "maxiter must be a positive integer"
+        if not theta0 is None:
+            theta0 = np.array(theta0)
+            assert len(theta0) == self.D + 1, "theta0 must have length of number of input parameters D + 1"
+
+        n_tries = int(n_tries)
+        batch_size = int(batch_size)
+
+        inputs = self.emulators[0].inputs
+        sqdist = np.transpose((inputs[:, None, :] - inputs[None, :, :])**2, (2, 0, 1))
+
+        nugget = np.array([0. if nuggetval is None else nuggetval for nuggetval in self.get_nugget()])
+        adaptive = np.array([nuggetval is None for nuggetval in self.get_nugget()])
+
+        likelihood_theta_vals = []
+
+        for start in range(0, self.n_emulators, batch_size):
+            batch = np.arange(start, min(start + batch_size, self.n_emulators))
+            B = len(batch)
+            targets = np.array([self.emulators[index].targets for index in batch])
+
+            best_loglike = np.full(B, np.inf)
+            best_theta = np.zeros((B, self.D + 1))
+
+            theta_startvals = 5.*(np.random.rand(n_tries, B, self.D + 1) - 0.5)
+            if not theta0 is None:
+                theta_startvals[0] = theta0
+
+            def objective(theta, active, do_grad):
+                return _batch_loglikelihood(theta, sqdist, targets[active], nugget[batch][active],
+                                            np.ones(len(active), dtype = bool), do_grad)[:2]
+
+            for theta_start in theta_startvals:
+                theta = _batch_minimize(objective, theta_start, int(maxiter), gtol)[0]
+                loglike = _batch_loglikelihood(theta, sqdist, targets, nugget[batch], adaptive[batch],
+                                               do_grad = False)[0]
+                better = loglike < best_loglike
+                best_loglike[better] = loglike[better]
+                best_theta[better] = theta[better]
+
+            loglike, _, L, invQt, logdetQ = _batch_loglikelihood(best_theta, sqdist, targets,
+                                                                  nugget[batch], adaptive[batch],
+                                                                  do_grad = False)
+
+            for b, index in enumerate(batch):
+                emulator = self.emulators[index]
+                if np.isfinite(loglike[b]):
+                    emulator._set_factorization(best_theta[b], L[b], invQt[b], logdetQ[b])
+                    emulator.mle_theta = np.copy(best_theta[b])
+                    likelihood_theta_vals.append((loglike[b], emulator.theta))
+                else:
+                    likelihood_theta_vals.append(emulator.learn_hyperparameters(n_tries, theta0))
 
         return likelihood_theta_vals
-        
-    def predict(self, testing, do_deriv = True, do_unc = True, processes = None):
+
+    def predict(self, testing, do_deriv = True, do_unc = True, processes = None, outputs = None,
+                lazy = False, executor = None):
         """
         Make a prediction for a set of input vectors
         
@@ -386,10 +1522,26 @@ class MultiOutputGP(object):
         computed, they are returned as the second output from the method as an
         ``(n_emulators, n_predict)`` shaped numpy array. If the derivatives are computed,
         they are returned as the third output from the method as an
-        ``(n_emulators, n_predict, D)`` shaped numpy array.
+        ``(n_emulators, n_predict, D)`` shaped numpy array. Uncertainties and derivatives
+        that are not requested are neither computed by the emulators nor sent back from
+        the worker processes.
         
         As with the fitting, this computation can be done independently for each emulator
-        and thus can be done in parallel.
+        and thus can be done in parallel. The worker processes read the training data from
+        shared memory and exchange the prediction points and results through shared memory
+        (see ``start_pool``), using a temporary pool if no persistent pool has been started.
+        
+        If only some of the outputs are needed, their indices can be given with ``outputs``,
+        in which case only those emulators make predictions and the first dimension of the
+        returned arrays runs over the requested outputs (in the order given). If
+        ``lazy = True``, no predictions are made immediately. Instead, the method returns a
+        ``MultiOutputPrediction`` object that makes the prediction for an output in the
+        current process when it is first accessed (see ``MultiOutputPrediction``), which is
+        useful when only a few of the outputs will actually be examined.
+
+        The predictions can also be made by any ``concurrent.futures.Executor`` passed as
+        ``executor`` (see ``learn_hyperparameters``), in which case each emulator is
+        submitted as a separate task.
         
         :param testing: Array-like object holding the points where predictions will be made.
                         Must have shape ``(n_predict, D)`` or ``(D,)`` (for a single prediction)
@@ -404,14 +1556,30 @@ class MultiOutputGP(object):
         :type do_unc: bool
         :param processes: (optional) Number of processes to use when making the predictions.
                           Must be a positive integer or ``None`` to use the number of
-                          processors on the computer (default is ``None``)
+                          processors on the computer (default is ``None``). Ignored if
+                          a persistent pool has been started with ``start_pool`` or if
+                          ``lazy`` is ``True``.
         :type processes: int or None
+        :param outputs: (optional) Indices of the emulators for which predictions are made.
+                        Must be an iterable of integers between 0 and ``n_emulators - 1``, or
+                        ``None`` to predict all outputs (default).
+        :type outputs: list or None
+        :param lazy: (optional) Flag indicating if a ``MultiOutputPrediction`` object that
+                     computes the predictions on demand is returned instead of arrays.
+                     Default value is ``False``.
+        :type lazy: bool
+        :param executor: (optional) Executor used to make the predictions instead of a pool of
+                         processes. If given, ``processes`` and any persistent pool are
+                         ignored. Default is ``None``.
+        :type executor: concurrent.futures.Executor or None
         :returns: Tuple of numpy arrays holding the predictions, uncertainties, and derivatives,
-                  respectively. Predictions and uncertainties have shape ``(n_emulators, n_predict)``
-                  while the derivatives have shape ``(n_emulators, n_predict, D)``. If
+                  respectively. Predictions and uncertainties have shape ``(n_outputs, n_predict)``
+                  while the derivatives have shape ``(n_outputs, n_predict, D)``, where
+                  ``n_outputs`` is ``n_emulators`` or the length of ``outputs``. If
                   the ``do_unc`` or ``do_deriv`` flags are set to ``False``, then those arrays
-                  are replaced by ``None``.
-        :rtype: tuple
+                  are replaced by ``None``. If ``lazy`` is ``True``, a ``MultiOutputPrediction``
+                  object is returned instead.
+        :rtype: tuple or MultiOutputPrediction
         """
         
         testing = np.array(testing)
@@ -422,21 +1590,70 @@ class MultiOutputGP(object):
         if not processes is None:
             processes = int(processes)
             assert processes > 0, "number of processes must be a positive integer"
-            
-        with Pool(processes) as p:
-            predict_vals = p.starmap(GaussianProcess.predict, [(gp, testing) for gp in self.emulators])
+
+        if outputs is None:
+            outputs = list(range(self.n_emulators))
+        else:
+            outputs = [int(index) for index in outputs]
+            assert len(outputs) > 0, "outputs must contain at least one index"
+            assert all([index >= 0 and index < self.n_emulators for index in outputs]), "outputs must be indices between 0 and n_emulators - 1"
+
+        assert executor is None or hasattr(executor, "submit"), "executor must have a submit method"
+
+        if lazy:
+            return MultiOutputPrediction(self.emulators, outputs, testing, do_deriv, do_unc)
+
+        if not executor is None:
+            futures = [executor.submit(GaussianProcess.predict, self.emulators[index], testing,
+                                       do_deriv, do_unc) for index in outputs]
+            predict_vals = [future.result() for future in futures]
+        elif self._pool is None:
+            self.start_pool(processes)
+            try:
+                return self._predict_pool(testing, do_deriv, do_unc, outputs)
+            finally:
+                self.close_pool()
+        else:
+            return self._predict_pool(testing, do_deriv, do_unc, outputs)
         
         # repackage predictions into numpy arrays
         
-        predict_unpacked, unc_unpacked, deriv_unpacked = [np.array(t) for t in zip(*predict_vals)]
+        return _stack_predictions(predict_vals, do_deriv, do_unc)
         
-        if not do_unc:
-            unc_unpacked = None
-        if not do_deriv:
-            deriv_unpacked = None
-            
+    def _predict_pool(self, testing, do_deriv, do_unc, outputs):
+        """
+        Make predictions using the persistent worker pool and a shared memory buffer
+
+        :returns: Tuple of numpy arrays holding the predictions, uncertainties, and derivatives
+        :rtype: tuple
+        """
+
+        n_predict = testing.shape[0]
+        n_outputs = len(outputs)
+        size = _prediction_size(n_outputs, n_predict, self.D, do_deriv, do_unc)
+
+        shm = shared_memory.SharedMemory(create = True, size = 8*size)
+        arrays = None
+
+        try:
+            arrays = _prediction_arrays(np.ndarray((size,), dtype = float, buffer = shm.buf),
+                                        n_outputs, n_predict, self.D, do_deriv, do_unc)
+            arrays[0][:] = testing
+
+            self._pool.starmap(_predict_worker,
+                               [(index, slot, self.emulators[index].theta, self.emulators[index].get_nugget(),
+                                 shm.name, n_outputs, n_predict, do_deriv, do_unc)
+                                for slot, index in enumerate(outputs)])
+
+            predict_unpacked, unc_unpacked, deriv_unpacked = [None if a is None else np.copy(a)
+                                                              for a in arrays[1:]]
+        finally:
+            arrays = None
+            shm.close()
+            shm.unlink()
+
         return predict_unpacked, unc_unpacked, deriv_unpacked
-        
+
     def __str__(self):
         """
         Returns a string representation of the model
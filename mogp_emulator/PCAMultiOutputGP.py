@@ -0,0 +1,299 @@
+import numpy as np
+from .MultiOutputGP import MultiOutputGP
+
+class PCAMultiOutputGP(object):
+    r"""
+    Implementation of a multiple-output Gaussian Process Emulator using output dimension reduction
+
+    When a simulation has a large number of outputs that are highly correlated (for instance,
+    a field of values at many spatial locations), fitting an independent emulator to every
+    output is expensive and wasteful. This class instead projects the targets onto a truncated
+    principal component (PCA) basis computed from a singular value decomposition of the
+    centered targets, and fits independent ``GaussianProcess`` emulators only to the scores of
+    the leading components (using a ``MultiOutputGP`` instance, stored as the ``gp``
+    attribute). Predictions for all of the original outputs are reconstructed from the
+    predictions of the components.
+
+    Writing the centered targets as :math:`Y - \mu = U S V^T`, the scores of the training
+    examples on the retained components are :math:`Z = U_k^T (Y - \mu)`, where :math:`U_k`
+    holds the first ``n_components`` columns of :math:`U`. Predicted means and derivatives
+    are mapped back as :math:`\mu + U_k z`. Because the components are fit independently,
+    the predicted variance of each output is :math:`\sum_j U_{ij}^2 \sigma_j^2`, where
+    :math:`\sigma_j^2` is the predicted variance of component :math:`j`. The mean squared
+    error made by truncating the basis over the training data is added to the variance of
+    each output, so that the reported uncertainty accounts for the reconstruction error
+    (this is available separately through the ``get_truncation_variance`` method).
+
+    The number of components is either given directly or chosen as the smallest number that
+    explains a given fraction of the variance in the targets, which controls the
+    reconstruction error.
+
+    Example: ::
+
+        >>> import numpy as np
+        >>> from mogp_emulator import PCAMultiOutputGP
+        >>> x = np.linspace(0., 1., 10)[:, None]
+        >>> s = np.linspace(0., 1., 500)
+        >>> y = np.sin(2.*x[:, 0])*s[:, None] + np.cos(3.*x[:, 0])*s[:, None]**2
+        >>> gp = PCAMultiOutputGP(x, y)
+        >>> print(gp)
+        PCA Multi-Output Gaussian Process with:
+        500 outputs
+        2 components
+        10 training examples
+        1 input variables
+        >>> l = gp.learn_hyperparameters()
+        >>> mean, unc, deriv = gp.predict(np.array([[0.25], [0.75]]))
+        >>> mean.shape
+        (500, 2)
+
+    """
+
+    def __init__(self, inputs, targets, n_components = None, explained_variance = 0.999,
+                 nugget = None):
+        """
+        Create a new multi-output GP Emulator using output dimension reduction
+
+        Computes the principal component basis of the targets, determines the number of
+        components to retain, and creates the emulators for the component scores. The
+        emulators must be fit with ``learn_hyperparameters`` before making predictions.
+
+        :param inputs: Numpy array holding emulator input parameters. Must be 2D with shape
+                       ``n`` by ``D``, where ``n`` is the number of training examples and
+                       ``D`` is the number of input parameters for each output.
+        :type inputs: ndarray
+        :param targets: Numpy array holding emulator targets. Must be 2D with shape
+                        ``(n_emulators, n)``, where ``n_emulators`` is the number of outputs.
+        :type targets: ndarray
+        :param n_components: (optional) Number of principal components to retain. Must be a
+                             positive integer no larger than ``min(n_emulators, n)``. If
+                             ``None`` (default), the number is chosen using
+                             ``explained_variance``.
+        :type n_components: int or None
+        :param explained_variance: (optional) Fraction of the variance in the targets that
+                                   must be explained by the retained components when
+                                   ``n_components`` is ``None``. Must be in the interval
+                                   ``(0, 1]`` (default is 0.999).
+        :type explained_variance: float
+        :param nugget: (optional) Nugget used for all component emulators. Can be ``None``
+                       (adaptive noise addition, the default) or a non-negative float.
+        :type nugget: float or None
+        :returns: New ``PCAMultiOutputGP`` instance
+        :rtype: PCAMultiOutputGP
+        """
+
+        inputs = np.array(inputs, dtype = float)
+        targets = np.array(targets, dtype = float)
+
+        if not (len(inputs.shape) == 2):
+            raise ValueError("inputs must be 2D array")
+        if not (len(targets.shape) == 2):
+            raise ValueError("targets must be a 2D array")
+        if not (inputs.shape[0] == targets.shape[1]):
+            raise ValueError("the first dimension of inputs must be the same length as the second dimension of targets")
+
+        assert explained_variance > 0. and explained_variance <= 1., "explained_variance must be in (0, 1]"
+        if not nugget is None:
+            assert nugget >= 0., "nugget must be None or a non-negative float"
+
+        self.mean = np.mean(targets, axis = 1)
+
+        U, S, _ = np.linalg.svd(targets - self.mean[:, None], full_matrices = False)
+
+        variance = S**2
+        if np.sum(variance) == 0.:
+            raise ValueError("targets do not vary across the training examples")
+
+        if n_components is None:
+            fraction = np.cumsum(variance)/np.sum(variance)
+            n_components = int(np.searchsorted(fraction, explained_variance*(1. - 1.e-12))) + 1
+        else:
+            n_components = int(n_components)
+            assert n_components > 0 and n_components <= len(S), "n_components must be a positive integer no larger than the minimum of the number of outputs and training examples"
+
+        self.n_components = n_components
+        self.basis = U[:, :n_components]
+        self.singular_values = S
+        self.explained_variance = np.sum(variance[:n_components])/np.sum(variance)
+
+        self.truncation_variance = np.sum(U[:, n_components:]**2*variance[n_components:],
+                                          axis = 1)/targets.shape[1]
+
+        scores = np.dot(self.basis.T, targets - self.mean[:, None])
+
+        self.gp = MultiOutputGP(inputs, scores, [nugget]*n_components)
+
+        self.n_emulators = targets.shape[0]
+        self.n = inputs.shape[0]
+        self.D = inputs.shape[1]
+
+    def get_n_emulators(self):
+        """
+        Returns the number of outputs
+
+        :returns: Number of outputs predicted by the emulator
+        :rtype: int
+        """
+
+        return self.n_emulators
+
+    def get_n_components(self):
+        """
+        Returns the number of principal components that are emulated
+
+        :returns: Number of retained principal components
+        :rtype: int
+        """
+
+        return self.n_components
+
+    def get_n(self):
+        """
+        Returns number of training examples
+
+        :returns: Number of training examples
+        :rtype: int
+        """
+
+        return self.n
+
+    def get_D(self):
+        """
+        Returns number of inputs
+
+        :returns: Number of input parameters
+        :rtype: int
+        """
+
+        return self.D
+
+    def get_truncation_variance(self):
+        """
+        Returns the variance of each output due to truncating the principal component basis
+
+        The truncation variance is the mean squared error over the training examples made by
+        reconstructing each output from the retained components. It is added to the variance
+        of each output when making predictions.
+
+        :returns: Truncation variance for each output, with shape ``(n_emulators,)``
+        :rtype: ndarray
+        """
+
+        return self.truncation_variance
+
+    def project(self, targets):
+        """
+        Project output values onto the retained principal components
+
+        :param targets: Output values, with shape ``(n_emulators, n_points)`` or ``(n_emulators,)``
+        :type targets: ndarray
+        :returns: Component scores, with shape ``(n_components, n_points)`` or ``(n_components,)``
+        :rtype: ndarray
+        """
+
+        targets = np.array(targets, dtype = float)
+        assert targets.shape[0] == self.n_emulators, "first dimension of targets must be the number of outputs"
+
+        if len(targets.shape) == 1:
+            return np.dot(self.basis.T, targets - self.mean)
+        else:
+            return np.dot(self.basis.T, targets - self.mean[:, None])
+
+    def reconstruct(self, scores):
+        """
+        Reconstruct output values from principal component scores
+
+        :param scores: Component scores, with shape ``(n_components, n_points)`` or
+                       ``(n_components,)``
+        :type scores: ndarray
+        :returns: Output values, with shape ``(n_emulators, n_points)`` or ``(n_emulators,)``
+        :rtype: ndarray
+        """
+
+        scores = np.array(scores, dtype = float)
+        assert scores.shape[0] == self.n_components, "first dimension of scores must be the number of components"
+
+        if len(scores.shape) == 1:
+            return self.mean + np.dot(self.basis, scores)
+        else:
+            return self.mean[:, None] + np.dot(self.basis, scores)
+
+    def learn_hyperparameters(self, n_tries = 15, theta0 = None, processes = None,
+                              method = 'L-BFGS-B', **kwargs):
+        """
+        Fit hyperparameters for the emulators of each principal component
+
+        Fits the component emulators using the ``learn_hyperparameters`` method of
+        ``MultiOutputGP``. See that method for a description of the arguments.
+
+        :returns: List holding ``n_components`` tuples of length 2. Each tuple contains
+                  the minimum negative log-likelihood for that particular component and a
+                  numpy array of length ``D + 1`` holding the corresponding hyperparameters
+        :rtype: list
+        """
+
+        return self.gp.learn_hyperparameters(n_tries, theta0, processes, method, **kwargs)
+
+    def predict(self, testing, do_deriv = True, do_unc = True, processes = None, executor = None):
+        """
+        Make a prediction for all outputs
+
+        Predicts the principal component scores with the component emulators and reconstructs
+        the mean, variance, and derivatives of all outputs. The variance includes the
+        truncation variance (see ``get_truncation_variance``).
+
+        :param testing: Array-like object holding the points where predictions will be made.
+                        Must have shape ``(n_predict, D)`` or ``(D,)`` (for a single prediction)
+        :type testing: ndarray
+        :param do_deriv: (optional) Flag indicating if the derivatives are to be computed.
+                         If ``False`` the method returns ``None`` in place of the derivative
+                         array. Default value is ``True``.
+        :type do_deriv: bool
+        :param do_unc: (optional) Flag indicating if the uncertainties are to be computed.
+                         If ``False`` the method returns ``None`` in place of the uncertainty
+                         array. Default value is ``True``.
+        :type do_unc: bool
+        :param processes: (optional) Number of processes to use when making the predictions
+                          with the component emulators (see ``MultiOutputGP.predict``).
+        :type processes: int or None
+        :param executor: (optional) Executor used to make the predictions with the component
+                         emulators (see ``MultiOutputGP.predict``).
+        :type executor: concurrent.futures.Executor or None
+        :returns: Tuple of numpy arrays holding the predictions, uncertainties, and derivatives,
+                  respectively. Predictions and uncertainties have shape ``(n_emulators, n_predict)``
+                  while the derivatives have shape ``(n_emulators, n_predict, D)``. If
+                  the ``do_unc`` or ``do_deriv`` flags are set to ``False``, then those arrays
+                  are replaced by ``None``.
+        :rtype: tuple
+        """
+
+        mean_z, unc_z, deriv_z = self.gp.predict(testing, do_deriv, do_unc, processes, executor = executor)
+
+        mean = self.mean[:, None] + np.dot(self.basis, mean_z)
+
+        if do_unc:
+            unc = np.dot(self.basis**2, unc_z) + self.truncation_variance[:, None]
+        else:
+            unc = None
+
+        if do_deriv:
+            deriv = np.einsum('ij,jkl->ikl', self.basis, deriv_z)
+        else:
+            deriv = None
+
+        return mean, unc, deriv
+
+    def __str__(self):
+        """
+        Returns a string representation of the model
+
+        :returns: A string representation of the model (indicates number of outputs,
+                  components, and array shapes)
+        :rtype: str
+        """
+
+        return ("PCA Multi-Output Gaussian Process with:\n"+
+                 str(self.get_n_emulators())+" outputs\n"+
+                 str(self.get_n_components())+" components\n"+
+                 str(self.get_n())+" training examples\n"+
+                 str(self.get_D())+" input variables")
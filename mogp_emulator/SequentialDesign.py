@@ -1,9 +1,17 @@
+import os
+import struct
+import warnings
 import numpy as np
 from scipy.spatial.distance import cdist
 from inspect import signature
+from concurrent.futures import as_completed, wait, FIRST_COMPLETED
 from .ExperimentalDesign import ExperimentalDesign
 from .GaussianProcess import GaussianProcess
+from .MultiOutputGP import MultiOutputGP
+from .HistoryMatching import HistoryMatching
 from numpy.linalg import LinAlgError
+from scipy import linalg
+from .utils import open_record_file, write_raw_record
 
 class SequentialDesign(object):
     """
@@ -35,8 +43,14 @@ class SequentialDesign(object):
     a method ``_eval_metric``, which considers all candidate points and returns the index of the best
     candidate. Otherwise, all other code provided here allows for a generic sequential design to be
     easily run and managed.
+
+    If observations of the simulation are available, the candidates can be restricted to the
+    region of parameter space that is not ruled out yet (NROY) by history matching against the
+    observations (see ``set_history_matching``), so that neither the metric nor the simulations
+    are spent on implausible parameter values.
     """
-    def __init__(self, base_design, f = None, n_samples = None, n_init = 10, n_cand = 50):
+    def __init__(self, base_design, f = None, n_samples = None, n_init = 10, n_cand = 50,
+                 n_pool = None):
         """
         Create a new instance of a sequential experimental design
 
@@ -71,6 +85,11 @@ class SequentialDesign(object):
         :type n_init: int
         :param n_cand: Number of candidates to consider at each sequential design step. Must be a positive
                        integer. Optional, default value is 50.
+        :param n_pool: Number of points drawn from the base design at each step, from which the ``n_cand``
+                       candidates are selected using a cheap screening score (see ``_generate_candidates``).
+                       If specified, must be an integer no smaller than ``n_cand``. Optional, default value
+                       is ``None`` (draw ``n_cand`` candidates directly).
+        :type n_pool: int or None
         """
 
         if not isinstance(base_design, ExperimentalDesign):
@@ -92,6 +111,9 @@ class SequentialDesign(object):
         if int(n_cand) <= 0:
             raise ValueError("number of candidate design points must be positive")
 
+        if (not n_pool is None) and int(n_pool) < int(n_cand):
+            raise ValueError("size of candidate pool cannot be smaller than the number of candidates")
+
         self.base_design = base_design
         self.f = f
         if n_samples is None:
@@ -100,12 +122,29 @@ class SequentialDesign(object):
             self.n_samples = int(n_samples)
         self.n_init = int(n_init)
         self.n_cand = int(n_cand)
+        if n_pool is None:
+            self.n_pool = None
+        else:
+            self.n_pool = int(n_pool)
+        self.pool_chunk_size = 10000
+        self._target_shape = ()
 
         self.current_iteration = 0
         self.initialized = False
         self.inputs = None
         self.targets = None
         self.candidates = None
+        self.pending = {}
+        self._next_label = 0
+        self._journal = None
+        self._journal_paused = False
+        self.history_matching = None
+        self.nroy_discrepancy = 0.
+        self.nroy_refresh = 1
+        self.nroy_max_draws = 100000
+        self.nroy_nugget = None
+        self._nroy_gp = None
+        self._nroy_iteration = 0
 
     def save_design(self, filename):
         """
@@ -150,6 +189,8 @@ class SequentialDesign(object):
         :returns: None
         """
 
+        assert self._journal is None, "cannot load a design while a journal is open"
+
         design_file = np.load(filename, allow_pickle=True)
 
         self.inputs = np.array(design_file['inputs'])
@@ -170,7 +211,7 @@ class SequentialDesign(object):
             assert self.targets is None, "Cannot have targets without corresponding inputs"
         else:
             if not self.targets is None:
-                assert self.targets.ndim == 1, "bad number of dimensions for targets"
+                assert self.targets.ndim == 1 + len(self._target_shape), "bad number of dimensions for targets"
                 assert self.targets.shape[0] <= self.inputs.shape[0], "targets cannot be longer than inputs"
                 self.initialized = True
                 self.current_iteration = self.targets.shape[0]
@@ -184,6 +225,155 @@ class SequentialDesign(object):
             if self.candidates.shape[0] != self.n_cand:
                 print("shape of candidates differs from n_cand, candidates will be overridden")
 
+    def open_journal(self, filename):
+        """
+        Record the design in an append-only journal file
+
+        Opens a journal file in which the state of the design is recorded as it changes. Unlike
+        ``save_design``, which writes all arrays every time it is called, each new design point,
+        target value, and set of candidates is appended to the journal as a separate record
+        (made up of a record type, an index, and the values as 64-bit floats, so that the
+        records for a given design have a fixed size) as soon as it is created, and the file is
+        flushed to disk. The cost of recording each iteration therefore does not grow with the
+        size of the design, and no pickled data is read back. Each record is written with a
+        checksum (see ``mogp_emulator.utils.write_raw_record``), so if the process is
+        interrupted, at most the records being written at that time are lost and any partial
+        record is discarded when the journal is next opened.
+
+        If the file already holds a journal, the recorded design is replayed to restore the
+        ``inputs``, ``targets``, and ``candidates`` (replacing the current values), so that an
+        interrupted design can be resumed by creating the design again with the same parameters
+        and calling this method. If a point was chosen but its target was not set, the design
+        resumes waiting for that target (points that were pending in an asynchronous design
+        are not recorded). The journal records the number of parameters, initial points, and
+        candidates, and a ``ValueError`` is raised if these do not match the design. If the
+        file does not exist (or is empty), a new journal is started holding the current state
+        of the design.
+
+        :param filename: Name of the journal file
+        :type filename: str
+        :returns: None
+        """
+
+        assert self._journal is None, "a journal is already open for this design"
+
+        records, journal = open_record_file(filename, raw = True)
+
+        header = np.array([self.get_n_parameters(), self.n_init, self.n_cand] + list(self._target_shape),
+                          dtype = float)
+
+        if len(records) == 0:
+            write_raw_record(journal, _pack_journal_record(b"h", 0, header), fsync = False)
+            self._journal_n_inputs = 0
+            self._journal_n_targets = 0
+            self._journal_candidates = None
+        else:
+            kind, _, values = _unpack_journal_record(records[0])
+            if not (kind == b"h" and np.array_equal(values, header)):
+                journal.close()
+                raise ValueError("journal in {} was not written by a design with the same parameters".format(filename))
+            self._replay_journal(records[1:])
+
+        self._journal = journal
+        self._write_journal()
+
+    def close_journal(self):
+        """
+        Stop recording the design in the journal file
+
+        Closes the journal opened with ``open_journal`` (if any). All records have already been
+        written to the file, so this does not need to be called to preserve the design.
+
+        :returns: None
+        """
+
+        if not self._journal is None:
+            self._journal.close()
+            self._journal = None
+
+    def _replay_journal(self, records):
+        """
+        Restore the design from the records in a journal
+
+        Internal method that sets ``inputs``, ``targets``, ``candidates`` and the number of
+        iterations from the records read from a journal file (not including the header).
+
+        :param records: List of records read from the journal file
+        :type records: list
+        :returns: None
+        """
+
+        inputs = []
+        targets = []
+        candidates = None
+
+        for record in records:
+            kind, index, values = _unpack_journal_record(record)
+            if kind == b"x":
+                entries, value = inputs, values
+            elif kind == b"y":
+                entries, value = targets, np.reshape(values, self._target_shape)
+            elif kind == b"c":
+                candidates = np.reshape(values, (-1, self.get_n_parameters()))
+                continue
+            else:
+                raise ValueError("unknown record type in journal")
+            assert index <= len(entries), "journal records are out of order"
+            if index == len(entries):
+                entries.append(value)
+            else:
+                entries[index] = value
+
+        if len(inputs) > 0:
+            self.inputs = np.array(inputs)
+            self.current_iteration = self.inputs.shape[0]
+        if len(targets) > 0:
+            self.targets = np.array(targets)
+            self.initialized = True
+            self.current_iteration = self.targets.shape[0]
+        self.candidates = candidates
+
+        self._journal_n_inputs = len(inputs)
+        self._journal_n_targets = len(targets)
+        self._journal_candidates = self.candidates
+
+    def _write_journal(self):
+        """
+        Append any changes to the design to the journal
+
+        Internal method called whenever the design changes. If a journal is open, appends a
+        record for each design point and target that has been added since the last call and for
+        the candidates if they have changed, and then forces the file to disk.
+
+        :returns: None
+        """
+
+        if self._journal is None or self._journal_paused:
+            return
+
+        written = False
+
+        if not self.inputs is None:
+            for i in range(self._journal_n_inputs, self.inputs.shape[0]):
+                write_raw_record(self._journal, _pack_journal_record(b"x", i, self.inputs[i]), fsync = False)
+                written = True
+            self._journal_n_inputs = self.inputs.shape[0]
+
+        if not self.targets is None:
+            for i in range(self._journal_n_targets, self.targets.shape[0]):
+                write_raw_record(self._journal, _pack_journal_record(b"y", i, self.targets[i:i + 1]), fsync = False)
+                written = True
+            self._journal_n_targets = self.targets.shape[0]
+
+        if not self.candidates is self._journal_candidates:
+            if not self.candidates is None:
+                write_raw_record(self._journal, _pack_journal_record(b"c", 0, self.candidates), fsync = False)
+                written = True
+            self._journal_candidates = self.candidates
+
+        if written:
+            os.fsync(self._journal.fileno())
+
     def has_function(self):
         """
         Determines if class contains a function for running the simulator
@@ -251,6 +441,19 @@ class SequentialDesign(object):
 
         return self.n_cand
 
+    def get_n_pool(self):
+        """
+        Get size of the pool from which candidates are selected
+
+        Returns the number of points drawn from the base design at each step, from which the
+        candidates are selected, or ``None`` if the candidates are drawn directly.
+
+        :returns: Size of candidate pool
+        :rtype: int or None
+        """
+
+        return self.n_pool
+
     def get_current_iteration(self):
         """
         Get number of current iteration in the experimental design
@@ -286,7 +489,9 @@ class SequentialDesign(object):
         ``(current_iteration,)`` (i.e. it is resized after each iteration when a new target point
         is added). Note that simulation outputs must be a single number, so if considering a
         simulation has multiple outputs, the user must decide how to combine them to form the
-        relevant target value for deciding which point to simulate next.
+        relevant target value for deciding which point to simulate next (or use a
+        ``MultiOutputMICEDesign``, for which the targets have shape
+        ``(current_iteration, n_outputs)``).
 
         :returns: Current value of the target inputs
         :rtype: ndarray
@@ -322,6 +527,91 @@ class SequentialDesign(object):
 
         return type(self.base_design).__name__
 
+    def set_history_matching(self, obs, threshold = 3., discrepancy = 0., refresh = 1,
+                             max_draws = 100000, nugget = None):
+        """
+        Restrict the candidates to the region that is not ruled out by history matching
+
+        Once set, the candidates at each step (including those in the candidate pool, if used) are
+        drawn only from the part of parameter space that is not ruled out yet (NROY) by history
+        matching the simulation against the given observations. Points are drawn from the base
+        design and rejected if their implausibility (see ``HistoryMatching.get_implausibility``)
+        exceeds the threshold, where the implausibility is computed from the predictions of an
+        emulator fit to the current design. As predictions without derivatives are cheap compared
+        to the metric, this filter is fast even when most points are rejected. The emulator is
+        refit every ``refresh`` iterations, so that the NROY estimate shrinks as the design grows.
+
+        For simulations with multiple outputs, one observation must be given for each output, and
+        a point is ruled out if the implausibility of any output exceeds the threshold.
+
+        If fewer than the required number of points in the NROY space are found after drawing
+        ``max_draws`` points, the remaining points are those with the smallest implausibility and
+        a warning is given. The initial design is always drawn from the full base design.
+
+        :param obs: Observations against which the simulation is compared, either a float or a
+                    list holding the observation and its variance (see ``HistoryMatching``). For
+                    simulations with multiple outputs, must be a list holding one observation for
+                    each output. If ``None``, candidates are drawn from the full base design.
+        :type obs: float, list, or None
+        :param threshold: (optional) Implausibility above which points are ruled out. Must be a
+                          non-negative float. Default is 3.
+        :type threshold: float
+        :param discrepancy: (optional) Model discrepancy variance included when computing the
+                            implausibility. Must be a non-negative float. Default is 0.
+        :type discrepancy: float
+        :param refresh: (optional) Number of iterations between refitting the emulator used to
+                        estimate the NROY space. Must be a positive integer. Default is 1.
+        :type refresh: int
+        :param max_draws: (optional) Maximum number of points drawn from the base design when
+                          sampling from the NROY space. Must be a positive integer. Default
+                          is 100000.
+        :type max_draws: int
+        :param nugget: (optional) Nugget of the emulator used to estimate the NROY space. Must
+                       be a non-negative float or ``None`` (adaptive nugget, the default).
+        :type nugget: float or None
+        :returns: None
+        """
+
+        if obs is None:
+            self.history_matching = None
+            self._nroy_gp = None
+            return
+
+        if len(self._target_shape) == 0:
+            obs = [obs]
+        else:
+            assert len(obs) == self._target_shape[0], "must provide one observation for each output"
+
+        assert discrepancy >= 0., "Model discrepancy variance cannot be negative"
+
+        if int(refresh) <= 0:
+            raise ValueError("number of iterations between refreshing the NROY space must be positive")
+
+        if int(max_draws) <= 0:
+            raise ValueError("maximum number of draws from the NROY space must be positive")
+
+        if not nugget is None:
+            assert nugget >= 0., "nugget must be None or a non-negative float"
+
+        self.history_matching = [HistoryMatching(obs = single_obs, threshold = threshold)
+                                 for single_obs in obs]
+        self.nroy_discrepancy = float(discrepancy)
+        self.nroy_refresh = int(refresh)
+        self.nroy_max_draws = int(max_draws)
+        self.nroy_nugget = nugget
+        self._nroy_gp = None
+
+    def get_NROY_gp(self):
+        """
+        Get the emulator used to estimate the NROY space
+
+        :returns: Emulator used to compute the implausibility of the candidates, or ``None`` if
+                  it has not been fit (or history matching is not used)
+        :rtype: GaussianProcess, MultiOutputGP, or None
+        """
+
+        return self._nroy_gp
+
     def generate_initial_design(self):
         """
         Create initial design
@@ -341,6 +631,9 @@ class SequentialDesign(object):
 
         self.inputs = self.base_design.sample(self.n_init)
         self.current_iteration = self.n_init
+        if not self._journal is None:
+            self._journal_n_inputs = 0
+        self._write_journal()
         return self.inputs
 
     def set_initial_targets(self, targets):
@@ -370,13 +663,44 @@ class SequentialDesign(object):
         else:
             assert self.inputs.shape == (self.n_init, self.get_n_parameters()), "inputs have not been initialized correctly"
 
-        targets = np.atleast_1d(np.squeeze(np.array(targets)))
-        assert np.array(targets).shape == (self.n_init,), "initial targets must have shape (n_init,)"
+        targets = self._reshape_targets(targets, self.n_init, "initial targets must have shape (n_init,)")
 
         self.targets = np.array(targets)
         self.initialized = True
+        self._write_journal()
+
+    def _reshape_targets(self, targets, n_points, message):
+        """
+        Check the shape of a set of target values
+
+        Internal method that converts simulation outputs for ``n_points`` design points into an
+        array with shape ``(n_points,)`` (or ``(n_points, n_outputs)`` for a design where the
+        simulation has several outputs), raising an ``AssertionError`` with the given message if
+        they do not have the correct number of values.
 
-    def run_initial_design(self):
+        :param targets: Target values
+        :type targets: float or array-like
+        :param n_points: Number of design points
+        :type n_points: int
+        :param message: Message for the error raised if the shape is incorrect
+        :type message: str
+        :returns: Target values with the correct shape
+        :rtype: ndarray
+        """
+
+        targets = np.atleast_1d(np.array(targets))
+
+        if self._target_shape == ():
+            targets = np.reshape(targets, (targets.size,))
+        else:
+            assert targets.size == n_points*self._target_shape[0], message
+            targets = np.reshape(targets, (n_points,) + self._target_shape)
+
+        assert targets.shape == (n_points,) + self._target_shape, message
+
+        return targets
+
+    def run_initial_design(self, executor = None):
         """
         Run initial design
 
@@ -391,6 +715,15 @@ class SequentialDesign(object):
         Note also that this method checks that the outputs of the bound function match up with
         the expected array sizes and that all outputs are finite before updating the initial targets.
 
+        The function is evaluated on the design points one at a time unless an ``executor``
+        (any object with a ``submit`` method following ``concurrent.futures.Executor``, such as a
+        ``ThreadPoolExecutor``, ``ProcessPoolExecutor``, or ``SocketExecutor``) is provided, in
+        which case all points are submitted at once and the targets are filled in as the
+        simulations finish. With a process based executor, the bound function must be picklable.
+
+        :param executor: (optional) Executor used to run the simulations concurrently. Default
+                         is ``None`` (run the simulations serially).
+        :type executor: concurrent.futures.Executor or None
         :returns: None
         :rtype: None
         """
@@ -399,14 +732,48 @@ class SequentialDesign(object):
         assert self.has_function(), "Design must have a bound function to use run_initial_design"
 
         inputs = self.generate_initial_design()
-        targets = np.full((self.n_init,), np.nan)
-
-        for i in range(self.n_init):
-            targets[i] = np.array(self.f(inputs[i,:]))
+        targets = self._run_simulations(inputs, executor)
 
         assert np.all(np.isfinite(targets)), "error in initializing sequential design, function outputs may not be the correct shape"
         self.set_initial_targets(targets)
 
+    def _run_simulations(self, inputs, executor = None):
+        """
+        Evaluate the bound function on a set of points
+
+        Internal method that evaluates the bound function on each row of ``inputs``, either
+        serially or by submitting every point to an executor and filling in the results as
+        they complete (in whatever order that occurs). Outputs that cannot be converted to a
+        single float are stored as NaN, so that the calling method can check the results.
+
+        :param inputs: Points to be simulated, with shape ``(n_points, n_parameters)``
+        :type inputs: ndarray
+        :param executor: (optional) Executor used to run the simulations concurrently. Default
+                         is ``None`` (run the simulations serially).
+        :type executor: concurrent.futures.Executor or None
+        :returns: Simulation outputs, with shape ``(n_points,)``
+        :rtype: ndarray
+        """
+
+        assert executor is None or hasattr(executor, "submit"), "executor must have a submit method"
+
+        targets = np.full((inputs.shape[0],) + self._target_shape, np.nan)
+
+        if executor is None:
+            for i in range(inputs.shape[0]):
+                targets[i] = np.array(self.f(inputs[i,:]))
+        else:
+            futures = {executor.submit(self.f, inputs[i,:]): i for i in range(inputs.shape[0])}
+            try:
+                for future in as_completed(futures):
+                    targets[futures[future]] = np.array(future.result())
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+        return targets
+
     def _generate_candidates(self):
         """
         Generate candidates for next iteration
@@ -415,11 +782,331 @@ class SequentialDesign(object):
         Draws the desired number of points from the base design and sets the internal ``candidates``
         attribute to the resuting candidate design points.
 
+        If a pool size ``n_pool`` was given, a larger pool of points is instead drawn from the base
+        design in chunks of ``pool_chunk_size`` points, each point is given a cheap score using
+        ``_screen_candidates``, and ``n_cand`` points are chosen as the candidates using
+        ``_select_candidates``, which picks them greedily so that they are spread out rather than
+        all lying in the largest gap in the design. After each chunk, the selection is made from
+        the points chosen so far together with the new chunk, so only ``n_cand`` points and the
+        current chunk are held in memory and very large pools can be used, while the (more
+        expensive) metric is only evaluated on the ``n_cand`` candidates that remain. If the pool
+        is drawn in a single chunk, the result is the greedy maximin selection from the whole pool.
+
+        All points are drawn using ``_sample_candidates``, which restricts them to the NROY space
+        if history matching has been set (see ``set_history_matching``).
+
         :returns: None
         :rtype: None
         """
 
-        self.candidates = self.base_design.sample(self.n_cand)
+        if self.n_pool is None:
+            self.candidates = self._sample_candidates(self.n_cand)
+        else:
+            candidates = np.zeros((0, self.get_n_parameters()))
+            scores = np.zeros(0)
+            n_drawn = 0
+
+            while n_drawn < self.n_pool:
+                n_chunk = min(self.pool_chunk_size, self.n_pool - n_drawn)
+                chunk = self._sample_candidates(n_chunk)
+                n_drawn = n_drawn + n_chunk
+
+                candidates = np.concatenate((candidates, chunk))
+                scores = np.concatenate((scores, self._screen_candidates(chunk)))
+
+                if len(scores) > self.n_cand:
+                    keep = self._select_candidates(candidates, scores)
+                    candidates = candidates[keep]
+                    scores = scores[keep]
+
+            self.candidates = candidates
+
+        self._write_journal()
+
+    def _screen_candidates(self, points):
+        """
+        Compute a cheap score used to select candidates from a larger pool
+
+        Internal method used by ``_generate_candidates`` when a pool size is set to choose which
+        points from the pool are kept as candidates (points with higher scores are preferred, see
+        ``_select_candidates``). The score must be much cheaper to evaluate than the metric used
+        to choose the next point. The base implementation is a space-filling score, the squared
+        distance from each point to the nearest point in the current design (including any
+        pending points), so that the candidates are drawn from the regions furthest from the
+        existing design points. Subclasses can override this method to use a different score,
+        which should be on the same scale as a squared distance, as it is compared with the
+        squared distances between candidates when making the selection.
+
+        :param points: Points to be scored, with shape ``(n_points, n_parameters)``
+        :type points: ndarray
+        :returns: Score for each point, with shape ``(n_points,)``
+        :rtype: ndarray
+        """
+
+        design = self.get_pending_points()
+        if not self.inputs is None:
+            design = np.concatenate((self.inputs, design))
+
+        if design.shape[0] == 0:
+            return np.zeros(points.shape[0])
+
+        return np.min(cdist(points, design, "sqeuclidean"), axis = 1)
+
+    def _select_candidates(self, points, scores):
+        """
+        Choose candidates from a set of scored points using a greedy maximin selection
+
+        Internal method used by ``_generate_candidates`` to choose ``n_cand`` of the screened
+        points. Simply keeping the points with the highest screening scores tends to put all of
+        the candidates in the single largest gap in the design, so instead the points are picked
+        one at a time. At each step the point with the highest score is picked, and the score of
+        every remaining point is then reduced to its squared distance to the picked point if that
+        is smaller. Each candidate is therefore far from both the design and the candidates
+        already picked.
+
+        :param points: Points to choose from, with shape ``(n_points, n_parameters)``
+        :type points: ndarray
+        :param scores: Screening score for each point (see ``_screen_candidates``), with shape
+                       ``(n_points,)``
+        :type scores: ndarray
+        :returns: Indices of the chosen points, in the order in which they were picked
+        :rtype: ndarray
+        """
+
+        scores = np.array(scores, dtype = float)
+        n_select = min(self.n_cand, len(scores))
+        selected = np.zeros(n_select, dtype = int)
+
+        for i in range(n_select):
+            selected[i] = np.argmax(scores)
+            scores = np.minimum(scores, np.sum((points - points[selected[i]])**2, axis = 1))
+            scores[selected[:i + 1]] = -np.inf
+
+        return selected
+
+    def _sample_candidates(self, n_points):
+        """
+        Draw points from the base design, restricted to the NROY space if set
+
+        Internal method used to draw candidates. If history matching has not been set (see
+        ``set_history_matching``) or the initial targets are not yet available, this simply
+        draws ``n_points`` points from the base design. Otherwise, points are drawn from the
+        base design in chunks and those whose implausibility exceeds the threshold are
+        rejected until ``n_points`` points have been accepted. The size of each chunk is
+        chosen from the fraction of points accepted so far (up to ``pool_chunk_size``). If
+        the NROY space is too small to find enough points within ``nroy_max_draws`` draws,
+        the least implausible of the rejected points are used to make up the difference.
+
+        :param n_points: Number of points to draw. Must be a positive integer.
+        :type n_points: int
+        :returns: Points drawn from the base design, with shape ``(n_points, n_parameters)``
+        :rtype: ndarray
+        """
+
+        if self.history_matching is None or self.targets is None:
+            return self.base_design.sample(n_points)
+
+        self._update_NROY_gp()
+
+        threshold = self.history_matching[0].threshold
+
+        accepted = np.zeros((0, self.get_n_parameters()))
+        rejected = np.zeros((0, self.get_n_parameters()))
+        rejected_implausibility = np.zeros(0)
+        n_drawn = 0
+
+        while accepted.shape[0] < n_points and n_drawn < self.nroy_max_draws:
+            n_needed = n_points - accepted.shape[0]
+            n_chunk = int(np.ceil(n_needed*(n_drawn + 1)/(accepted.shape[0] + 1)))
+            n_chunk = min(max(n_chunk, n_needed), self.pool_chunk_size, self.nroy_max_draws - n_drawn)
+            chunk = self.base_design.sample(n_chunk)
+            n_drawn = n_drawn + n_chunk
+
+            implausibility = self._get_implausibility(chunk)
+            nroy = (implausibility <= threshold)
+
+            accepted = np.concatenate((accepted, chunk[nroy]))
+            rejected = np.concatenate((rejected, chunk[np.logical_not(nroy)]))
+            rejected_implausibility = np.concatenate((rejected_implausibility,
+                                                      implausibility[np.logical_not(nroy)]))
+
+            if len(rejected_implausibility) > n_points:
+                keep = np.argpartition(rejected_implausibility, n_points - 1)[:n_points]
+                rejected = rejected[keep]
+                rejected_implausibility = rejected_implausibility[keep]
+
+        if accepted.shape[0] < n_points:
+            warnings.warn("only "+str(accepted.shape[0])+" of "+str(n_points)+" points found in the "+
+                          "NROY space after "+str(n_drawn)+" draws, using the least implausible points")
+            n_missing = n_points - accepted.shape[0]
+            keep = np.argsort(rejected_implausibility)[:n_missing]
+            accepted = np.concatenate((accepted, rejected[keep]))
+
+        return accepted[:n_points]
+
+    def _update_NROY_gp(self):
+        """
+        Refit the emulator used to estimate the NROY space if it is out of date
+
+        The emulator is refit (see ``_fit_NROY_gp``) if it has not been fit or if the design has
+        grown by at least ``nroy_refresh`` points since it was last fit.
+
+        :returns: None
+        """
+
+        if self._nroy_gp is None or self.current_iteration - self._nroy_iteration >= self.nroy_refresh:
+            self._nroy_gp = self._fit_NROY_gp()
+            self._nroy_iteration = self.current_iteration
+
+    def _fit_NROY_gp(self):
+        """
+        Fit the emulator used to estimate the NROY space
+
+        Fits a ``GaussianProcess`` (or a ``MultiOutputGP`` for simulations with multiple outputs)
+        to the current design points and targets, using the nugget given to
+        ``set_history_matching``. Subclasses can override this method to pass additional
+        options when fitting the emulator.
+
+        :returns: Fit emulator
+        :rtype: GaussianProcess or MultiOutputGP
+        """
+
+        inputs = self.inputs[:self.current_iteration]
+
+        if len(self._target_shape) == 0:
+            gp = GaussianProcess(inputs, self.targets, self.nroy_nugget)
+        else:
+            gp = MultiOutputGP(inputs, np.transpose(self.targets),
+                               [self.nroy_nugget]*self._target_shape[0])
+        gp.learn_hyperparameters()
+
+        return gp
+
+    def _get_implausibility(self, points):
+        """
+        Compute the implausibility of a set of points
+
+        Predicts the mean and variance of the simulation at the given points with the NROY
+        emulator (without derivatives) and computes the implausibility of each output using
+        ``HistoryMatching.get_implausibility``. For multiple outputs, the implausibility of a
+        point is the largest implausibility of any of its outputs.
+
+        :param points: Points to be tested, with shape ``(n_points, n_parameters)``
+        :type points: ndarray
+        :returns: Implausibility of each point, with shape ``(n_points,)``
+        :rtype: ndarray
+        """
+
+        mean, unc = self._gp_predict(self._nroy_gp, points)
+
+        mean = np.reshape(mean, (len(self.history_matching), points.shape[0]))
+        unc = np.reshape(np.maximum(unc, 0.), (len(self.history_matching), points.shape[0]))
+
+        implausibility = np.zeros(points.shape[0])
+
+        # the predicted variance can vanish if there is no other source of variance, in which
+        # case points are ruled out unless the mean matches the observation exactly
+
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            for hm, output_mean, output_unc in zip(self.history_matching, mean, unc):
+                hm.set_expectations((output_mean, output_unc, None))
+                output_implausibility = np.nan_to_num(hm.get_implausibility(self.nroy_discrepancy),
+                                                      nan = 0., posinf = np.inf)
+                implausibility = np.maximum(implausibility, output_implausibility)
+
+        return implausibility
+
+    def _predict_candidates(self, gp, do_unc = True):
+        """
+        Predict the mean and variance of a GP on all candidate points
+
+        Helper method for metrics that need GP predictions on the candidate points. All candidates
+        are predicted in a single vectorized call without computing derivatives, and the result
+        is cached, so that a metric evaluating candidates one at a time does not repeat the
+        prediction for every candidate. The cached values are reused as long as the same GP
+        (with the same factorization), the same candidate points, and the same pending points
+        are used. If there are pending points (see ``get_pending_point``), the predictions
+        are conditioned on them (see ``_condition_on_pending``).
+
+        :param gp: Fit GP used to make the predictions. Must be a ``GaussianProcess`` instance
+                   (or have an equivalent ``predict`` method).
+        :type gp: GaussianProcess
+        :param do_unc: (optional) Flag indicating if the uncertainties are to be computed.
+                       Default is ``True``.
+        :type do_unc: bool
+        :returns: Tuple holding the mean and variance of the predictions on the candidate
+                  points, each with shape ``(n_cand,)`` (the variance is ``None`` if ``do_unc``
+                  is ``False``)
+        :rtype: tuple
+        """
+
+        assert not self.candidates is None, "candidates must be generated before making predictions"
+
+        cached = getattr(self, "_candidate_predictions", None)
+        key = (gp, getattr(gp, "L", None), self.candidates)
+        if (not cached is None and all(a is b for a, b in zip(cached[0], key)) and
+            cached[1] == tuple(self.pending) and (cached[3] is not None or not do_unc)):
+            return cached[2], cached[3]
+
+        mean, unc = self._gp_predict(self._condition_on_pending(gp), self.candidates, do_unc)
+
+        self._candidate_predictions = (key, tuple(self.pending), mean, unc)
+
+        return mean, unc
+
+    def _gp_predict(self, gp, points, do_unc = True):
+        """
+        Predict the mean and variance of a GP without derivatives
+
+        Internal method used by ``_predict_candidates`` and ``_condition_on_pending`` to make
+        predictions. Subclasses using a different type of emulator can override this to pass
+        additional options to its ``predict`` method.
+
+        :param gp: Fit GP used to make the predictions
+        :type gp: GaussianProcess
+        :param points: Points where predictions are made, with shape ``(n_points, n_parameters)``
+        :type points: ndarray
+        :param do_unc: (optional) Flag indicating if the uncertainties are to be computed.
+                       Default is ``True``.
+        :type do_unc: bool
+        :returns: Tuple holding the mean and variance of the predictions (the variance is
+                  ``None`` if ``do_unc`` is ``False``)
+        :rtype: tuple
+        """
+
+        return gp.predict(points, do_deriv = False, do_unc = do_unc)[:2]
+
+    def _condition_on_pending(self, gp):
+        """
+        Condition a GP on the pending points
+
+        Returns a GP with the same hyperparameters as ``gp`` that also includes the points that
+        are currently being simulated (see ``get_pending_point``). Since their outputs are not
+        yet known, the pending points are given the mean prediction of ``gp`` as targets. This
+        leaves the predicted mean unchanged while reducing the variance near the pending points
+        (the variance of a GP does not depend on the target values), so that metrics based on
+        the predicted variance avoid choosing points close to those already being simulated. If
+        there are no pending points, ``gp`` is returned unchanged.
+
+        :param gp: Fit GP to be conditioned on the pending points
+        :type gp: GaussianProcess
+        :returns: GP conditioned on the pending points
+        :rtype: GaussianProcess
+        """
+
+        if len(self.pending) == 0:
+            return gp
+
+        pending = self.get_pending_points()
+
+        pending_mean = self._gp_predict(gp, pending, do_unc = False)[0]
+
+        gp_pending = GaussianProcess(np.concatenate((gp.inputs, pending)),
+                                     np.concatenate((gp.targets, pending_mean)), gp.nugget)
+        gp_pending._set_params(gp.theta)
+        gp_pending.mle_theta = gp_pending.theta
+
+        return gp_pending
 
     def _eval_metric(self):
         """
@@ -451,7 +1138,26 @@ class SequentialDesign(object):
         """
         raise NotImplementedError("_estimate_next_point not implemented for base SequentialDesign")
 
-    def get_batch_points(self, n_points):
+    def _eval_batch_metric(self, n_points):
+        """
+        Evaluate metric for selecting a batch of points
+
+        Apply the metric used for sequential design to the candidate points and return the indices
+        of ``n_points`` distinct candidates to be run as a batch. This is used by ``get_batch_points``
+        when the ``fixed_hyperparameters`` option is used, and is not implemented for the base
+        class. Subclasses should choose each point in the batch accounting for the points already
+        chosen, without refitting the hyperparameters.
+
+        :param n_points: Number of points in the batch. Must be a positive integer no larger than
+                         ``n_cand``.
+        :type n_points: int
+        :returns: Indices of the chosen candidates, a list or array of ``n_points`` distinct
+                  integers with ``0 <= index < n_cand``
+        :rtype: list or ndarray
+        """
+        raise NotImplementedError("Base class for Sequential Design does not implement a batch evaluation metric")
+
+    def get_batch_points(self, n_points, fixed_hyperparameters = False):
         """
         Batch version of get_next_point for a Sequential Design
 
@@ -462,10 +1168,21 @@ class SequentialDesign(object):
         it instead substitutes the predicted value that is method-specific. This can be
         implemented in a subclass by defining the method ``_estimate_next_target``.
 
+        Since this evaluates the metric (which usually involves fitting a GP) once for each
+        point, large batches can be expensive to choose. If ``fixed_hyperparameters`` is
+        ``True``, the whole batch is instead chosen from a single set of candidates using the
+        method ``_eval_batch_metric``, which subclasses can implement to select all points in
+        the batch while only fitting the hyperparameters once (as in ``MICEDesign``). In this
+        case, the batch size cannot be larger than the number of candidates.
+
         :param n_points: Size of batch to generate for the next set of simulation points.
                          This parameter determines the shape of the output array. Must
                          be a positive integer.
         :type n_points: int
+        :param fixed_hyperparameters: (optional) If ``True``, choose all points in the batch
+                                      with a single evaluation of ``_eval_batch_metric``.
+                                      Default is ``False``.
+        :type fixed_hyperparameters: bool
         :returns: Set of batch points chosen using the batch version of the design
                   as a numpy array with shape ``(n_points, n_parameters)``
         :rtype: ndarray
@@ -473,17 +1190,68 @@ class SequentialDesign(object):
 
         assert n_points > 0, "n_points must be positive"
 
+        if fixed_hyperparameters:
+            return self._get_batch_points_fixed(n_points)
+
         batch_points = np.zeros((n_points, self.get_n_parameters()))
 
-        for i in range(n_points):
-            batch_points[i] = self.get_next_point()
-            next_target = self._estimate_next_target(batch_points[i])
-            self.set_next_target(next_target)
+        # estimated targets are not recorded in the journal
+
+        self._journal_paused = True
+
+        try:
+            for i in range(n_points):
+                batch_points[i] = self.get_next_point()
+                next_target = self._estimate_next_target(batch_points[i])
+                self.set_next_target(next_target)
+        finally:
+            self._journal_paused = False
 
         self.current_iteration = self.current_iteration - n_points
         new_targets = np.array(self.targets[:self.current_iteration])
         self.targets = np.array(new_targets)
 
+        self._write_journal()
+
+        return batch_points
+
+    def _get_batch_points_fixed(self, n_points):
+        """
+        Choose a batch of points with a single evaluation of the batch metric
+
+        Internal method implementing ``get_batch_points`` when ``fixed_hyperparameters`` is
+        ``True``. Generates a single set of candidates, uses ``_eval_batch_metric`` to choose
+        the indices of the candidates in the batch, and updates the ``inputs`` array.
+
+        :param n_points: Size of batch. Must be a positive integer no larger than ``n_cand``.
+        :type n_points: int
+        :returns: Batch points as a numpy array with shape ``(n_points, n_parameters)``
+        :rtype: ndarray
+        """
+
+        assert n_points <= self.n_cand, "n_points cannot be larger than n_cand when using fixed hyperparameters"
+
+        if self.inputs is None:
+            raise ValueError("Initial design has not been generated")
+        else:
+            assert self.inputs.shape == (self.current_iteration, self.get_n_parameters()), "inputs have not been correctly updated"
+
+        if self.targets is None:
+            raise ValueError("Initial targets have not been generated")
+        else:
+            assert self.targets.shape == (self.current_iteration,) + self._target_shape, "targets have not been correctly updated"
+
+        self._generate_candidates()
+        batch_indices = np.array(self._eval_batch_metric(n_points), dtype = int)
+
+        assert batch_indices.shape == (n_points,), "bad number of batch points from _eval_batch_metric"
+        assert len(np.unique(batch_indices)) == n_points, "batch points must be distinct"
+
+        batch_points = np.array(self.candidates[batch_indices,:])
+
+        self.inputs = np.concatenate((self.inputs, batch_points))
+        self._write_journal()
+
         return batch_points
 
     def get_next_point(self):
@@ -508,7 +1276,7 @@ class SequentialDesign(object):
         if self.targets is None:
             raise ValueError("Initial targets have not been generated")
         else:
-            assert self.targets.shape == (self.current_iteration,), "targets have not been correctly updated"
+            assert self.targets.shape == (self.current_iteration,) + self._target_shape, "targets have not been correctly updated"
 
         self._generate_candidates()
         next_index = self._eval_metric()
@@ -520,53 +1288,141 @@ class SequentialDesign(object):
         new_inputs[-1,:] = next_point
 
         self.inputs = np.array(new_inputs)
+        self._write_journal()
 
         return next_point
 
-    def set_batch_targets(self, new_targets):
+    def get_pending_points(self):
         """
-        Batch version of set_next_target for a Sequential Design
+        Get the points that are currently pending
 
-        This method updates the targets array for a batch set of simulations. The input
-        array must have shape ``(n_points,)``, where ``n_points`` is the number of points
-        selected when calling ``get_batch_points``. Disagreement between these two values
-        will result in an error.
+        Returns the design points that have been chosen using ``get_pending_point`` but whose
+        simulation results have not yet been provided using ``set_pending_target``.
 
-        :param new_targets: Array holding results from the simulations. Must be an array
-                            of shape ``(n_points,)``, where ``n_points`` is set when
-                            calling ``get_batch_points``
-        :type new_targets: ndarray
-        :returns: None
+        :returns: Pending design points as a numpy array with shape ``(n_pending, n_parameters)``
+        :rtype: ndarray
         """
+
+        return np.reshape(np.array(list(self.pending.values())),
+                          (len(self.pending), self.get_n_parameters()))
+
+    def get_pending_point(self):
+        """
+        Choose the next point for an asynchronous design
+
+        Asynchronous version of ``get_next_point``, used when several simulations are run at the
+        same time and finish in an arbitrary order. The next point is chosen by evaluating the
+        candidates using the completed design points, with the predictions of the GP
+        conditioned on the points that are still being simulated through their reduction of
+        the variance (see ``_condition_on_pending``). This avoids refitting the GP with
+        estimated targets as in ``get_batch_points``. The new point is added to the pending
+        points (rather than to ``inputs``) and the method returns it along with an integer
+        label, which is used to provide the simulation result with ``set_pending_target``
+        once it is available. Any number of points can be pending at once.
+
+        Note that the metric used to choose the next point must use ``_predict_candidates``
+        in order to account for the pending points (as is the case for ``MICEDesign``).
+
+        :returns: Tuple holding the label of the new point (an integer) and the new design
+                  point (a 1D numpy array of length ``n_parameters``)
+        :rtype: tuple
+        """
+
         if self.inputs is None:
             raise ValueError("Initial design has not been generated")
         else:
-            n_points = self.inputs.shape[0] - self.current_iteration
-            assert self.inputs.shape == (self.current_iteration + n_points, self.get_n_parameters()), "inputs have not been correctly updated"
+            assert self.inputs.shape == (self.current_iteration, self.get_n_parameters()), "inputs have not been correctly updated"
 
         if self.targets is None:
             raise ValueError("Initial targets have not been generated")
         else:
-            assert self.targets.shape == (self.current_iteration,), "targets have not been correctly updated"
+            assert self.targets.shape == (self.current_iteration,) + self._target_shape, "targets have not been correctly updated"
 
-        new_targets = np.atleast_1d(np.array(new_targets))
-        new_targets = np.reshape(new_targets, (len(new_targets),))
-        assert new_targets.shape == (n_points,), "new targets must have length n_points"
+        self._generate_candidates()
+        next_index = self._eval_metric()
 
-        updated_targets = np.empty((self.current_iteration + n_points,))
-        updated_targets[:-n_points] = self.targets
-        updated_targets[-n_points:] = np.array(new_targets)
+        next_point = np.array(self.candidates[next_index,:])
 
-        self.targets = np.array(updated_targets)
-        self.current_iteration = self.current_iteration + n_points
+        label = self._next_label
+        self._next_label = self._next_label + 1
 
-    def set_next_target(self, target):
+        self.pending[label] = next_point
+
+        return label, next_point
+
+    def set_pending_target(self, label, target):
         """
-        Set value of next target
+        Set the target value of a pending point
 
-        Updates the target array with the correct value (from running the actual simulation) of the
-        latest design point determined using ``get_next_point``. The target input must be a float
-        or an array of length 1. The code internally checks the inputs and targets for any problems
+        Provides the simulation result for a point chosen using ``get_pending_point``, identified
+        by its label. Results can be provided in any order. The point is removed from the pending
+        points and appended to the inputs, the target is appended to the targets, and the number
+        of iterations is incremented.
+
+        :param label: Label of the pending point, as returned by ``get_pending_point``
+        :type label: int
+        :param target: Result of evaluating the simulation on the pending point
+        :type target: float or length 1 array
+        :returns: None
+        :rtype: None
+        """
+
+        assert label in self.pending, "label does not correspond to a pending point"
+        assert self.inputs.shape == (self.current_iteration, self.get_n_parameters()), "inputs have not been correctly updated"
+        assert self.targets.shape == (self.current_iteration,) + self._target_shape, "targets have not been correctly updated"
+
+        target = self._reshape_targets(target, 1, "new target must have length 1")
+
+        next_point = self.pending.pop(label)
+
+        self.inputs = np.concatenate((self.inputs, np.reshape(next_point, (1, self.get_n_parameters()))))
+        self.targets = np.concatenate((self.targets, target))
+        self.current_iteration = self.current_iteration + 1
+        self._write_journal()
+
+    def set_batch_targets(self, new_targets):
+        """
+        Batch version of set_next_target for a Sequential Design
+
+        This method updates the targets array for a batch set of simulations. The input
+        array must have shape ``(n_points,)``, where ``n_points`` is the number of points
+        selected when calling ``get_batch_points``. Disagreement between these two values
+        will result in an error.
+
+        :param new_targets: Array holding results from the simulations. Must be an array
+                            of shape ``(n_points,)``, where ``n_points`` is set when
+                            calling ``get_batch_points``
+        :type new_targets: ndarray
+        :returns: None
+        """
+        if self.inputs is None:
+            raise ValueError("Initial design has not been generated")
+        else:
+            n_points = self.inputs.shape[0] - self.current_iteration
+            assert self.inputs.shape == (self.current_iteration + n_points, self.get_n_parameters()), "inputs have not been correctly updated"
+
+        if self.targets is None:
+            raise ValueError("Initial targets have not been generated")
+        else:
+            assert self.targets.shape == (self.current_iteration,) + self._target_shape, "targets have not been correctly updated"
+
+        new_targets = self._reshape_targets(new_targets, n_points, "new targets must have length n_points")
+
+        updated_targets = np.empty((self.current_iteration + n_points,) + self._target_shape)
+        updated_targets[:-n_points] = self.targets
+        updated_targets[-n_points:] = np.array(new_targets)
+
+        self.targets = np.array(updated_targets)
+        self.current_iteration = self.current_iteration + n_points
+        self._write_journal()
+
+    def set_next_target(self, target):
+        """
+        Set value of next target
+
+        Updates the target array with the correct value (from running the actual simulation) of the
+        latest design point determined using ``get_next_point``. The target input must be a float
+        or an array of length 1. The code internally checks the inputs and targets for any problems
         that may have occurred in updating them correctly, and if all is well then updates the
         target array and increments the number of iterations. If the design has not been
         correctly initialized, or ``get_next_point`` has not been previously run, this method
@@ -587,18 +1443,17 @@ class SequentialDesign(object):
         if self.targets is None:
             raise ValueError("Initial targets have not been generated")
         else:
-            assert self.targets.shape == (self.current_iteration,), "targets have not been correctly updated"
+            assert self.targets.shape == (self.current_iteration,) + self._target_shape, "targets have not been correctly updated"
 
-        target = np.atleast_1d(np.array(target))
-        target = np.reshape(target, (len(target),))
-        assert target.shape == (1,), "new target must have length 1"
+        target = self._reshape_targets(target, 1, "new target must have length 1")
 
-        new_targets = np.empty((self.current_iteration + 1,))
+        new_targets = np.empty((self.current_iteration + 1,) + self._target_shape)
         new_targets[:-1] = self.targets
         new_targets[-1] = np.array(target)
 
         self.targets = np.array(new_targets)
         self.current_iteration = self.current_iteration + 1
+        self._write_journal()
 
     def run_next_point(self):
         """
@@ -621,7 +1476,38 @@ class SequentialDesign(object):
         next_target = np.array(self.f(next_point))
         self.set_next_target(next_target)
 
-    def run_sequential_design(self, n_samples = None):
+    def run_batch_points(self, n_points, executor = None, fixed_hyperparameters = False):
+        """
+        Perform one batch of the sequential design process
+
+        Batch version of ``run_next_point``. Chooses ``n_points`` new design points using
+        ``get_batch_points``, evaluates the bound function on all of them, and then updates the
+        targets using ``set_batch_targets``. If an ``executor`` is provided (see
+        ``run_initial_design``), the simulations in the batch are run concurrently.
+
+        :param n_points: Size of batch to run. Must be a positive integer.
+        :type n_points: int
+        :param executor: (optional) Executor used to run the simulations concurrently. Default
+                         is ``None`` (run the simulations serially).
+        :type executor: concurrent.futures.Executor or None
+        :param fixed_hyperparameters: (optional) If ``True``, choose the batch with a single fit
+                                      of the hyperparameters (see ``get_batch_points``).
+                                      Default is ``False``.
+        :type fixed_hyperparameters: bool
+        :returns: None
+        :rtype: None
+        """
+
+        assert self.has_function(), "Design must have a bound function to use run_batch_points"
+
+        batch_points = self.get_batch_points(n_points, fixed_hyperparameters)
+        batch_targets = self._run_simulations(batch_points, executor)
+
+        assert np.all(np.isfinite(batch_targets)), "error in running batch, function outputs may not be the correct shape"
+        self.set_batch_targets(batch_targets)
+
+    def run_sequential_design(self, n_samples = None, batch_size = 1, executor = None,
+                              fixed_hyperparameters = False):
         """
         Run the entire sequential design
 
@@ -635,13 +1521,27 @@ class SequentialDesign(object):
 
         Internally, this method is a wrapper to ``run_initial_design`` and then calling
         ``run_next_point`` a total of ``n_samples`` times. Note that this means that the total
-        number of design points is ``n_init + n_samples``.
+        number of design points is ``n_init + n_samples``. If ``batch_size`` is larger than 1,
+        the sequential points are instead chosen in batches using ``run_batch_points`` (the final
+        batch is smaller if ``batch_size`` does not divide ``n_samples``). If an ``executor`` is
+        provided, the simulations in the initial design and in each batch are run concurrently
+        (see ``run_initial_design``). If ``fixed_hyperparameters`` is ``True``, each batch is
+        chosen with a single fit of the hyperparameters (see ``get_batch_points``).
 
         :param n_samples: Number of sequential design steps to be run. Optional if the number was
                           specified upon initialization. Default is ``None`` (default to number
                           set when initializing). If numbers are provided on both occasions, the
                           number set here is used. If a number is provided, must be non-negative.
         :type n_samples: int or None
+        :param batch_size: (optional) Number of points chosen and run together in each step.
+                           Must be a positive integer. Default is 1.
+        :type batch_size: int
+        :param executor: (optional) Executor used to run the simulations concurrently. Default
+                         is ``None`` (run the simulations serially).
+        :type executor: concurrent.futures.Executor or None
+        :param fixed_hyperparameters: (optional) If ``True``, choose each batch with a single
+                                      fit of the hyperparameters. Default is ``False``.
+        :type fixed_hyperparameters: bool
         :returns: None
         :rtype: None
         """
@@ -657,11 +1557,81 @@ class SequentialDesign(object):
             n_iter = n_samples
 
         assert n_iter >= 0, "number of samples must be non-negative"
+        assert int(batch_size) > 0, "batch_size must be a positive integer"
+        batch_size = int(batch_size)
+
+        self.run_initial_design(executor)
+
+        if batch_size == 1:
+            for i in range(n_iter):
+                self.run_next_point()
+        else:
+            for i in range(0, n_iter, batch_size):
+                self.run_batch_points(min(batch_size, n_iter - i), executor, fixed_hyperparameters)
+
+    def run_async_design(self, executor, n_samples = None, max_pending = 2):
+        """
+        Run the entire sequential design asynchronously
+
+        Asynchronous version of ``run_sequential_design``, which keeps up to ``max_pending``
+        simulations running at all times. The initial design is run with ``executor``, and then
+        ``max_pending`` points are chosen using ``get_pending_point`` and submitted. Whenever a
+        simulation finishes, its result is added to the design with ``set_pending_target`` and a
+        new point is chosen (conditioned on the simulations that are still running) and
+        submitted, until ``n_samples`` sequential points have been run. This keeps the workers
+        busy when the simulation times vary. Since the results are added in the order that the
+        simulations finish, the order of the design points may not be reproducible.
+
+        :param executor: Executor used to run the simulations (any object with a ``submit``
+                         method following ``concurrent.futures.Executor``). With a process
+                         based executor, the bound function must be picklable.
+        :type executor: concurrent.futures.Executor
+        :param n_samples: Number of sequential design points to be run. Optional if the number
+                          was specified upon initialization (see ``run_sequential_design``).
+        :type n_samples: int or None
+        :param max_pending: (optional) Maximum number of simulations that are run at the same
+                            time. Must be a positive integer, and is typically the number of
+                            workers of the executor. Default is 2.
+        :type max_pending: int
+        :returns: None
+        :rtype: None
+        """
 
-        self.run_initial_design()
+        assert self.has_function(), "Design must have a bound function to use run_async_design"
+        assert hasattr(executor, "submit"), "executor must have a submit method"
 
-        for i in range(n_iter):
-            self.run_next_point()
+        if n_samples is None and self.n_samples is None:
+            raise ValueError("must specify n_samples either when initializing or calling run_async_design")
+
+        if n_samples is None:
+            n_iter = self.n_samples
+        else:
+            n_iter = n_samples
+
+        assert n_iter >= 0, "number of samples must be non-negative"
+        assert int(max_pending) > 0, "max_pending must be a positive integer"
+
+        self.run_initial_design(executor)
+
+        futures = {}
+        n_submitted = 0
+
+        try:
+            while n_submitted < n_iter or len(futures) > 0:
+                while n_submitted < n_iter and len(futures) < int(max_pending):
+                    label, next_point = self.get_pending_point()
+                    futures[executor.submit(self.f, next_point)] = label
+                    n_submitted = n_submitted + 1
+
+                done, _ = wait(futures, return_when = FIRST_COMPLETED)
+
+                for future in done:
+                    label = futures.pop(future)
+                    self.set_pending_target(label, future.result())
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
 
     def __str__(self):
         """
@@ -715,7 +1685,9 @@ class MICEFastGP(GaussianProcess):
 
         The method requires a fit GP, and the index of the input point that is to be excluded.
         The method then corrects the GP fit and computes the uncertainty of the prediction
-        on the excluded point returning the uncertainty as a float.
+        on the excluded point returning the uncertainty as a float. The uncertainties for all
+        points are computed together the first time this method is called for a given fit
+        (see ``fast_predict_all``) and are reused for subsequent calls.
 
         :param index: Index of input point to be excluded in the fit and to which the prediction
                       will be applied. Must be an integer with 0 <= index < n (where n is the number
@@ -729,21 +1701,127 @@ class MICEFastGP(GaussianProcess):
         index = int(index)
         assert index >= 0 and index < self.n, "index must be 0 <= index < n"
 
-        indices = (np.arange(self.n) != index)
+        return self.fast_predict_all()[index:index + 1]
 
-        exp_theta = np.exp(self.theta)
+    def fast_predict_all(self):
+        r"""
+        Make fast predictions for every input point, each excluding that point from the fit
 
-        Ktest = self.kernel.kernel_f(np.reshape(self.inputs[indices,:], (self.n - 1, self.D)),
-                                     np.reshape(self.inputs[index, :], (1, self.D)), self.theta)
+        Computes the uncertainty that ``fast_predict`` gives for every index at once. Rather than
+        correcting the fit separately for each excluded point, this uses the fact that for the
+        covariance matrix :math:`Q` (including the nugget), the variance of the prediction at
+        point :math:`i` made using all other points is
 
-        invQ = np.linalg.solve(self.L.T, np.linalg.solve(self.L, np.eye(self.n)))
-        invQ_mod = (invQ[indices][:, indices] -
-                    1./invQ[index, index]*np.outer(invQ[indices, index], invQ[indices, index]))
+        .. math::
+            \sigma_i^2 = \frac{1}{(Q^{-1})_{ii}} - (Q_{ii} - \sigma^2)
 
-        var = np.maximum(exp_theta[self.D] - np.sum(Ktest * np.dot(invQ_mod, Ktest), axis=0), 0.)
+        where :math:`\sigma^2` is the covariance scale and :math:`Q_{ii} - \sigma^2` is the
+        nugget added to the diagonal. Only the diagonal of the inverse is needed, which is
+        found from a single triangular solve with the Cholesky factor, so the cost of
+        evaluating all points is O(n^3) rather than O(n^4) when correcting the fit for each
+        point in turn. The result is cached and reused until the parameters are changed.
+
+        :returns: Array of shape ``(n,)`` holding the uncertainty in the corrected fit applied
+                  to each point
+        :rtype: ndarray
+        """
+
+        cached = getattr(self, "_fast_predict_cache", None)
+        if not cached is None and cached[0] is self.L:
+            return cached[1]
+
+        invL = linalg.solve_triangular(self.L, np.eye(self.n), lower = True)
+        diag_invQ = np.sum(invL**2, axis = 0)
+        nugget = np.sum(self.L**2, axis = 1) - np.exp(self.theta[self.D])
+
+        var = np.maximum(1./diag_invQ - nugget, 0.)
+
+        self._fast_predict_cache = (self.L, var)
 
         return var
 
+    def remove_point(self, index):
+        """
+        Remove an input point from the fit without refactorizing the covariance matrix
+
+        Removes the point with the given index from the inputs and targets and updates the
+        Cholesky factor of the covariance matrix (with the current hyperparameters) to exclude
+        that point. The rows and columns of the factor before the removed point are unchanged,
+        and the factor of the remaining block is found with a rank one update, so this requires
+        O(n^2) operations rather than the O(n^3) needed to factorize the matrix again.
+
+        :param index: Index of the point to be removed. Must be an integer with 0 <= index < n.
+        :type index: int
+        :returns: None
+        """
+
+        index = int(index)
+        assert index >= 0 and index < self.n, "index must be 0 <= index < n"
+        assert self.n > 1, "cannot remove the only input point"
+
+        L = np.zeros((self.n - 1, self.n - 1))
+        L[:index, :index] = self.L[:index, :index]
+        L[index:, :index] = self.L[index + 1:, :index]
+        L[index:, index:] = _cholesky_update(self.L[index + 1:, index + 1:], self.L[index + 1:, index])
+
+        indices = (np.arange(self.n) != index)
+
+        self.inputs = self.inputs[indices]
+        self.targets = self.targets[indices]
+        self.n = self.n - 1
+
+        self._update_factorization(L)
+
+    def add_point(self, point, target = 1.):
+        """
+        Add an input point to the fit without refactorizing the covariance matrix
+
+        Appends a new point to the inputs and targets and extends the Cholesky factor of the
+        covariance matrix (with the current hyperparameters) by one row, which requires O(n^2)
+        operations. The nugget added to the diagonal for the new point is the same as for the
+        existing points.
+
+        :param point: New input point, an array of shape ``(D,)``
+        :type point: ndarray
+        :param target: (optional) Target value for the new point. Default is 1.
+        :type target: float
+        :returns: None
+        """
+
+        point = np.reshape(np.array(point, dtype = float), (1, self.D))
+
+        Ktest = self.kernel.kernel_f(self.inputs, point, self.theta)[:, 0]
+        diag = np.sum(self.L[0]**2)
+
+        invL_Ktest = linalg.solve_triangular(self.L, Ktest, lower = True)
+        new_diag = diag - np.sum(invL_Ktest**2)
+
+        if not new_diag > 0.:
+            raise LinAlgError("covariance matrix is not positive definite after adding point")
+
+        L = np.zeros((self.n + 1, self.n + 1))
+        L[:-1, :-1] = self.L
+        L[-1, :-1] = invL_Ktest
+        L[-1, -1] = np.sqrt(new_diag)
+
+        self.inputs = np.concatenate((self.inputs, point))
+        self.targets = np.append(self.targets, float(target))
+        self.n = self.n + 1
+
+        self._update_factorization(L)
+
+    def _update_factorization(self, L):
+        """
+        Set a new Cholesky factor and recompute the quantities that depend on it
+
+        :param L: Lower triangular Cholesky factor of the covariance matrix
+        :type L: ndarray
+        :returns: None
+        """
+
+        self._set_factorization(self.theta, L, linalg.cho_solve((L, True), self.targets),
+                                2.0*np.sum(np.log(np.diag(L))))
+
 class MICEDesign(SequentialDesign):
     """
     Class representing a Mutual Information for Computer Experiments (MICE) sequential
@@ -769,9 +1847,17 @@ class MICEDesign(SequentialDesign):
     sequential design. The implementation adds methods for querying the nugget parameters
     and an additional helper function for computing the Mutual Information criterion, but
     other methods are identical.
+
+    Fitting the GP on the candidates at each step can be avoided by keeping the candidates for
+    several iterations (``candidate_refresh``) and reusing the candidate GP when the
+    hyperparameters have changed by at most ``theta_tol``. The reuse only takes effect if both
+    ``candidate_refresh > 1`` and ``theta_tol > 0``: with the defaults, a new set of candidates
+    is drawn at every step, and since the hyperparameters are refit at every step they are
+    almost never exactly unchanged, so a tolerance of zero means the candidate GP is always fit
+    again.
     """
     def __init__(self, base_design, f = None, n_samples = None, n_init = 10, n_cand = 50,
-                 nugget = None, nugget_s = 1.):
+                 nugget = None, nugget_s = 1., n_pool = None, candidate_refresh = 1, theta_tol = 0.):
         """
         Create new instance of a MICE sequential design
 
@@ -810,6 +1896,25 @@ class MICEDesign(SequentialDesign):
         :param nugget_s: Smoothing nugget parameter for smoothing the predictions on the candidate space.
                          Must be a non-negative float. Default value is 1.
         :type nugget_s: float
+        :param n_pool: Number of points drawn from the base design at each step, from which the
+                       ``n_cand`` candidates are selected (see ``SequentialDesign``). Optional, default
+                       value is ``None`` (draw ``n_cand`` candidates directly).
+        :type n_pool: int or None
+        :param candidate_refresh: Number of iterations for which the same set of candidates is used.
+                                  If larger than 1, the candidates are kept between iterations
+                                  (candidates that are chosen as design points are replaced with new
+                                  draws from the base design) so that the factorization of the
+                                  candidate GP can be reused (see ``_generate_candidates``), which
+                                  also requires ``theta_tol > 0``. Must be a positive integer.
+                                  Optional, default value is 1 (draw new candidates at every
+                                  iteration).
+        :type candidate_refresh: int
+        :param theta_tol: Tolerance on the change in the hyperparameters below which the candidate GP
+                          from the previous iteration is reused when the candidates are kept. Must be a
+                          non-negative float. Has no effect unless ``candidate_refresh > 1``. Optional,
+                          default value is 0 (only reuse the candidate GP if the hyperparameters are
+                          exactly unchanged, which rarely happens after refitting).
+        :type theta_tol: float
         """
 
         if not nugget is None:
@@ -819,13 +1924,22 @@ class MICEDesign(SequentialDesign):
         if nugget_s < 0.:
             raise ValueError("nugget smoothing parameter cannot be negative")
 
+        if int(candidate_refresh) <= 0:
+            raise ValueError("number of iterations between refreshing candidates must be positive")
+
+        if theta_tol < 0.:
+            raise ValueError("hyperparameter tolerance cannot be negative")
+
         if nugget is None:
             self.nugget = nugget
         else:
             self.nugget = float(nugget)
         self.nugget_s = float(nugget_s)
+        self.candidate_refresh = int(candidate_refresh)
+        self.theta_tol = float(theta_tol)
+        self._candidate_age = 0
 
-        super().__init__(base_design, f, n_samples, n_init, n_cand)
+        super().__init__(base_design, f, n_samples, n_init, n_cand, n_pool)
 
     def get_nugget(self):
         """
@@ -856,6 +1970,114 @@ class MICEDesign(SequentialDesign):
         """
         return self.nugget_s
 
+    def get_candidate_refresh(self):
+        """
+        Get number of iterations for which the same candidates are used
+
+        :returns: Number of iterations between drawing a new set of candidates
+        :rtype: int
+        """
+        return self.candidate_refresh
+
+    def get_theta_tol(self):
+        """
+        Get tolerance on the hyperparameters for reusing the candidate GP
+
+        :returns: Largest change in any hyperparameter for which the candidate GP is reused
+        :rtype: float
+        """
+        return self.theta_tol
+
+    def _generate_candidates(self):
+        """
+        Generate candidates for next iteration of a MICE design
+
+        If ``candidate_refresh`` is 1, a new set of candidates is drawn at each iteration (see
+        ``SequentialDesign._generate_candidates``). Otherwise, a new set is only drawn every
+        ``candidate_refresh`` iterations. In between, the candidates are kept, except that any
+        candidates that have since become design points (or pending points) are removed and
+        replaced by new points drawn from the base design (see ``_sample_candidates``). The candidate GP is updated for these
+        changes without refactorizing its covariance matrix (see ``MICEFastGP.remove_point``
+        and ``MICEFastGP.add_point``), so that it can be reused when the hyperparameters have
+        not changed by more than ``theta_tol``.
+
+        :returns: None
+        :rtype: None
+        """
+
+        if self.candidates is None or self._candidate_age >= self.candidate_refresh:
+            super()._generate_candidates()
+            self._candidate_age = 1
+            return
+
+        design = self.get_pending_points()
+        if not self.inputs is None:
+            design = np.concatenate((self.inputs, design))
+        design_points = set(point.tobytes() for point in design)
+
+        used = [i for i in range(self.candidates.shape[0]) if self.candidates[i].tobytes() in design_points]
+
+        if len(used) > 0:
+            new_points = self._sample_candidates(len(used))
+
+            for gp_fast in self._candidate_gps():
+                if gp_fast.n == self.candidates.shape[0] and np.array_equal(gp_fast.inputs, self.candidates):
+                    try:
+                        for index in reversed(used):
+                            gp_fast.remove_point(index)
+                        for point in new_points:
+                            gp_fast.add_point(point)
+                    except LinAlgError:
+                        pass
+
+            self.candidates = np.concatenate((np.delete(self.candidates, used, axis = 0), new_points))
+
+        self._candidate_age = self._candidate_age + 1
+        self._write_journal()
+
+    def _candidate_gps(self):
+        """
+        Returns a list of the current candidate GPs
+
+        :returns: List of ``MICEFastGP`` instances (empty if no candidate GP has been fit)
+        :rtype: list
+        """
+
+        gp_fast = getattr(self, "gp_fast", None)
+
+        if gp_fast is None:
+            return []
+        elif isinstance(gp_fast, list):
+            return gp_fast
+        else:
+            return [gp_fast]
+
+    def _candidate_gp(self, theta, gp_fast = None):
+        """
+        Fit the candidate GP for a set of hyperparameters, reusing an existing fit if possible
+
+        Returns ``gp_fast`` if it was fit to the current candidates and its hyperparameters
+        differ from ``theta`` by no more than ``theta_tol``. Otherwise, fits a new ``MICEFastGP``
+        to the candidates using ``theta``.
+
+        :param theta: Hyperparameters of the base GP
+        :type theta: ndarray
+        :param gp_fast: (optional) Candidate GP from a previous iteration. Default is ``None``.
+        :type gp_fast: MICEFastGP or None
+        :returns: Candidate GP
+        :rtype: MICEFastGP
+        """
+
+        if (isinstance(gp_fast, MICEFastGP) and gp_fast.n == self.candidates.shape[0] and
+            np.array_equal(gp_fast.inputs, self.candidates) and
+            np.max(np.abs(gp_fast.theta - theta)) <= self.theta_tol):
+            return gp_fast
+
+        gp_fast = MICEFastGP(self.candidates, np.ones(self.n_cand), np.exp(theta[-1])*self.nugget_s)
+        gp_fast._set_params(theta)
+
+        return gp_fast
+
     def _estimate_next_target(self, next_point):
         """
         Estimate value of simulator for a point in a MICE design
@@ -887,7 +2109,9 @@ class MICEDesign(SequentialDesign):
         via the Woodbury matrix identity), and then computing the MICE criterion based on
         the predictions of the base GP on the point and the corrected GP fit. The MICE
         criterion is then the variance of the base GP divided by the variance of the corrected
-        candidate GP. Value returned is the MICE criterion for the point in question.
+        candidate GP. Value returned is the MICE criterion for the point in question. The
+        variances of the base GP are predicted on all candidates together the first time this
+        is called (see ``_predict_candidates``) and reused for the other candidates.
 
         :param data_point: Index of the candidate point under consideration. Must be an integer
                            with ``0 <= index < n_cand``.
@@ -900,7 +2124,7 @@ class MICEDesign(SequentialDesign):
 
         assert data_point >= 0 and data_point < self.n_cand, "test point index is out of range"
 
-        _, unc1, _ = self.gp.predict(self.candidates[data_point], do_unc = True)
+        unc1 = self._predict_candidates(self.gp)[1][data_point]
         unc2 = self.gp_fast.fast_predict(data_point)
 
         mice_criter =  unc1/unc2
@@ -909,6 +2133,159 @@ class MICEDesign(SequentialDesign):
 
         return float(mice_criter)
 
+    def _MICE_criteria(self):
+        """
+        Compute the MICE criterion for all candidate points
+
+        This internal method computes the same values as ``_MICE_criterion`` for every candidate
+        point at once. The variance of the base GP is predicted on all candidates in a single
+        call, and the variances of the corrected candidate GP are found for all candidates from
+        a single factorization (see ``MICEFastGP.fast_predict_all``). This reduces the cost of
+        evaluating the criterion from O(n_cand^4) to O(n_cand^3), allowing much larger numbers
+        of candidate points to be used.
+
+        :returns: Array of shape ``(n_cand,)`` holding the MICE criterion for each candidate point
+        :rtype: ndarray
+        """
+
+        _, unc1 = self._predict_candidates(self.gp)
+        unc2 = self.gp_fast.fast_predict_all()
+
+        mice_criter = unc1/unc2
+
+        assert np.all(np.isfinite(mice_criter)), "error in computing MICE critera"
+
+        return mice_criter
+
+    def _fit_MICE_gps(self):
+        """
+        Fit the GPs used to compute the MICE criterion
+
+        This internal method fits a base GP to all points in the current design, and then fits a
+        dummy GP to all candidate design points using the parameter values determined from the
+        base GP fit (setting the ``gp`` and ``gp_fast`` attributes). The candidate GP from the
+        previous iteration is reused if possible (see ``_candidate_gp``). The fits are retried
+        (up to 10 times) if either fails.
+
+        :returns: None
+        """
+
+        numtries = 10
+
+        for i in range(numtries):
+            try:
+                self.gp = GaussianProcess(self.inputs, self.targets, self.nugget)
+                self.gp.learn_hyperparameters()
+
+                self.gp_fast = self._candidate_gp(self.gp.theta, getattr(self, "gp_fast", None))
+                break
+            except FloatingPointError:
+                if i < numtries - 1:
+                    continue
+                else:
+                    raise FloatingPointError("Unable to find parameters suitable for both GPs")
+            except LinAlgError:
+                if i < numtries - 1:
+                    continue
+                else:
+                    raise LinAlgError("Unable to find parameters suitable for both GPs")
+
+    def _eval_batch_metric(self, n_points):
+        r"""
+        Choose a batch of candidate points using the MICE criterion with fixed hyperparameters
+
+        This internal method chooses ``n_points`` candidates one at a time using the MICE
+        criterion, fitting the base and candidate GPs only once for the whole batch. After each
+        point is chosen, the predictive covariance of the base GP over the candidates is updated
+        to account for that point being added to the design, using the rank one update
+
+        .. math::
+            \Sigma \leftarrow \Sigma - \frac{\Sigma_{:,j} \Sigma_{j,:}}{\Sigma_{jj} + \nu}
+
+        where :math:`j` is the chosen candidate and :math:`\nu` is the nugget of the base GP.
+        This is equivalent to conditioning the base GP on the chosen point with fixed
+        hyperparameters (the variance does not depend on the unknown target value), but costs
+        O(n_cand^2) operations per point rather than a new fit. The variances of the candidate
+        GP do not depend on the design points, so they are computed once. If the criterion is
+        combines terms for several emulators (see ``_batch_metric_terms`` and
+        ``_aggregate_criteria``), the covariance of each emulator is updated in the same way.
+
+        :param n_points: Number of points in the batch. Must be a positive integer no larger
+                         than ``n_cand``.
+        :type n_points: int
+        :returns: Indices of the chosen candidates, an array of ``n_points`` distinct integers
+        :rtype: ndarray
+        """
+
+        n_points = int(n_points)
+        assert n_points > 0 and n_points <= self.n_cand, "n_points must be a positive integer no larger than n_cand"
+
+        self._fit_MICE_gps()
+
+        gps, scales = self._batch_metric_terms()
+        scales = np.broadcast_to(scales, (len(gps), self.n_cand))
+
+        covs = []
+        nuggets = []
+
+        for gp in gps:
+            nuggets.append(np.sum(gp.L[0]**2) - np.exp(gp.theta[gp.D]))
+            Kcand = gp.kernel.kernel_f(self.candidates, self.candidates, gp.theta)
+            invL_Ktest = linalg.solve_triangular(gp.L, gp.kernel.kernel_f(gp.inputs, self.candidates, gp.theta),
+                                                 lower = True)
+            covs.append(Kcand - np.dot(invL_Ktest.T, invL_Ktest))
+
+        batch_indices = []
+
+        for i in range(n_points):
+            mice_criter = self._aggregate_criteria([np.maximum(np.diag(cov), 0.)/scale
+                                                    for cov, scale in zip(covs, scales)])
+            assert np.all(np.isfinite(mice_criter)), "error in computing MICE critera"
+            mice_criter[batch_indices] = -np.inf
+
+            next_index = int(np.argmax(mice_criter))
+            batch_indices.append(next_index)
+
+            for cov, nugget in zip(covs, nuggets):
+                cov_next = np.array(cov[:, next_index])
+                cov -= np.outer(cov_next, cov_next)/(cov_next[next_index] + nugget)
+
+        return np.array(batch_indices)
+
+    def _batch_metric_terms(self):
+        """
+        Return the GPs and scales used to choose a batch of points
+
+        Internal method used by ``_eval_batch_metric``. The criterion for a batch combines (see
+        ``_aggregate_criteria``) the variance of each of the returned GPs (which is updated as
+        points are chosen) divided by the corresponding scale. For the MICE criterion, this is
+        the base GP (conditioned on any pending points) divided by the variance of the
+        candidate GP.
+
+        :returns: Tuple holding a list of GPs and an array of scales that can be broadcast to
+                  shape ``(n_gps, n_cand)``
+        :rtype: tuple
+        """
+
+        return [self._condition_on_pending(self.gp)], self.gp_fast.fast_predict_all()[None, :]
+
+    def _aggregate_criteria(self, criteria):
+        """
+        Combine the criteria computed with several GPs into a single criterion
+
+        Internal method used to combine the terms returned by ``_batch_metric_terms``. The
+        base implementation adds the terms together (for a single GP, this is the criterion
+        for that GP).
+
+        :param criteria: Criterion for each GP and candidate, array-like with shape
+                         ``(n_gps, n_cand)``
+        :type criteria: ndarray
+        :returns: Combined criterion for each candidate, with shape ``(n_cand,)``
+        :rtype: ndarray
+        """
+
+        return np.sum(criteria, axis = 0)
+
     def _eval_metric(self):
         """
         Evaluate MICE criterion on all candidate points and select new design point
@@ -928,15 +2305,259 @@ class MICEDesign(SequentialDesign):
         :rtype: int
         """
 
+        self._fit_MICE_gps()
+
+        return np.argmax(self._MICE_criteria())
+
+
+class MultiOutputMICEDesign(MICEDesign):
+    """
+    Class representing a MICE sequential design for a simulation with multiple outputs
+
+    This class extends the MICE sequential design to simulations that return several outputs
+    for each design point, so that a single design can be run for all of the outputs rather
+    than running a separate design for each output (or combining the outputs by hand). The
+    bound function (or the targets provided when running the design manually) must give
+    ``n_outputs`` values for each design point, and the targets are stored as an array with
+    shape ``(n_points, n_outputs)``.
+
+    At each step, independent emulators are fit to all outputs using a ``MultiOutputGP``,
+    whose fitting and prediction can be run in parallel using the ``processes`` or
+    ``executor`` options. The criteria for the individual outputs are then added together to
+    choose the next point. Two criteria are available: ``"MICE"`` sums the MICE criterion for
+    each output (which requires fitting a ``MICEFastGP`` to the candidates for each output),
+    while ``"variance"`` sums the predicted variance of each output divided by its covariance
+    scale, choosing the point where the (scaled) outputs are most uncertain. The latter is
+    much cheaper when there are many outputs.
+
+    By default the criteria of the outputs are summed (``aggregate = "sum"``), which chooses
+    the point that most reduces the total scaled uncertainty over all outputs and treats the
+    outputs equally. With many outputs, however, a point where one output is very uncertain
+    can lose to a point where many outputs are slightly uncertain, so that output is left
+    poorly resolved. Setting ``aggregate = "max"`` instead uses the largest criterion over the
+    outputs for each candidate, so that each step targets the least well resolved output.
+
+    Other than the shape of the targets, the design is used in the same way as a
+    ``MICEDesign``, including the batch, asynchronous, and journal options of the base class.
+    """
+    def __init__(self, base_design, n_outputs, f = None, n_samples = None, n_init = 10, n_cand = 50,
+                 nugget = None, nugget_s = 1., n_pool = None, metric = "MICE", processes = None,
+                 executor = None, candidate_refresh = 1, theta_tol = 0., aggregate = "sum"):
+        """
+        Create new instance of a multiple output MICE sequential design
+
+        Parameters are the same as for ``MICEDesign``, with the addition of the number of outputs,
+        the criterion used to choose the next point and how it is combined over the outputs, and
+        options for fitting the emulators in parallel.
+
+        :param base_design: Base one-shot experimental design (must be a subclass of
+                            ``ExperimentalDesign``). This contains the information on the
+                            parameter space to be sampled.
+        :type base_design: ExperimentalDesign
+        :param n_outputs: Number of outputs of the simulation. Must be a positive integer.
+        :type n_outputs: int
+        :param f: Function to be evaluated for the design. Must take all parameter values as a single
+                  input array and return an array of length ``n_outputs``
+        :type f: function or other callable
+        :param n_samples: Number of sequential design points to be drawn (see ``SequentialDesign``).
+        :type n_samples: int or None
+        :param n_init: Number of points in the inital design before the sequential steps begin. Must
+                       be a positive integer. Optional, default value is 10.
+        :type n_init: int
+        :param n_cand: Number of candidates to consider at each sequential design step. Must be a positive
+                       integer. Optional, default value is 50.
+        :type n_cand: int
+        :param nugget: Nugget parameter for the emulators of all outputs. Must be a non-negative float or
+                       ``None``, where ``None`` indicates that the nugget parameter is selected adaptively.
+                       Optional, default value is ``None``.
+        :type nugget: float or None
+        :param nugget_s: Smoothing nugget parameter for smoothing the predictions on the candidate space
+                         (see ``MICEDesign``). Must be a non-negative float. Default value is 1.
+        :type nugget_s: float
+        :param n_pool: Number of points drawn from the base design at each step, from which the
+                       ``n_cand`` candidates are selected (see ``SequentialDesign``). Optional, default
+                       value is ``None`` (draw ``n_cand`` candidates directly).
+        :type n_pool: int or None
+        :param metric: Criterion used to choose the next point, either ``"MICE"`` (the sum of the MICE
+                       criterion for each output) or ``"variance"`` (the sum of the scaled predicted
+                       variance of each output). Optional, default is ``"MICE"``.
+        :type metric: str
+        :param processes: Number of processes used to fit the emulators and make predictions (see
+                          ``MultiOutputGP.learn_hyperparameters``). Optional, default is ``None`` (use
+                          all available processors).
+        :type processes: int or None
+        :param executor: Executor used to fit the emulators and make predictions instead of a pool of
+                         processes (see ``MultiOutputGP.learn_hyperparameters``). Optional, default
+                         is ``None``.
+        :type executor: concurrent.futures.Executor or None
+        :param candidate_refresh: Number of iterations for which the same set of candidates is used
+                                  (see ``MICEDesign``). Optional, default value is 1.
+        :type candidate_refresh: int
+        :param theta_tol: Tolerance on the change in the hyperparameters below which the candidate GPs
+                          are reused (see ``MICEDesign``). Optional, default value is 0.
+        :type theta_tol: float
+        :param aggregate: How the criterion is combined over the outputs, either ``"sum"`` (add the
+                          criteria for all outputs) or ``"max"`` (use the largest criterion over the
+                          outputs). Optional, default is ``"sum"``.
+        :type aggregate: str
+        """
+
+        if int(n_outputs) <= 0:
+            raise ValueError("number of outputs must be positive")
+
+        if not metric in ["MICE", "variance"]:
+            raise ValueError("metric must be 'MICE' or 'variance'")
+
+        if not aggregate in ["sum", "max"]:
+            raise ValueError("aggregate must be 'sum' or 'max'")
+
+        if not processes is None:
+            assert int(processes) > 0, "number of processes must be a positive integer"
+
+        assert executor is None or hasattr(executor, "submit"), "executor must have a submit method"
+
+        super().__init__(base_design, f, n_samples, n_init, n_cand, nugget, nugget_s, n_pool,
+                         candidate_refresh, theta_tol)
+
+        self.n_outputs = int(n_outputs)
+        self._target_shape = (self.n_outputs,)
+        self.metric = metric
+        self.aggregate = aggregate
+        self.processes = processes
+        self.executor = executor
+
+    def get_n_outputs(self):
+        """
+        Get number of outputs of the simulation
+
+        :returns: Number of outputs
+        :rtype: int
+        """
+
+        return self.n_outputs
+
+    def get_metric(self):
+        """
+        Get criterion used to choose the next design point
+
+        :returns: Criterion used to choose the next point (``"MICE"`` or ``"variance"``)
+        :rtype: str
+        """
+
+        return self.metric
+
+    def get_aggregate(self):
+        """
+        Get how the criterion is combined over the outputs
+
+        :returns: Method used to combine the criteria of the outputs (``"sum"`` or ``"max"``)
+        :rtype: str
+        """
+
+        return self.aggregate
+
+    def _gp_predict(self, gp, points, do_unc = True):
+        """
+        Predict the mean and variance of all outputs without derivatives
+
+        Makes predictions with the ``MultiOutputGP`` using the ``processes`` or ``executor``
+        options of the design. The mean and variance have shape ``(n_outputs, n_points)``.
+
+        :param gp: Fit emulators used to make the predictions
+        :type gp: MultiOutputGP
+        :param points: Points where predictions are made, with shape ``(n_points, n_parameters)``
+        :type points: ndarray
+        :param do_unc: (optional) Flag indicating if the uncertainties are to be computed.
+                       Default is ``True``.
+        :type do_unc: bool
+        :returns: Tuple holding the mean and variance of the predictions (the variance is
+                  ``None`` if ``do_unc`` is ``False``)
+        :rtype: tuple
+        """
+
+        return gp.predict(points, do_deriv = False, do_unc = do_unc, processes = self.processes,
+                          executor = self.executor)[:2]
+
+    def _condition_on_pending(self, gp):
+        """
+        Condition the emulators of all outputs on the pending points
+
+        Returns a ``MultiOutputGP`` with the same hyperparameters as ``gp`` that also includes the
+        pending points, with targets given by the mean prediction of ``gp`` for each output (see
+        ``SequentialDesign._condition_on_pending``). If there are no pending points, ``gp`` is
+        returned unchanged.
+
+        :param gp: Fit emulators to be conditioned on the pending points
+        :type gp: MultiOutputGP
+        :returns: Emulators conditioned on the pending points
+        :rtype: MultiOutputGP
+        """
+
+        if len(self.pending) == 0:
+            return gp
+
+        pending = self.get_pending_points()
+
+        pending_mean = self._gp_predict(gp, pending, do_unc = False)[0]
+
+        targets = np.array([emulator.targets for emulator in gp.emulators])
+
+        gp_pending = MultiOutputGP(np.concatenate((gp.emulators[0].inputs, pending)),
+                                   np.concatenate((targets, pending_mean), axis = 1),
+                                   [emulator.get_nugget() for emulator in gp.emulators])
+        gp_pending._set_params(np.array([emulator.theta for emulator in gp.emulators]))
+        for emulator in gp_pending.emulators:
+            emulator.mle_theta = emulator.theta
+
+        return gp_pending
+
+    def _estimate_next_target(self, next_point):
+        """
+        Estimate value of simulator for a point in a multiple output MICE design
+
+        Returns the prediction of the current emulators for all outputs at the given point,
+        which is used in place of the simulation output when choosing a batch of points.
+
+        :param next_point: Input to be simulated. Must be an array of shape ``(n_parameters,)``
+        :type next_point: ndarray
+        :returns: Estimated simulation outputs for the given input as an array of length
+                  ``n_outputs``
+        :rtype: ndarray
+        """
+
+        next_point = np.array(next_point)
+        assert next_point.shape == (self.get_n_parameters(),), "bad shape for next_point"
+
+        return self._gp_predict(self.gp, np.reshape(next_point, (1, self.get_n_parameters())),
+                                do_unc = False)[0][:, 0]
+
+    def _fit_MICE_gps(self):
+        """
+        Fit the emulators used to compute the criterion
+
+        This internal method fits a ``MultiOutputGP`` to all outputs for the points in the current
+        design (setting the ``gp`` attribute), and, if the ``"MICE"`` criterion is used, fits a
+        ``MICEFastGP`` to the candidates for each output using its hyperparameters (setting the
+        ``gp_fast`` attribute to a list of these, reusing those from the previous iteration if
+        possible). The fits are retried (up to 10 times) if they fail.
+
+        :returns: None
+        """
+
         numtries = 10
 
         for i in range(numtries):
             try:
-                self.gp = GaussianProcess(self.inputs, self.targets, self.nugget)
-                self.gp.learn_hyperparameters()
-
-                self.gp_fast = MICEFastGP(self.candidates, np.ones(self.n_cand), np.exp(self.gp.theta[-1])*self.nugget_s)
-                self.gp_fast._set_params(self.gp.theta)
+                self.gp = MultiOutputGP(self.inputs, np.transpose(self.targets),
+                                        [self.nugget]*self.n_outputs)
+                self.gp.learn_hyperparameters(processes = self.processes, executor = self.executor)
+
+                if self.metric == "MICE":
+                    gp_fast = self._candidate_gps()
+                    if len(gp_fast) != self.n_outputs:
+                        gp_fast = [None]*self.n_outputs
+                    self.gp_fast = [self._candidate_gp(emulator.theta, previous)
+                                    for emulator, previous in zip(self.gp.emulators, gp_fast)]
                 break
             except FloatingPointError:
                 if i < numtries - 1:
@@ -949,9 +2570,144 @@ class MICEDesign(SequentialDesign):
                 else:
                     raise LinAlgError("Unable to find parameters suitable for both GPs")
 
-        results = []
+    def _fit_NROY_gp(self):
+        """
+        Fit the emulators used to estimate the NROY space
+
+        Fits a ``MultiOutputGP`` to all outputs of the current design (see
+        ``SequentialDesign._fit_NROY_gp``) using the ``processes`` or ``executor`` options of
+        the design.
+
+        :returns: Fit emulators
+        :rtype: MultiOutputGP
+        """
+
+        gp = MultiOutputGP(self.inputs[:self.current_iteration], np.transpose(self.targets),
+                           [self.nroy_nugget]*self.n_outputs)
+        gp.learn_hyperparameters(processes = self.processes, executor = self.executor)
+
+        return gp
+
+    def _criterion_scales(self):
+        """
+        Compute the quantities that divide the variance of each output in the criterion
+
+        Returns the variances of the candidate GPs for the ``"MICE"`` criterion, or the
+        covariance scale of each output for the ``"variance"`` criterion.
+
+        :returns: Array that can be broadcast to shape ``(n_outputs, n_cand)``
+        :rtype: ndarray
+        """
+
+        if self.metric == "MICE":
+            return np.array([gp_fast.fast_predict_all() for gp_fast in self.gp_fast])
+        else:
+            return np.exp([emulator.theta[-1] for emulator in self.gp.emulators])[:, None]
+
+    def _MICE_criterion(self, data_point):
+        """
+        Compute the criterion for a single candidate point
+
+        Returns the criterion for the candidate point with the given index, combined over all
+        outputs (see ``_MICE_criteria``).
+
+        :param data_point: Index of the candidate point under consideration. Must be an integer
+                           with ``0 <= index < n_cand``.
+        :type data_point: int
+        :returns: Criterion for the data point in question
+        :rtype: float
+        """
+
+        data_point = int(data_point)
+
+        assert data_point >= 0 and data_point < self.n_cand, "test point index is out of range"
+
+        return float(self._MICE_criteria()[data_point])
+
+    def _MICE_criteria(self):
+        """
+        Compute the criterion for all candidate points
+
+        Predicts the variance of all outputs on all candidates at once, divides it by the
+        variance of the candidate GP for each output (``"MICE"``) or by the covariance scale of
+        each output (``"variance"``), and combines the result over the outputs (see
+        ``_aggregate_criteria``).
+
+        :returns: Array of shape ``(n_cand,)`` holding the criterion for each candidate point
+        :rtype: ndarray
+        """
+
+        _, unc = self._predict_candidates(self.gp)
+
+        criterion = self._aggregate_criteria(unc/self._criterion_scales())
+
+        assert np.all(np.isfinite(criterion)), "error in computing MICE critera"
+
+        return criterion
+
+    def _batch_metric_terms(self):
+        """
+        Return the emulators and scales used to choose a batch of points
+
+        See ``MICEDesign._batch_metric_terms``.
+
+        :returns: Tuple holding a list of the emulators for each output conditioned on the
+                  pending points and an array of scales for each output
+        :rtype: tuple
+        """
+
+        return self._condition_on_pending(self.gp).emulators, self._criterion_scales()
+
+    def _aggregate_criteria(self, criteria):
+        """
+        Combine the criteria for the outputs into a single criterion
+
+        Sums the criteria over the outputs, or takes the largest one if ``aggregate`` is
+        ``"max"``.
+
+        :param criteria: Criterion for each output and candidate, array-like with shape
+                         ``(n_outputs, n_cand)``
+        :type criteria: ndarray
+        :returns: Combined criterion for each candidate, with shape ``(n_cand,)``
+        :rtype: ndarray
+        """
+
+        if self.aggregate == "max":
+            return np.max(criteria, axis = 0)
+        else:
+            return np.sum(criteria, axis = 0)
+
+_journal_record = struct.Struct("<cQ")
+
+def _pack_journal_record(kind, index, values):
+    """
+    Pack a journal record holding a record type, an index, and an array of values
+    """
+    return _journal_record.pack(kind, index) + np.ascontiguousarray(values, dtype = "<f8").tobytes()
+
+def _unpack_journal_record(payload):
+    """
+    Unpack a journal record into its record type, index, and array of values
+    """
+    kind, index = _journal_record.unpack_from(payload)
+    return kind, index, np.array(np.frombuffer(payload, dtype = "<f8", offset = _journal_record.size))
+
+def _cholesky_update(L, x):
+    """
+    Compute the Cholesky factor of L L^T + x x^T from the lower triangular factor L
+    """
+
+    L = np.array(L)
+    x = np.array(x, dtype = float)
+    n = len(x)
 
-        for point in range(self.n_cand):
-            results.append(self._MICE_criterion(point))
+    for k in range(n):
+        r = np.sqrt(L[k, k]**2 + x[k]**2)
+        c = r/L[k, k]
+        s = x[k]/L[k, k]
+        L[k, k] = r
+        if k < n - 1:
+            L[k + 1:, k] = (L[k + 1:, k] + s*x[k + 1:])/c
+            x[k + 1:] = c*x[k + 1:] - s*L[k + 1:, k]
 
-        return np.argmax(results)
+    return L
@@ -0,0 +1,358 @@
+"""
+This module provides an executor that distributes tasks to worker processes connected over
+sockets, so that work such as fitting the emulators in a ``MultiOutputGP`` can be spread
+across several machines using the same interface as the executors in ``concurrent.futures``.
+
+The executor listens for connections on a given address. Workers are started on any machine
+that can reach that address by running ::
+
+    python -c "from mogp_emulator.SocketExecutor import worker_main; worker_main()" <host> <port>
+
+and supplying the authentication key of the executor (as a hexadecimal string) on standard
+input. Each worker then repeatedly receives a pickled function and its arguments, calls the
+function, and sends back the result. Functions and arguments must be picklable and the
+functions must be importable by the workers (for instance, module-level functions and
+methods of ``mogp_emulator`` classes). For testing, or to use the cores of a single machine,
+workers can be launched on the local machine with ``start_local_workers``.
+
+Example: ::
+
+    >>> import numpy as np
+    >>> from mogp_emulator import MultiOutputGP, SocketExecutor
+    >>> x = np.random.random((20, 2))
+    >>> y = np.array([np.sin(x[:, 0]), np.cos(x[:, 1])])
+    >>> gp = MultiOutputGP(x, y)
+    >>> with SocketExecutor() as executor:
+    ...     executor.start_local_workers(2)
+    ...     l = gp.learn_hyperparameters(executor = executor)
+    ...     mean, unc, deriv = gp.predict(x, executor = executor)
+
+"""
+
+import os
+import sys
+import subprocess
+import threading
+import queue
+from binascii import hexlify, unhexlify
+from concurrent.futures import Executor, Future
+from multiprocessing.connection import Listener, Client
+
+class SocketExecutor(Executor):
+    """
+    Executor that runs tasks on worker processes connected over sockets
+
+    Implements the ``concurrent.futures.Executor`` interface (``submit``, ``map``, and
+    ``shutdown``, and use as a context manager), so it can be used anywhere an executor
+    is accepted (for example the ``executor`` argument of ``MultiOutputGP.learn_hyperparameters``
+    and ``MultiOutputGP.predict``). Tasks are held in a queue and each connected worker is
+    sent a new task as soon as it returns the result of the previous one. Workers can connect
+    (and be added) at any time. If the connection to a worker is lost while it is running a
+    task, the task is put back in the queue to be run by another worker (up to a total of
+    ``max_attempts`` attempts, after which the future is given a ``RuntimeError``, so that a
+    task that crashes its worker does not bring down all of the workers).
+
+    Connections are authenticated with a key (see ``multiprocessing.connection``), which is
+    generated randomly unless one is given. Note that pickled data is exchanged with the
+    workers, so the key should be kept private and the executor should only listen on
+    trusted networks.
+    """
+
+    def __init__(self, address = ('localhost', 0), authkey = None, max_attempts = 2):
+        """
+        Create a new executor and start listening for workers
+
+        :param address: (optional) Host and port on which to listen for workers. A port of
+                        0 (the default) chooses a free port. Default is ``('localhost', 0)``,
+                        which only accepts workers on the local machine.
+        :type address: tuple
+        :param authkey: (optional) Authentication key that workers must present. If ``None``
+                        (default), a random key is generated.
+        :type authkey: bytes or None
+        :param max_attempts: (optional) Number of times a task is attempted if the connection
+                             to the worker running it is lost. Must be a positive integer
+                             (default is 2).
+        :type max_attempts: int
+        :returns: New ``SocketExecutor`` instance
+        :rtype: SocketExecutor
+        """
+
+        if authkey is None:
+            authkey = os.urandom(16)
+        assert isinstance(authkey, bytes), "authkey must be bytes"
+        assert int(max_attempts) > 0, "max_attempts must be a positive integer"
+
+        self.authkey = authkey
+        self.max_attempts = int(max_attempts)
+        self._listener = Listener(address, authkey = authkey)
+        self.address = self._listener.address
+        self._tasks = queue.Queue()
+        self._processes = []
+        self._threads = []
+        self._n_workers = 0
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+        self._accept_thread = threading.Thread(target = self._accept, daemon = True)
+        self._accept_thread.start()
+
+    def _accept(self):
+        """
+        Accept connections from workers, starting a thread to feed tasks to each one
+
+        :returns: None
+        """
+
+        while True:
+            try:
+                conn = self._listener.accept()
+            except Exception:
+                if self._shutdown:
+                    return
+                continue
+            with self._lock:
+                if self._shutdown:
+                    conn.close()
+                    return
+                self._n_workers += 1
+                thread = threading.Thread(target = self._serve, args = (conn,), daemon = True)
+                self._threads.append(thread)
+            thread.start()
+
+    def _serve(self, conn):
+        """
+        Send tasks to a single worker and collect the results
+
+        :returns: None
+        """
+
+        try:
+            while True:
+                task = self._tasks.get()
+                if task is None:
+                    conn.send(None)
+                    return
+                future, fn, args, kwargs = task
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    conn.send((fn, args, kwargs))
+                    status, value = conn.recv()
+                except (EOFError, OSError):
+                    if getattr(future, "attempts", 1) >= self.max_attempts:
+                        future.set_exception(RuntimeError("connection to worker lost while running task"))
+                    else:
+                        self._tasks.put((_RequeuedFuture(future), fn, args, kwargs))
+                    return
+                except Exception as exc:
+                    future.set_exception(exc)
+                    continue
+                if status == "result":
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+        except (EOFError, OSError):
+            pass
+        finally:
+            with self._lock:
+                self._n_workers -= 1
+            conn.close()
+
+    def get_n_workers(self):
+        """
+        Returns the number of workers currently connected
+
+        :returns: Number of connected workers
+        :rtype: int
+        """
+
+        with self._lock:
+            return self._n_workers
+
+    def start_local_workers(self, n_workers):
+        """
+        Launch worker processes on the local machine
+
+        Each worker is started as a separate Python process running ``worker_main`` and
+        connects to the executor on its own.
+        The processes are stopped when the executor is shut down.
+
+        :param n_workers: Number of workers to launch. Must be a positive integer.
+        :type n_workers: int
+        :returns: None
+        """
+
+        n_workers = int(n_workers)
+        assert n_workers > 0, "n_workers must be a positive integer"
+        assert not self._shutdown, "cannot start workers after shutdown"
+
+        host, port = self.address
+
+        env = dict(os.environ)
+        package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env["PYTHONPATH"] = os.pathsep.join([package_dir] + [path for path in
+                                                             [env.get("PYTHONPATH")] if path])
+
+        for i in range(n_workers):
+            process = subprocess.Popen([sys.executable, "-c", _worker_command, str(host), str(port)],
+                                       stdin = subprocess.PIPE, env = env)
+            process.stdin.write(hexlify(self.authkey) + b"\n")
+            process.stdin.close()
+            self._processes.append(process)
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Schedule a function to be called by a worker
+
+        :param fn: Function to be called. Must be picklable and importable by the workers.
+        :type fn: function
+        :returns: Future holding the result of calling ``fn(*args, **kwargs)``
+        :rtype: concurrent.futures.Future
+        """
+
+        assert not self._shutdown, "cannot submit tasks after shutdown"
+
+        future = Future()
+        self._tasks.put((future, fn, args, kwargs))
+
+        return future
+
+    def shutdown(self, wait = True, cancel_futures = False):
+        """
+        Stop the executor and the workers
+
+        Workers finish the tasks that have already been submitted (unless
+        ``cancel_futures`` is ``True``) and then disconnect. Workers launched with
+        ``start_local_workers`` are terminated if they have not exited once the remaining
+        tasks are complete.
+
+        :param wait: (optional) If ``True`` (default), wait for the submitted tasks to finish
+                     and for local workers to exit before returning.
+        :type wait: bool
+        :param cancel_futures: (optional) If ``True``, cancel tasks that have not started.
+                               Default is ``False``.
+        :type cancel_futures: bool
+        :returns: None
+        """
+
+        if self._shutdown:
+            return
+
+        if cancel_futures:
+            while True:
+                try:
+                    task = self._tasks.get_nowait()
+                except queue.Empty:
+                    break
+                if not task is None:
+                    task[0].cancel()
+
+        with self._lock:
+            self._shutdown = True
+            threads = list(self._threads)
+
+        for thread in threads:
+            self._tasks.put(None)
+
+        # wake up the thread waiting for new connections so that it can exit
+
+        try:
+            Client(self.address, authkey = self.authkey).close()
+        except Exception:
+            pass
+        self._listener.close()
+
+        if wait:
+            for thread in threads:
+                thread.join()
+            for process in self._processes:
+                try:
+                    process.wait(timeout = 10.)
+                except subprocess.TimeoutExpired:
+                    process.terminate()
+                    process.wait()
+        else:
+            for process in self._processes:
+                if process.poll() is None:
+                    process.terminate()
+
+class _RequeuedFuture(object):
+    """
+    Wrapper for a future that is already running and is put back in the task queue
+
+    ``set_running_or_notify_cancel`` can only be called once on a future, so this wrapper
+    makes the call succeed when the task is picked up again by another worker. The wrapper
+    also counts the number of attempts made to run the task.
+    """
+
+    def __init__(self, future):
+        if isinstance(future, _RequeuedFuture):
+            self.future = future.future
+            self.attempts = future.attempts + 1
+        else:
+            self.future = future
+            self.attempts = 2
+
+    def set_running_or_notify_cancel(self):
+        return True
+
+    def cancel(self):
+        return False
+
+    def set_result(self, result):
+        self.future.set_result(result)
+
+    def set_exception(self, exception):
+        self.future.set_exception(exception)
+
+def run_worker(address, authkey):
+    """
+    Connect to a ``SocketExecutor`` and run tasks until told to stop
+
+    :param address: Host and port of the executor
+    :type address: tuple
+    :param authkey: Authentication key of the executor
+    :type authkey: bytes
+    :returns: None
+    """
+
+    with Client(tuple(address), authkey = authkey) as conn:
+        while True:
+            try:
+                task = conn.recv()
+            except EOFError:
+                return
+            if task is None:
+                return
+            fn, args, kwargs = task
+            try:
+                result = ("result", fn(*args, **kwargs))
+            except Exception as exc:
+                result = ("error", exc)
+            try:
+                conn.send(result)
+            except (EOFError, OSError):
+                return
+            except Exception as exc:
+                conn.send(("error", RuntimeError("result could not be sent: {}".format(exc))))
+
+def worker_main(argv = None):
+    """
+    Run a worker using the host and port given on the command line
+
+    Reads the host and port of the executor from ``argv`` (``sys.argv`` by default) and the
+    authentication key as a hexadecimal string from standard input, and then calls
+    ``run_worker``.
+
+    :param argv: (optional) Command line arguments, where ``argv[1]`` is the host and
+                 ``argv[2]`` the port of the executor. Default is ``None`` (use ``sys.argv``)
+    :type argv: list or None
+    :returns: None
+    """
+
+    if argv is None:
+        argv = sys.argv
+
+    run_worker((argv[1], int(argv[2])), unhexlify(sys.stdin.readline().strip()))
+
+_worker_command = "from mogp_emulator.SocketExecutor import worker_main; worker_main()"
@@ -1,8 +1,10 @@
 from .version import version as __version__
 
 from .MultiOutputGP import MultiOutputGP
+from .PCAMultiOutputGP import PCAMultiOutputGP
 from .GaussianProcess import GaussianProcess
 from .ExperimentalDesign import ExperimentalDesign, MonteCarloDesign, LatinHypercubeDesign
-from .SequentialDesign import SequentialDesign, MICEDesign
+from .SequentialDesign import SequentialDesign, MICEDesign, MultiOutputMICEDesign
 from .HistoryMatching import HistoryMatching
 from .DimensionReduction import gKDR
+from .SocketExecutor import SocketExecutor
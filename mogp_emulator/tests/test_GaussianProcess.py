@@ -1,4 +1,6 @@
-from tempfile import TemporaryFile
+import os
+import warnings
+from tempfile import TemporaryFile, TemporaryDirectory
 import numpy as np
 import pytest
 from numpy.testing import assert_allclose
@@ -367,6 +369,38 @@ def test_GaussianProcess_set_params():
     with pytest.raises(AssertionError):
         gp._set_params(theta)
 
+def test_GaussianProcess_factorization():
+    "Test the methods to get and set the factorization of the covariance matrix"
+
+    x = np.reshape(np.array([1., 2., 3., 2., 4., 1., 4., 2., 2.]), (3, 3))
+    y = np.array([2., 3., 4.])
+    gp = GaussianProcess(x, y)
+    theta = np.zeros(4)
+    gp._set_params(theta)
+
+    theta_actual, L, invQt, logdetQ = gp._get_factorization()
+
+    gp_2 = GaussianProcess(x, y)
+    gp_2._set_factorization(theta_actual, L, invQt, logdetQ)
+
+    assert_allclose(gp_2.theta, theta)
+    assert_allclose(gp_2.L, gp.L)
+    assert_allclose(gp_2.invQt, gp.invQt)
+    assert_allclose(gp_2.logdetQ, gp.logdetQ)
+    assert_allclose(gp_2.predict(x)[0], gp.predict(x)[0])
+
+    with pytest.raises(AssertionError):
+        GaussianProcess(x, y)._get_factorization()
+
+    with pytest.raises(AssertionError):
+        gp_2._set_factorization(np.zeros(3), L, invQt, logdetQ)
+
+    with pytest.raises(AssertionError):
+        gp_2._set_factorization(theta, L[:2], invQt, logdetQ)
+
+    with pytest.raises(AssertionError):
+        gp_2._set_factorization(theta, L, invQt[:2], logdetQ)
+
 def test_GaussianProcess_loglikelihood():
     "Test the loglikelihood method of GaussianProcess"
 
@@ -721,6 +755,115 @@ def test_GaussianProcess_learn_hyperparameters_MCMC():
     with pytest.raises(AssertionError):
         gp.learn_hyperparameters_MCMC(n_samples = -1)
 
+    with pytest.raises(AssertionError):
+        gp.learn_hyperparameters_MCMC(n_samples = 4, method = "Gibbs")
+
+def test_GaussianProcess_learn_hyperparameters_MCMC_HMC():
+    "test method to fit hyperparameters via HMC"
+
+    np.random.seed(5823)
+
+    x = np.random.uniform(0., 10., size = (20, 2))
+    y = np.sin(x[:,0]) + np.cos(x[:,1])
+    gp = GaussianProcess(x, y, 1.e-6)
+    gp.learn_hyperparameters(n_tries = 5)
+    mle_theta = np.copy(gp.mle_theta)
+
+    gp.learn_hyperparameters_MCMC(n_samples = 50, thin = 1, method = "HMC")
+
+    assert gp.samples.shape == (50, 3)
+    assert np.all(np.isfinite(gp.samples))
+    assert_allclose(np.mean(gp.samples, axis = 0), mle_theta, atol = 1.)
+
+def test_GaussianProcess_learn_hyperparameters_MCMC_chains():
+    "test method to fit hyperparameters via multiple MCMC chains"
+
+    np.random.seed(5823)
+
+    x = np.random.uniform(0., 10., size = (20, 2))
+    y = np.sin(x[:,0]) + np.cos(x[:,1])
+    gp = GaussianProcess(x, y, 1.e-6)
+    gp.learn_hyperparameters(n_tries = 5)
+    mle_theta = np.copy(gp.mle_theta)
+
+    # chains long enough to converge give no split-Rhat (or other) warnings
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        gp.learn_hyperparameters_MCMC(n_samples = 1000, thin = 0, n_chains = 2, processes = 2)
+
+    assert gp.samples.shape[0] % 2 == 0
+    assert gp.samples.shape[1] == 3
+    assert np.all(np.isfinite(gp.samples))
+    assert_allclose(np.mean(gp.samples, axis = 0), mle_theta, atol = 0.5)
+
+    # sampling stops once the target effective sample size is reached
+
+    np.random.seed(1)
+
+    with pytest.warns(UserWarning, match = "autocorrelation"):
+        gp.learn_hyperparameters_MCMC(n_samples = 4000, thin = 1, n_chains = 2, processes = 2,
+                                      target_ess = 50, check_every = 200)
+
+    assert gp.samples.shape[1] == 3
+    assert gp.samples.shape[0] < 2*(4000 - 2000)
+
+    with pytest.raises(AssertionError):
+        gp.learn_hyperparameters_MCMC(target_ess = 50)
+
+    with pytest.raises(AssertionError):
+        gp.learn_hyperparameters_MCMC(n_chains = 0)
+
+    with pytest.raises(AssertionError):
+        gp.learn_hyperparameters_MCMC(n_chains = 2, method = "HMC")
+
+def test_GaussianProcess_learn_hyperparameters_MCMC_adaptive():
+    "test method to fit hyperparameters via adaptive Metropolis without a Hessian"
+
+    np.random.seed(5823)
+
+    x = np.random.uniform(0., 10., size = (20, 2))
+    y = np.sin(x[:,0]) + np.cos(x[:,1])
+    gp = GaussianProcess(x, y, 1.e-6)
+    gp.learn_hyperparameters(n_tries = 5)
+    mle_theta = np.copy(gp.mle_theta)
+
+    gp.learn_hyperparameters_MCMC(n_samples = 200, thin = 1, n_adapt = 200, use_hessian = False)
+
+    assert gp.samples.shape == (200, 3)
+    assert np.all(np.isfinite(gp.samples))
+    assert_allclose(np.mean(gp.samples, axis = 0), mle_theta, atol = 1.5)
+
+    with pytest.raises(AssertionError):
+        gp.learn_hyperparameters_MCMC(use_hessian = False)
+
+    with pytest.raises(AssertionError):
+        gp.learn_hyperparameters_MCMC(n_adapt = 10, method = "HMC")
+
+    with pytest.raises(AssertionError):
+        gp.learn_hyperparameters_MCMC(n_adapt = -1)
+
+def test_GaussianProcess_learn_hyperparameters_MCMC_file():
+    "test method to fit hyperparameters via MCMC with the chain written to a file"
+
+    np.random.seed(5823)
+
+    x = np.random.uniform(0., 10., size = (20, 2))
+    y = np.sin(x[:,0]) + np.cos(x[:,1])
+    gp = GaussianProcess(x, y, 1.e-6)
+    gp.learn_hyperparameters(n_tries = 5)
+
+    with TemporaryDirectory() as tmpdir:
+        chain_file = os.path.join(tmpdir, "chain.bin")
+        gp.learn_hyperparameters_MCMC(n_samples = 100, thin = 2, chain_file = chain_file)
+
+        assert gp.samples.shape == (50, 3)
+        assert_allclose(gp.samples[0], gp.mle_theta)
+        assert os.path.getsize(chain_file) == 100*3*8
+
+        with pytest.raises(AssertionError):
+            gp.learn_hyperparameters_MCMC(method = "HMC", chain_file = chain_file)
+
 def test_GaussianProcess_predict_single():
     "Test the _single_predict method of GaussianProcess"
 
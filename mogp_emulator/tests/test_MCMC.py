@@ -1,7 +1,16 @@
+import os
+from tempfile import TemporaryDirectory
 import numpy as np
 import pytest
 from numpy.testing import assert_allclose
-from ..MCMC import MH_proposal, MCMC_step, sample_MCMC, autothin_samples
+from ..MCMC import MH_proposal, MCMC_step, sample_MCMC, autothin_samples, sample_HMC
+from ..MCMC import sample_MCMC_chains, split_rhat, bulk_ess, _run_chain_block
+from ..MCMC import integrated_autocorr_time, effective_sample_size
+from ..MCMC import ChainWriter, sample_MCMC_file
+
+def normal_loglike(x):
+    "standard normal log-likelihood, defined at module level so that it can be pickled"
+    return -0.5*np.sum(x**2)
 
 def test_MH_proposal():
     "test the Metropolis-Hastings proposal distribution"
@@ -135,6 +144,183 @@ def test_sample_MCMC():
     with pytest.raises(AssertionError):
         sample_MCMC(loglikelihood, np.zeros((2,3)), cov, 1000, -1)
 
+def test_sample_MCMC_adaptive():
+    "test adaptive Metropolis sampling"
+
+    np.random.seed(7124)
+
+    cov = np.array([[1., 0.9], [0.9, 1.]])
+    precision = np.linalg.inv(cov)
+
+    def loglikelihood(x):
+        return -0.5*np.dot(x, np.dot(precision, x))
+
+    samples, rejected, acceptance, first_lag = sample_MCMC(loglikelihood, np.array([3., 3.]),
+                                                           1.e-4*np.eye(2), 20000, thin = 1,
+                                                           n_adapt = 2000, target_accept = 0.234)
+
+    assert samples.shape == (20000, 2)
+    assert acceptance > 0.15 and acceptance < 0.35
+    assert len(rejected) == int(round((1. - acceptance)*20000))
+    assert_allclose(np.mean(samples, axis = 0), np.zeros(2), atol = 0.15)
+    assert_allclose(np.cov(samples.T), cov, atol = 0.15)
+
+    with pytest.raises(AssertionError):
+        sample_MCMC(loglikelihood, np.zeros(2), np.eye(2), n_adapt = -1)
+
+    with pytest.raises(AssertionError):
+        sample_MCMC(loglikelihood, np.zeros(2), np.eye(2), n_adapt = 10, target_accept = 1.)
+
+    with pytest.raises(AssertionError):
+        sample_MCMC(loglikelihood, np.zeros(2), np.eye(2), n_adapt = 10, adapt_offset = -1.)
+
+def test_sample_MCMC_adaptive_rejected_start():
+    "test that adaptive Metropolis recovers if the first proposal is rejected"
+
+    np.random.seed(3812)
+
+    n_calls = [0]
+
+    def loglikelihood(x):
+        n_calls[0] += 1
+        if n_calls[0] == 2:
+            return np.nan
+        return -0.5*np.sum(x**2)
+
+    samples, rejected, acceptance, first_lag = sample_MCMC(loglikelihood, np.zeros(2), np.eye(2),
+                                                           2000, thin = 1, n_adapt = 200)
+
+    assert samples.shape == (2000, 2)
+    assert acceptance >= 0.2 and acceptance <= 0.6
+    assert_allclose(np.var(samples, axis = 0), np.ones(2), atol = 0.3)
+
+def test_ChainWriter():
+    "test writing an MCMC chain to disk in blocks"
+
+    np.random.seed(1185)
+
+    samples = np.random.normal(size = (25, 2))
+
+    with TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, "chain.bin")
+        writer = ChainWriter(filename, 2, block_size = 10, n_reservoir = 3)
+
+        for sample in samples:
+            writer.append(sample)
+        for sample in samples[:5]:
+            writer.reject(sample)
+
+        assert writer.n_samples == 25
+        assert writer.n_written == 20
+        assert_allclose(writer.get_chain(), samples[:20])
+        assert_allclose(writer.mean, np.mean(samples, axis = 0))
+        assert_allclose(writer.cov, np.cov(samples.T))
+        assert writer.rejected.shape == (3, 2)
+        assert writer.n_rejected == 5
+        assert_allclose(writer.acceptance, 0.8)
+
+        writer.flush()
+        del writer
+
+        with open(filename, "ab") as f:
+            f.write(b"incomplete block")
+
+        writer = ChainWriter(filename, 2, block_size = 10, n_reservoir = 3)
+
+        assert writer.n_samples == 25
+        assert_allclose(writer.get_chain(), samples)
+        assert_allclose(writer.current, samples[-1])
+        assert_allclose(writer.mean, np.mean(samples, axis = 0))
+
+        with pytest.raises(AssertionError):
+            ChainWriter(filename, 3)
+
+        with pytest.raises(AssertionError):
+            writer.append(np.zeros(3))
+
+        # a chain file that is missing or shorter than the saved state cannot be resumed
+
+        del writer
+
+        with open(filename, "r+b") as f:
+            f.truncate(10*2*8)
+
+        with pytest.raises(ValueError):
+            ChainWriter(filename, 2, block_size = 10)
+
+        os.remove(filename)
+
+        with pytest.raises(ValueError):
+            ChainWriter(filename, 2, block_size = 10)
+
+    with pytest.raises(AssertionError):
+        ChainWriter("chain.bin", 2, block_size = 0)
+
+def test_sample_MCMC_file():
+    "test sampling an MCMC chain to disk and resuming it"
+
+    def loglikelihood(x):
+        return -0.5*np.sum(x**2)
+
+    with TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, "chain.bin")
+
+        np.random.seed(2206)
+        chain, rejected, acceptance, writer = sample_MCMC_file(loglikelihood, np.zeros(2), np.eye(2),
+                                                               filename, 1000, block_size = 128,
+                                                               n_reservoir = 20)
+
+        assert chain.shape == (1000, 2)
+        assert rejected.shape == (20, 2)
+        assert_allclose(acceptance, 1. - writer.n_rejected/1000.)
+        assert_allclose(writer.mean, np.mean(chain, axis = 0))
+        full_chain = np.array(chain)
+        del chain, writer
+
+        filename = os.path.join(tmpdir, "resumed.bin")
+
+        np.random.seed(2206)
+        sample_MCMC_file(loglikelihood, np.zeros(2), np.eye(2), filename, 300, block_size = 128,
+                         n_reservoir = 20)
+        np.random.seed(1)
+        chain, rejected, acceptance_resumed, writer = sample_MCMC_file(loglikelihood, np.zeros(2), np.eye(2),
+                                                                       filename, 1000, block_size = 128,
+                                                                       n_reservoir = 20)
+
+        assert_allclose(chain, full_chain)
+        assert_allclose(acceptance_resumed, acceptance)
+        del chain, writer
+
+        np.random.seed(17)
+        state = np.random.get_state()
+
+        sample_MCMC_file(loglikelihood, np.zeros(2), np.eye(2), filename, 1200, block_size = 128)
+
+        assert_allclose(np.random.get_state()[1], state[1])
+        assert np.random.get_state()[2] == state[2]
+
+        # a chain longer than requested is not extended and only the requested part is returned
+
+        chain, _, _, writer = sample_MCMC_file(loglikelihood, np.zeros(2), np.eye(2), filename, 500,
+                                               block_size = 128)
+
+        assert chain.shape == (500, 2)
+        assert_allclose(chain, full_chain[:500])
+        assert writer.n_samples == 1200
+        del chain, writer
+
+        with pytest.raises(ValueError):
+            sample_MCMC_file(loglikelihood, np.ones(2), np.eye(2), filename, 1500)
+
+        with pytest.raises(ValueError):
+            sample_MCMC_file(loglikelihood, np.zeros(2), 2.*np.eye(2), filename, 1500)
+
+        with pytest.raises(ValueError):
+            sample_MCMC_file(lambda x: -np.sum(x**2) + 1., np.zeros(2), np.eye(2), filename, 1500)
+
+    with pytest.raises(AssertionError):
+        sample_MCMC_file(loglikelihood, np.zeros(2), np.eye(2), "chain.bin", n_samples = 0)
+
 def test_autothin_samples():
     "test the autothinning routine"
     
@@ -158,5 +344,213 @@ def test_autothin_samples():
     
     with pytest.raises(AssertionError):
         autothin_samples(a)
-    
 
+def test_integrated_autocorr_time():
+    "test the integrated autocorrelation time and effective sample size"
+
+    np.random.seed(3389)
+
+    signal = np.zeros((20000, 3))
+    signal[:, 0] = np.random.normal(size = 20000)
+    for i in range(1, 20000):
+        signal[i, 1] = 0.9*signal[i - 1, 1] + np.random.normal()
+
+    tau = integrated_autocorr_time(signal)
+
+    assert_allclose(tau[:2], np.array([1., 19.]), rtol = 0.2)
+    assert np.isnan(tau[2])
+
+    ess = effective_sample_size(signal)
+
+    assert_allclose(ess[:2], 20000./tau[:2])
+    assert np.isnan(ess[2])
+
+    assert integrated_autocorr_time(signal[:, 0]).shape == (1,)
+
+    with pytest.raises(AssertionError):
+        integrated_autocorr_time(np.zeros(3))
+
+    with pytest.raises(AssertionError):
+        effective_sample_size(np.zeros((10, 2, 2)))
+
+def test_sample_HMC():
+    "test HMC sampling with the No-U-Turn sampler"
+
+    cov = np.array([[1., 0.5], [0.5, 2.]])
+    inv_cov = np.linalg.inv(cov)
+
+    def loglikelihood(x):
+        return -0.5*np.dot(x, np.dot(inv_cov, x))
+
+    def gradient(x):
+        return -np.dot(inv_cov, x)
+
+    np.random.seed(4521)
+
+    samples, acceptance, first_lag = sample_HMC(loglikelihood, gradient, np.zeros(2), n_samples = 2000,
+                                                thin = 1)
+
+    assert samples.shape == (2000, 2)
+    assert_allclose(np.mean(samples, axis = 0), np.zeros(2), atol = 0.15)
+    assert_allclose(np.cov(samples.T), cov, atol = 0.25)
+    assert acceptance > 0.6 and acceptance <= 1.
+    assert first_lag.shape == (2,)
+
+    # a given random number generator reproduces the chain without using the global generator
+
+    np.random.seed(17)
+    state = np.random.get_state()
+
+    samples_rs = sample_HMC(loglikelihood, gradient, np.zeros(2), n_samples = 200, thin = 1,
+                            n_adapt = 20, random_state = np.random.RandomState(4521))[0]
+
+    assert_allclose(np.random.get_state()[1], state[1])
+    assert np.random.get_state()[2] == state[2]
+
+    np.random.seed(4521)
+
+    samples_global = sample_HMC(loglikelihood, gradient, np.zeros(2), n_samples = 200, thin = 1,
+                                n_adapt = 20)[0]
+
+    assert_allclose(samples_rs, samples_global)
+
+    # negative log-likelihood with a fixed step size and mass matrix
+
+    def neg_loglikelihood(x):
+        return -loglikelihood(x)
+
+    def neg_gradient(x):
+        return -gradient(x)
+
+    np.random.seed(4521)
+
+    samples, acceptance, first_lag = sample_HMC(neg_loglikelihood, neg_gradient, np.ones(2), n_samples = 500,
+                                                thin = 2, loglike_sign = -1., inv_mass = cov,
+                                                step_size = 0.5, n_adapt = 0)
+
+    assert samples.shape == (250, 2)
+    assert_allclose(samples[0], np.ones(2))
+    assert_allclose(np.mean(samples, axis = 0), np.zeros(2), atol = 0.3)
+
+    with pytest.raises(AssertionError):
+        sample_HMC(loglikelihood, gradient, np.zeros(2), n_samples = -1)
+
+    with pytest.raises(AssertionError):
+        sample_HMC(loglikelihood, gradient, np.zeros(2), thin = -1)
+
+    with pytest.raises(AssertionError):
+        sample_HMC(loglikelihood, gradient, np.zeros((2, 3)))
+
+    with pytest.raises(AssertionError):
+        sample_HMC(loglikelihood, 2., np.zeros(2))
+
+    with pytest.raises(AssertionError):
+        sample_HMC(loglikelihood, gradient, np.zeros(2), loglike_sign = 0.)
+
+    with pytest.raises(AssertionError):
+        sample_HMC(loglikelihood, gradient, np.zeros(2), inv_mass = np.eye(3))
+
+    with pytest.raises(AssertionError):
+        sample_HMC(loglikelihood, gradient, np.zeros(2), step_size = -1.)
+
+def test_sample_MCMC_chains():
+    "test running multiple MCMC chains in parallel"
+
+    np.random.seed(2914)
+
+    starts = np.array([[-3., 3.], [3., -3.], [3., 3.], [-3., -3.]])
+    step_sizes = 2.4**2/2.*np.eye(2)
+
+    samples, acceptance, rhat, ess = sample_MCMC_chains(normal_loglike, starts, step_sizes, 2000,
+                                                        thin = 1, processes = 2, n_burn = 500)
+
+    assert samples.shape == (4*1500, 2)
+    assert acceptance > 0.2 and acceptance < 0.6
+    assert np.all(rhat < 1.05)
+    assert np.all(ess > 500.) and np.all(ess < 6000.)
+    assert_allclose(np.mean(samples, axis = 0), np.zeros(2), atol = 0.15)
+    assert_allclose(np.var(samples, axis = 0), np.ones(2), atol = 0.2)
+
+    samples, acceptance, rhat, ess = sample_MCMC_chains(normal_loglike, starts, step_sizes, 20000,
+                                                        thin = 0, processes = 2, n_burn = 100,
+                                                        target_ess = 400, check_every = 200)
+
+    assert len(samples) < 4*(20000 - 100)
+    assert np.all(ess >= 400.)
+    assert np.all(rhat <= 1.05)
+
+    with pytest.raises(AssertionError):
+        sample_MCMC_chains(normal_loglike, starts[:1], step_sizes)
+
+    with pytest.raises(AssertionError):
+        sample_MCMC_chains(normal_loglike, np.zeros(2), step_sizes)
+
+    with pytest.raises(AssertionError):
+        sample_MCMC_chains(normal_loglike, starts, step_sizes, n_samples = 10, n_burn = 10)
+
+    with pytest.raises(AssertionError):
+        sample_MCMC_chains(normal_loglike, starts, step_sizes, thin = -1)
+
+    with pytest.raises(AssertionError):
+        sample_MCMC_chains(normal_loglike, starts, step_sizes, processes = 0)
+
+    with pytest.raises(AssertionError):
+        sample_MCMC_chains(normal_loglike, starts, step_sizes, target_ess = -1.)
+
+def test_run_chain_block():
+    "test that advancing a chain uses its own random number generator"
+
+    np.random.seed(4021)
+
+    state = np.random.get_state()
+
+    samples, n_rejected = _run_chain_block(normal_loglike, np.zeros(2), np.eye(2), 100, 1., 17)
+    samples_2, n_rejected_2 = _run_chain_block(normal_loglike, np.zeros(2), np.eye(2), 100, 1., 17)
+
+    assert samples.shape == (100, 2)
+    assert_allclose(samples, samples_2)
+    assert n_rejected == n_rejected_2
+    assert np.random.get_state()[2] == state[2]
+    assert_allclose(np.random.get_state()[1], state[1])
+
+def test_split_rhat():
+    "test the split-Rhat convergence diagnostic"
+
+    np.random.seed(5812)
+
+    chains = np.random.normal(size = (4, 1000, 2))
+
+    assert_allclose(split_rhat(chains), np.ones(2), atol = 0.01)
+
+    chains[0] += 3.
+
+    assert np.all(split_rhat(chains) > 1.1)
+
+    assert split_rhat(np.random.normal(size = (4, 100))).shape == (1,)
+
+    with pytest.raises(AssertionError):
+        split_rhat(np.zeros((4, 3, 2)))
+
+    with pytest.raises(AssertionError):
+        split_rhat(np.zeros(10))
+
+def test_bulk_ess():
+    "test the bulk effective sample size"
+
+    np.random.seed(7701)
+
+    chains = np.random.normal(size = (4, 1000, 2))
+
+    assert_allclose(bulk_ess(chains), 4000.*np.ones(2), rtol = 0.15)
+
+    correlated = np.zeros((4, 1000))
+    for i in range(1, 1000):
+        correlated[:, i] = 0.9*correlated[:, i - 1] + np.random.normal(size = 4)
+
+    ess = bulk_ess(correlated)
+
+    assert ess.shape == (1,)
+    assert ess[0] > 100. and ess[0] < 500.
+
+    with pytest.raises(AssertionError):
+        bulk_ess(np.zeros((4, 3, 2)))
@@ -1,8 +1,14 @@
-from tempfile import TemporaryFile
+import os
+from tempfile import TemporaryFile, TemporaryDirectory
+from multiprocessing import shared_memory
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import pytest
 from numpy.testing import assert_allclose
 from .. import MultiOutputGP
+from ..MultiOutputGP import MultiOutputPrediction, _SharedThetaGP, _batch_loglikelihood, _batch_minimize
+from ..GaussianProcess import GaussianProcess
+from ..utils import read_records, write_record
 
 def test_MultiOutputGP_init():
     "Test function for correct functioning of the init method of MultiOutputGP"
@@ -228,7 +234,268 @@ def test_MultiOutputGP_learn_hyperparameters():
         assert_allclose(loglike_val, loglike_exp, atol = 1.e-8, rtol = 1.e-5)
         assert_allclose(theta_val, theta_exp, atol = 1.e-8, rtol = 1.e-5)
         assert_allclose(emulator.theta, theta_exp, atol = 1.e-8, rtol = 1.e-5)
+        assert_allclose(emulator.mle_theta, theta_exp, atol = 1.e-8, rtol = 1.e-5)
+
+    # factorization returned by the workers should match one computed in this process
+
+    for emulator in gp.emulators:
+        L, invQt, logdetQ = emulator.L, emulator.invQt, emulator.logdetQ
+        emulator._set_params(emulator.theta)
+        assert_allclose(L, emulator.L)
+        assert_allclose(invQt, emulator.invQt)
+        assert_allclose(logdetQ, emulator.logdetQ)
         
+def test_MultiOutputGP_learn_hyperparameters_callback():
+    "Test function for reporting results as each emulator is fit"
+    np.random.seed(3482)
+    x = np.random.uniform(size = (12, 3))
+    y = np.array([np.sin(3.*x[:, 0]) + x[:, 1], np.cos(2.*x[:, 1]) - x[:, 2], x[:, 0]*x[:, 2]])
+    nugget = [1.e-6, 1.e-6, 1.e-6]
+    theta = np.zeros(4)
+
+    gp = MultiOutputGP(x, y, nugget)
+    completed = []
+
+    def callback(index, loglike, theta):
+        assert_allclose(gp.emulators[index].theta, theta)
+        completed.append((index, loglike, theta))
+
+    l = gp.learn_hyperparameters(n_tries = 1, theta0 = theta, processes = 2, callback = callback)
+
+    assert sorted([c[0] for c in completed]) == [0, 1, 2]
+    for index, loglike, theta_val in completed:
+        assert_allclose(l[index][0], loglike)
+        assert_allclose(l[index][1], theta_val)
+
+    gp_2 = MultiOutputGP(x, y, nugget)
+    results = list(gp_2.iter_learn_hyperparameters(n_tries = 1, theta0 = theta, processes = 2))
+
+    assert sorted([r[0] for r in results]) == [0, 1, 2]
+    for index, loglike, theta_val in results:
+        assert_allclose(loglike, l[index][0], atol = 1.e-8, rtol = 1.e-5)
+        assert_allclose(gp_2.emulators[index].theta, l[index][1], atol = 1.e-8, rtol = 1.e-5)
+
+    with pytest.raises(AssertionError):
+        gp.learn_hyperparameters(callback = 1.)
+
+class RejectingExecutor(object):
+    "Executor that fails if any task is submitted"
+    def submit(self, *args, **kwargs):
+        raise AssertionError("no tasks should be submitted")
+
+def test_MultiOutputGP_learn_hyperparameters_checkpoint():
+    "Test function for checkpointing and resuming the learn_hyperparameters method"
+    np.random.seed(5321)
+    x = np.random.uniform(size = (10, 2))
+    y = np.array([np.sin(3.*x[:, 0]), np.cos(2.*x[:, 1]), x[:, 0]*x[:, 1]])
+    nugget = [1.e-6, 1.e-6, 1.e-6]
+    theta0 = np.zeros(3)
+
+    with TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, "checkpoint.dat")
+
+        gp = MultiOutputGP(x, y, nugget)
+        l_expected = gp.learn_hyperparameters(n_tries = 1, theta0 = theta0, processes = 1,
+                                              checkpoint = filename)
+        size = os.path.getsize(filename)
+
+        # resuming restores every emulator from the file without fitting
+
+        gp = MultiOutputGP(x, y, nugget)
+        l_actual = gp.learn_hyperparameters(n_tries = 1, theta0 = theta0, checkpoint = filename,
+                                            executor = RejectingExecutor())
+        assert os.path.getsize(filename) == size
+        for emulator, (loglike_actual, theta_actual), (loglike_exp, theta_exp) in zip(gp.emulators, l_actual, l_expected):
+            assert_allclose(loglike_actual, loglike_exp)
+            assert_allclose(theta_actual, theta_exp)
+            assert_allclose(emulator.theta, theta_exp)
+            assert_allclose(emulator.mle_theta, theta_exp)
+            assert_allclose(emulator.loglikelihood(emulator.theta), loglike_exp)
+
+        # an incomplete final record is discarded and that emulator is fit again
+
+        with open(filename, "r+b") as f:
+            f.truncate(size - 5)
+
+        gp = MultiOutputGP(x, y, nugget)
+        results = list(gp.iter_learn_hyperparameters(n_tries = 1, theta0 = theta0, processes = 1,
+                                                     checkpoint = filename, checkpoint_factors = True))
+        refit = results[-1][0]
+        assert sorted([result[0] for result in results[:-1]]) == sorted(set(range(3)) - set([refit]))
+        assert os.path.getsize(filename) > size
+        for index, loglike, theta in results:
+            assert_allclose(loglike, l_expected[index][0], rtol = 1.e-5)
+            assert_allclose(theta, l_expected[index][1], rtol = 1.e-5, atol = 1.e-8)
+
+        # factorizations stored in the file are restored directly
+
+        gp = MultiOutputGP(x, y, nugget)
+        gp.learn_hyperparameters(n_tries = 1, theta0 = theta0, checkpoint = filename,
+                                 executor = RejectingExecutor())
+        L = np.copy(gp.emulators[refit].L)
+        gp.emulators[refit]._set_params(gp.emulators[refit].theta)
+        assert_allclose(L, gp.emulators[refit].L)
+
+        # a checkpoint for different training data is rejected
+
+        gp = MultiOutputGP(x, 2.*y, nugget)
+        with pytest.raises(ValueError):
+            gp.learn_hyperparameters(n_tries = 1, processes = 1, checkpoint = filename)
+
+def test_MultiOutputGP_learn_hyperparameters_checkpoint_partial_group():
+    "Test resuming from a checkpoint that holds results for only part of a group"
+    np.random.seed(5322)
+    x = np.random.uniform(size = (10, 2))
+    y = np.array([np.sin(3.*x[:, 0]), np.cos(2.*x[:, 1]), x[:, 0]*x[:, 1]])
+    nugget = [1.e-6, 1.e-6, 1.e-6]
+    theta0 = np.zeros(3)
+
+    with TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, "checkpoint.dat")
+
+        gp = MultiOutputGP(x, y, nugget)
+        l_expected = gp.learn_hyperparameters(n_tries = 1, theta0 = theta0, processes = 1,
+                                              groups = [[0, 1]], checkpoint = filename)
+
+        # keep the records for emulators 0 and 2, dropping the second member of the group
+
+        records = read_records(filename)[0]
+        os.remove(filename)
+        with open(filename, "ab") as f:
+            write_record(f, records[0])
+            for record in records[1:]:
+                if record[0] != 1:
+                    write_record(f, record)
+
+        # the missing member is set from the recorded group hyperparameters without fitting
+
+        gp = MultiOutputGP(x, y, nugget)
+        results = list(gp.iter_learn_hyperparameters(n_tries = 1, theta0 = theta0, groups = [[0, 1]],
+                                                     checkpoint = filename,
+                                                     executor = RejectingExecutor()))
+        assert sorted([result[0] for result in results]) == [0, 1, 2]
+        assert results[-1][0] == 1
+        assert_allclose(gp.emulators[1].theta, gp.emulators[0].theta)
+        for index, loglike, theta in results:
+            assert_allclose(loglike, l_expected[index][0])
+            assert_allclose(theta, l_expected[index][1])
+
+        records = read_records(filename)[0]
+        assert sorted([record[0] for record in records[1:]]) == [0, 1, 2]
+
+def test_MultiOutputGP_learn_hyperparameters_checkpoint_regroup():
+    "Test resuming from a checkpoint with a different grouping of the emulators"
+    np.random.seed(5323)
+    x = np.random.uniform(size = (10, 2))
+    y = np.array([np.sin(3.*x[:, 0]), np.cos(2.*x[:, 1]), x[:, 0]*x[:, 1]])
+    nugget = [1.e-6, 1.e-6, 1.e-6]
+    theta0 = np.zeros(3)
+
+    with TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, "checkpoint.dat")
+
+        gp = MultiOutputGP(x, y, nugget)
+        gp.learn_hyperparameters(n_tries = 1, theta0 = theta0, processes = 1, checkpoint = filename)
+
+        records = read_records(filename)[0]
+        assert [record[4] for record in records[1:]] == [(0,), (1,), (2,)]
+
+        # emulators fit separately are not used for a group, which is fit again
+
+        gp = MultiOutputGP(x, y, nugget)
+        results = list(gp.iter_learn_hyperparameters(n_tries = 1, theta0 = theta0, processes = 1,
+                                                     groups = [[0, 1]], checkpoint = filename))
+        assert [result[0] for result in results][0] == 2
+        assert sorted([result[0] for result in results[1:]]) == [0, 1]
+        assert_allclose(gp.emulators[0].theta, gp.emulators[1].theta)
+
+        records = read_records(filename)[0]
+        assert [record[4] for record in records[-2:]] == [(0, 1), (0, 1)]
+
+        # resuming with the same grouping restores the group without fitting
+
+        gp = MultiOutputGP(x, y, nugget)
+        gp.learn_hyperparameters(n_tries = 1, theta0 = theta0, groups = [[1, 0]],
+                                 checkpoint = filename, executor = RejectingExecutor())
+        assert_allclose(gp.emulators[0].theta, gp.emulators[1].theta)
+
+        # the members of a shared fit are fit again when resumed separately
+
+        gp = MultiOutputGP(x, y, nugget)
+        results = list(gp.iter_learn_hyperparameters(n_tries = 1, theta0 = theta0, processes = 1,
+                                                     checkpoint = filename))
+        assert [result[0] for result in results][0] == 2
+        assert sorted([result[0] for result in results[1:]]) == [0, 1]
+        assert len(results) == 3
+
+        for index in [0, 1]:
+            gp_single = GaussianProcess(x, y[index], 1.e-6)
+            gp_single.learn_hyperparameters(n_tries = 1, theta0 = theta0)
+            assert_allclose(gp.emulators[index].theta, gp_single.theta, rtol = 1.e-5, atol = 1.e-8)
+
+def test_SharedThetaGP():
+    "Test the joint likelihood and derivatives for a group of targets sharing hyperparameters"
+    np.random.seed(4412)
+    x = np.random.uniform(size = (10, 2))
+    y = np.array([np.sin(4.*x[:,0]), np.cos(3.*x[:,1]), x[:,0]*x[:,1]])
+    theta = np.array([0.5, -0.2, 0.1])
+
+    gp = _SharedThetaGP(x, y, 1.e-6)
+
+    single_gps = [GaussianProcess(x, target, 1.e-6) for target in y]
+    loglike_expected = sum([single_gp.loglikelihood(theta) for single_gp in single_gps])
+    partials_expected = sum([single_gp.partial_devs(theta) for single_gp in single_gps])
+
+    assert_allclose(gp.loglikelihood(theta), loglike_expected)
+    assert_allclose(gp.partial_devs(theta), partials_expected)
+    assert_allclose(gp.partial_devs(theta + 0.1), sum([single_gp.partial_devs(theta + 0.1)
+                                                       for single_gp in single_gps]))
+    assert gp.invQt.shape == (10, 3)
+
+def test_MultiOutputGP_learn_hyperparameters_groups():
+    "Test function for fitting groups of emulators with shared hyperparameters"
+    np.random.seed(4412)
+    x = np.random.uniform(size = (10, 2))
+    y = np.array([np.sin(4.*x[:,0]), np.cos(3.*x[:,1]), x[:,0]*x[:,1], x[:,0]])
+    theta = np.zeros(3)
+
+    gp = MultiOutputGP(x, y, [1.e-6]*4)
+    l = gp.learn_hyperparameters(n_tries = 1, theta0 = theta, processes = 1, groups = [[0, 2, 3]])
+
+    assert_allclose(gp.emulators[0].theta, gp.emulators[2].theta)
+    assert_allclose(gp.emulators[0].theta, gp.emulators[3].theta)
+    assert gp.emulators[0].L is gp.emulators[2].L
+
+    group_gp = _SharedThetaGP(x, y[[0, 2, 3]], 1.e-6)
+    assert_allclose(sum([l[i][0] for i in [0, 2, 3]]), group_gp.loglikelihood(l[0][1]))
+    assert_allclose(l[1][0], GaussianProcess(x, y[1], 1.e-6).loglikelihood(l[1][1]))
+
+    for i, emulator in enumerate(gp.emulators):
+        L, invQt = emulator.L, emulator.invQt
+        emulator._set_params(emulator.theta)
+        assert_allclose(L, emulator.L)
+        assert_allclose(invQt, emulator.invQt)
+
+    with gp.start_pool(processes = 2):
+        l_pool = gp.learn_hyperparameters(n_tries = 1, theta0 = theta, groups = [[0, 2, 3]])
+
+    for (loglike_pool, theta_pool), (loglike, theta_val) in zip(l_pool, l):
+        assert_allclose(loglike_pool, loglike, atol = 1.e-8, rtol = 1.e-5)
+        assert_allclose(theta_pool, theta_val, atol = 1.e-8, rtol = 1.e-5)
+
+    with pytest.raises(AssertionError):
+        gp.learn_hyperparameters(groups = [[0, 1], [1, 2]])
+
+    with pytest.raises(AssertionError):
+        gp.learn_hyperparameters(groups = [[0, 4]])
+
+    with pytest.raises(AssertionError):
+        gp.learn_hyperparameters(groups = [[]])
+
+    gp.set_nugget([1.e-6, None, 1.e-6, 1.e-6])
+    with pytest.raises(AssertionError):
+        gp.learn_hyperparameters(groups = [[0, 1]])
+
 def test_MultiOutputGP_learn_hyperparameters_failures():
     "Test function for the learn_hyperparameters method with bad inputs"
     x = np.reshape(np.array([1., 2., 3., 4., 5., 6., 7., 8., 9.]), (3, 3))
@@ -241,6 +508,98 @@ def test_MultiOutputGP_learn_hyperparameters_failures():
     with pytest.raises(AssertionError):
         l = gp.learn_hyperparameters(theta0 = [1., 2.])
 
+def test_batch_loglikelihood():
+    "Test the batched log-likelihood and gradient against the GaussianProcess class"
+    np.random.seed(57483)
+    x = np.random.uniform(size = (10, 2))
+    y = np.random.normal(size = (4, 10))
+    theta = np.random.normal(size = (4, 3))
+    sqdist = np.transpose((x[:, None, :] - x[None, :, :])**2, (2, 0, 1))
+    nugget = np.array([1.e-6, 1.e-4, 0.1, 1.e-6])
+    loglike, partials, L, invQt, logdetQ = _batch_loglikelihood(theta, sqdist, y, nugget,
+                                                                np.zeros(4, dtype = bool))
+    for i in range(4):
+        gp = GaussianProcess(x, y[i], nugget[i])
+        assert_allclose(loglike[i], gp.loglikelihood(theta[i]))
+        assert_allclose(partials[i], gp.partial_devs(theta[i]))
+        assert_allclose(L[i], gp.L)
+        assert_allclose(invQt[i], gp.invQt)
+        assert_allclose(logdetQ[i], gp.logdetQ)
+
+    # members that overflow are flagged with infinite values and a zero gradient
+
+    theta[1, -1] = 1000.
+    loglike, partials = _batch_loglikelihood(theta, sqdist, y, nugget, np.zeros(4, dtype = bool))[:2]
+    assert loglike[1] == np.inf
+    assert_allclose(partials[1], np.zeros(3))
+    assert np.all(np.isfinite(loglike[[0, 2, 3]]))
+
+    loglike_nograd, partials_nograd = _batch_loglikelihood(theta, sqdist, y, nugget,
+                                                           np.zeros(4, dtype = bool),
+                                                           do_grad = False)[:2]
+    assert_allclose(loglike_nograd, loglike)
+    assert partials_nograd is None
+
+def test_batch_minimize():
+    "Test the vectorized L-BFGS minimization on a batch of quadratic functions"
+    centers = np.array([[1., 2.], [-3., 0.5], [0., 0.]])
+    scales = np.array([[1., 10.], [0.1, 1.], [5., 5.]])
+
+    n_grad = [0, 0]
+
+    def objective(x, active, do_grad):
+        diff = x - centers[active]
+        n_grad[do_grad] += 1
+        grad = 2.*scales[active]*diff if do_grad else None
+        return np.sum(scales[active]*diff**2, axis = 1), grad
+
+    x, f = _batch_minimize(objective, np.zeros((3, 2)))
+    assert_allclose(x, centers, atol = 1.e-4)
+    assert_allclose(f, np.zeros(3), atol = 1.e-8)
+
+    # gradients are only computed at the start and once per iteration at accepted points
+
+    assert n_grad[False] > 0
+    assert n_grad[True] <= n_grad[False] + 1
+
+def test_MultiOutputGP_learn_hyperparameters_batch():
+    "Test the batched learn_hyperparameters method against fitting emulators individually"
+    np.random.seed(4335)
+    x = np.random.uniform(size = (15, 2))
+    y = np.array([np.sin(a*x[:, 0]) + b*x[:, 1] for a, b in np.random.uniform(1., 4., size = (5, 2))])
+    gp = MultiOutputGP(x, y, [1.e-6]*5)
+    theta0 = np.zeros(3)
+    l = gp.learn_hyperparameters_batch(n_tries = 1, theta0 = theta0, batch_size = 2)
+    assert len(l) == 5
+    for emulator, (loglike, theta), yvals in zip(gp.emulators, l, y):
+        gp_single = GaussianProcess(x, yvals, 1.e-6)
+        loglike_single = gp_single.learn_hyperparameters(n_tries = 1, theta0 = theta0)[0]
+        assert_allclose(loglike, loglike_single, rtol = 1.e-4)
+        assert_allclose(emulator.theta, theta)
+        assert_allclose(emulator.mle_theta, theta)
+
+        # installed factorization must match one computed from the hyperparameters
+
+        L, invQt, logdetQ = emulator.L, emulator.invQt, emulator.logdetQ
+        emulator._set_params(emulator.theta)
+        assert_allclose(L, emulator.L, atol = 1.e-8)
+        assert_allclose(invQt, emulator.invQt, rtol = 1.e-5)
+        assert_allclose(logdetQ, emulator.logdetQ)
+
+def test_MultiOutputGP_learn_hyperparameters_batch_failures():
+    "Test function for the learn_hyperparameters_batch method with bad inputs"
+    x = np.reshape(np.array([1., 2., 3., 4., 5., 6., 7., 8., 9.]), (3, 3))
+    y = np.reshape(np.array([2., 4., 6.]), (1, 3))
+    gp = MultiOutputGP(x, y)
+    with pytest.raises(AssertionError):
+        gp.learn_hyperparameters_batch(n_tries = -1)
+    with pytest.raises(AssertionError):
+        gp.learn_hyperparameters_batch(batch_size = 0)
+    with pytest.raises(AssertionError):
+        gp.learn_hyperparameters_batch(maxiter = 0)
+    with pytest.raises(AssertionError):
+        gp.learn_hyperparameters_batch(theta0 = [1., 2.])
+
 def test_MultiOutputGP_predict():
     "Test function for the predict method"
     x = np.reshape(np.array([1., 2., 3., 2., 4., 1., 4., 2., 2.]), (3, 3))
@@ -272,6 +631,60 @@ def test_MultiOutputGP_predict():
     assert var_actual is None
     assert deriv_actual is None
 
+def test_MultiOutputGP_predict_outputs():
+    "Test function for the predict method with a subset of outputs and lazy predictions"
+    x = np.reshape(np.array([1., 2., 3., 2., 4., 1., 4., 2., 2.]), (3, 3))
+    y = np.array([[2., 3., 4.], [4., 2., 3.], [1., 5., 2.]])
+    theta = np.array([np.zeros(4), np.ones(4), -np.ones(4)])
+    x_star = np.array([[1., 3., 2.], [3., 2., 1.]])
+    gp = MultiOutputGP(x, y)
+    gp._set_params(theta)
+    predict_all, var_all, deriv_all = gp.predict(x_star, processes = 1)
+
+    predict_actual, var_actual, deriv_actual = gp.predict(x_star, processes = 1, outputs = [2, 0])
+    assert_allclose(predict_actual, predict_all[[2, 0]])
+    assert_allclose(var_actual, var_all[[2, 0]])
+    assert_allclose(deriv_actual, deriv_all[[2, 0]])
+
+    predict_actual, var_actual, deriv_actual = gp.predict(x_star, do_deriv = False, processes = 1,
+                                                          outputs = [1])
+    assert_allclose(predict_actual, predict_all[[1]])
+    assert_allclose(var_actual, var_all[[1]])
+    assert deriv_actual is None
+
+    result = gp.predict(x_star, outputs = [1, 2], lazy = True)
+    assert isinstance(result, MultiOutputPrediction)
+    assert len(result) == 2
+    assert result._cache == {}
+    predict_actual, var_actual, deriv_actual = result[-1]
+    assert list(result._cache) == [1]
+    assert_allclose(predict_actual, predict_all[2])
+    assert_allclose(var_actual, var_all[2])
+    assert_allclose(deriv_actual, deriv_all[2])
+    assert result[1] is result[-1]
+
+    predict_actual, var_actual, deriv_actual = result.to_arrays()
+    assert_allclose(predict_actual, predict_all[1:])
+    assert_allclose(var_actual, var_all[1:])
+    assert_allclose(deriv_actual, deriv_all[1:])
+    assert len(list(result)) == 2
+
+    result = gp.predict(x_star, do_deriv = False, do_unc = False, lazy = True)
+    assert len(result) == 3
+    predict_actual, var_actual, deriv_actual = result.to_arrays()
+    assert_allclose(predict_actual, predict_all)
+    assert var_actual is None
+    assert deriv_actual is None
+
+    with pytest.raises(AssertionError):
+        result[3]
+    with pytest.raises(AssertionError):
+        gp.predict(x_star, outputs = [3])
+    with pytest.raises(AssertionError):
+        gp.predict(x_star, outputs = [-1])
+    with pytest.raises(AssertionError):
+        gp.predict(x_star, outputs = [])
+
 def test_MultiOutputGP_predict_failures():
     "Test function for the predict method with bad inputs"
     x = np.reshape(np.array([1., 2., 3., 4., 5., 6., 7., 8., 9.]), (3, 3))
@@ -297,6 +710,129 @@ def test_MultiOutputGP_predict_failures():
     with pytest.raises(AssertionError):
         predict, unc, deriv = gp.predict(x_star, processes = -1)
 
+def test_MultiOutputGP_pool():
+    "Test function for fitting and predicting with a persistent worker pool"
+    np.random.seed(8214)
+    x = np.random.uniform(size = (12, 3))
+    y = np.array([np.sin(3.*x[:, 0]) + x[:, 1], np.cos(2.*x[:, 1]) - x[:, 2]])
+    x_star = np.array([[0.1, 0.3, 0.2], [0.3, 0.2, 0.1]])
+    theta = np.zeros(4)
+    nugget = [1.e-6, 1.e-6]
+
+    gp = MultiOutputGP(x, y, nugget)
+    l_expected = gp.learn_hyperparameters(n_tries = 1, theta0 = theta, processes = 1)
+    predict_expected, var_expected, deriv_expected = gp.predict(x_star, processes = 1)
+
+    assert gp.emulators[0].inputs is gp.emulators[1].inputs
+
+    # calls without a persistent pool use a temporary pool that is shut down afterwards
+
+    assert gp._pool is None
+    assert gp._shared == []
+
+    for index in range(2):
+        gp_single = GaussianProcess(x, y[index], nugget[index])
+        gp_single._set_params(l_expected[index][1])
+        assert_allclose(predict_expected[index], gp_single.predict(x_star)[0], atol = 1.e-8, rtol = 1.e-5)
+
+    fits = gp.iter_learn_hyperparameters(n_tries = 1, theta0 = theta, processes = 1)
+    next(fits)
+    assert not gp._pool is None
+    fits.close()
+    assert gp._pool is None
+    assert gp._shared == []
+
+    with MultiOutputGP(x, y, nugget).start_pool(processes = 2) as gp:
+        assert not gp._pool is None
+        assert len(gp._shared) == 2
+        shared_names = [shm.name for shm in gp._shared]
+        l_actual = gp.learn_hyperparameters(n_tries = 1, theta0 = theta)
+        for (loglike_actual, theta_actual), (loglike_exp, theta_exp) in zip(l_actual, l_expected):
+            assert_allclose(loglike_actual, loglike_exp, atol = 1.e-8, rtol = 1.e-5)
+            assert_allclose(theta_actual, theta_exp, atol = 1.e-8, rtol = 1.e-5)
+
+        for i in range(3):
+            predict_actual, var_actual, deriv_actual = gp.predict(x_star)
+            assert_allclose(predict_actual, predict_expected, atol = 1.e-8, rtol = 1.e-5)
+            assert_allclose(var_actual, var_expected, atol = 1.e-8, rtol = 1.e-5)
+            assert_allclose(deriv_actual, deriv_expected, atol = 1.e-8, rtol = 1.e-5)
+
+        predict_actual, var_actual, deriv_actual = gp.predict(x_star, do_deriv = False, outputs = [1])
+        assert_allclose(predict_actual, predict_expected[[1]], atol = 1.e-8, rtol = 1.e-5)
+        assert_allclose(var_actual, var_expected[[1]], atol = 1.e-8, rtol = 1.e-5)
+        assert deriv_actual is None
+
+        predict_actual, var_actual, deriv_actual = gp.predict(x_star, do_unc = False, outputs = [1, 0])
+        assert_allclose(predict_actual, predict_expected[[1, 0]], atol = 1.e-8, rtol = 1.e-5)
+        assert var_actual is None
+        assert_allclose(deriv_actual, deriv_expected[[1, 0]], atol = 1.e-8, rtol = 1.e-5)
+
+        gp._set_params(np.zeros((2, 4)))
+        predict_actual, _, _ = gp.predict(x_star)
+        gp_single = GaussianProcess(x, y[0], nugget[0])
+        gp_single._set_params(np.zeros(4))
+        assert_allclose(predict_actual[0], gp_single.predict(x_star)[0], atol = 1.e-8, rtol = 1.e-5)
+
+    assert gp._pool is None
+    assert gp._shared == []
+    for name in shared_names:
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name = name)
+
+    with pytest.raises(AssertionError):
+        gp.start_pool(processes = 0)
+
+def test_MultiOutputGP_pool_set_nugget():
+    "Test that a persistent pool fits with the nugget set after the pool was started"
+    np.random.seed(8214)
+    x = np.random.uniform(size = (12, 3))
+    y = np.array([np.sin(3.*x[:, 0]) + x[:, 1], np.cos(2.*x[:, 1]) - x[:, 2]])
+    theta = np.zeros(4)
+
+    with MultiOutputGP(x, y, [1.e-6, 1.e-6]).start_pool(processes = 2) as gp:
+        gp.set_nugget([1., 1.])
+        l_actual = gp.learn_hyperparameters(n_tries = 1, theta0 = theta)
+
+        for emulator, (loglike, theta_actual) in zip(gp.emulators, l_actual):
+            gp_single = GaussianProcess(x, emulator.targets, 1.)
+            assert_allclose(loglike, gp_single.loglikelihood(theta_actual))
+            assert_allclose(emulator.L, gp_single.L)
+
+        gp.set_nugget([0.5, 0.5])
+        l_actual = gp.learn_hyperparameters(n_tries = 1, theta0 = theta, groups = [[0, 1]])
+
+        for emulator, (loglike, theta_actual) in zip(gp.emulators, l_actual):
+            gp_single = GaussianProcess(x, emulator.targets, 0.5)
+            assert_allclose(loglike, gp_single.loglikelihood(theta_actual))
+            assert_allclose(emulator.L, gp_single.L)
+
+def test_MultiOutputGP_executor():
+    "Test function for fitting and predicting with an executor"
+    x = np.reshape(np.array([1., 2., 3., 2., 4., 1., 4., 2., 2.]), (3, 3))
+    y = np.array([[2., 3., 4.], [4., 2., 3.]])
+    x_star = np.array([[1., 3., 2.], [3., 2., 1.]])
+    theta = np.zeros(4)
+
+    gp = MultiOutputGP(x, y, [1.e-6, 1.e-6])
+    l_expected = gp.learn_hyperparameters(n_tries = 1, theta0 = theta, processes = 1)
+    predict_expected = gp.predict(x_star, processes = 1)
+
+    gp = MultiOutputGP(x, y, [1.e-6, 1.e-6])
+    with ThreadPoolExecutor(2) as executor:
+        l_actual = gp.learn_hyperparameters(n_tries = 1, theta0 = theta, executor = executor)
+        predict_actual = gp.predict(x_star, do_deriv = False, executor = executor, outputs = [1])
+
+        with pytest.raises(AssertionError):
+            gp.predict(x_star, executor = object())
+
+    for (loglike_actual, _), (loglike_exp, _) in zip(l_actual, l_expected):
+        assert_allclose(loglike_actual, loglike_exp, atol = 1.e-8, rtol = 1.e-5)
+    for emulator, (_, theta_actual) in zip(gp.emulators, l_actual):
+        assert_allclose(emulator.theta, theta_actual)
+    assert_allclose(predict_actual[0], predict_expected[0][[1]], atol = 1.e-8, rtol = 1.e-5)
+    assert_allclose(predict_actual[1], predict_expected[1][[1]], atol = 1.e-8, rtol = 1.e-5)
+    assert predict_actual[2] is None
+
 def test_MultiOutputGP_str():
     "Test function for string method"
     x = np.reshape(np.array([1., 2., 3.]), (1, 3))
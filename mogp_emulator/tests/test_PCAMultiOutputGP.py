@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose
+from .. import PCAMultiOutputGP, MultiOutputGP
+
+def make_data():
+    "Make a set of outputs that lie close to a two-dimensional subspace"
+    x = np.reshape(np.linspace(0., 1., 8), (8, 1))
+    s = np.linspace(0., 1., 30)
+    y = (np.sin(2.*x[:, 0])*s[:, None] + np.cos(3.*x[:, 0])*s[:, None]**2 +
+         1.e-3*np.sin(20.*x[:, 0])*np.cos(5.*s[:, None]))
+    return x, y
+
+def test_PCAMultiOutputGP_init():
+    "Test function for correct functioning of the init method of PCAMultiOutputGP"
+    x, y = make_data()
+
+    gp = PCAMultiOutputGP(x, y, n_components = 3)
+    assert gp.get_n_emulators() == 30
+    assert gp.get_n_components() == 3
+    assert gp.get_n() == 8
+    assert gp.get_D() == 1
+    assert isinstance(gp.gp, MultiOutputGP)
+    assert gp.gp.get_n_emulators() == 3
+    assert gp.gp.get_nugget() == [None, None, None]
+    assert gp.basis.shape == (30, 3)
+    assert_allclose(np.dot(gp.basis.T, gp.basis), np.eye(3), atol = 1.e-10)
+    assert_allclose(gp.mean, np.mean(y, axis = 1))
+
+    gp = PCAMultiOutputGP(x, y, explained_variance = 0.99, nugget = 1.e-6)
+    assert gp.get_n_components() == 2
+    assert gp.explained_variance >= 0.99
+    assert_allclose(np.array(gp.gp.get_nugget()), 1.e-6)
+
+    gp = PCAMultiOutputGP(x, y, explained_variance = 1.)
+    assert gp.get_n_components() == 3
+    assert_allclose(gp.explained_variance, 1.)
+    assert_allclose(gp.get_truncation_variance(), np.zeros(30), atol = 1.e-20)
+
+def test_PCAMultiOutputGP_init_failures():
+    "Tests of PCAMultiOutputGP init method that should fail"
+    x, y = make_data()
+
+    with pytest.raises(ValueError):
+        PCAMultiOutputGP(x[:, 0], y)
+    with pytest.raises(ValueError):
+        PCAMultiOutputGP(x, y[0])
+    with pytest.raises(ValueError):
+        PCAMultiOutputGP(x[:-1], y)
+    with pytest.raises(ValueError):
+        PCAMultiOutputGP(x, np.ones((30, 8)))
+    with pytest.raises(AssertionError):
+        PCAMultiOutputGP(x, y, n_components = 0)
+    with pytest.raises(AssertionError):
+        PCAMultiOutputGP(x, y, n_components = 9)
+    with pytest.raises(AssertionError):
+        PCAMultiOutputGP(x, y, explained_variance = 0.)
+    with pytest.raises(AssertionError):
+        PCAMultiOutputGP(x, y, explained_variance = 1.5)
+    with pytest.raises(AssertionError):
+        PCAMultiOutputGP(x, y, nugget = -1.)
+
+def test_PCAMultiOutputGP_project_reconstruct():
+    "Test the project and reconstruct methods and the truncation variance"
+    x, y = make_data()
+
+    gp = PCAMultiOutputGP(x, y, n_components = 8)
+    assert_allclose(gp.reconstruct(gp.project(y)), y, atol = 1.e-10)
+    assert_allclose(gp.reconstruct(gp.project(y[:, 0])), y[:, 0], atol = 1.e-10)
+    assert_allclose(gp.get_truncation_variance(), np.zeros(30), atol = 1.e-20)
+
+    gp = PCAMultiOutputGP(x, y, n_components = 2)
+    assert gp.project(y).shape == (2, 8)
+    assert gp.project(y[:, 0]).shape == (2,)
+    error = y - gp.reconstruct(gp.project(y))
+    assert_allclose(gp.get_truncation_variance(), np.mean(error**2, axis = 1))
+
+    with pytest.raises(AssertionError):
+        gp.project(y[:-1])
+    with pytest.raises(AssertionError):
+        gp.reconstruct(np.zeros(3))
+
+def test_PCAMultiOutputGP_predict():
+    "Test the learn_hyperparameters and predict methods"
+    x, y = make_data()
+    x_star = np.array([[0.25], [0.6]])
+
+    gp = PCAMultiOutputGP(x, y, n_components = 2, nugget = 1.e-8)
+    np.random.seed(4823)
+    l = gp.learn_hyperparameters(n_tries = 5, processes = 1)
+    assert len(l) == 2
+
+    mean, unc, deriv = gp.predict(x_star, processes = 1)
+    assert mean.shape == (30, 2)
+    assert unc.shape == (30, 2)
+    assert deriv.shape == (30, 2, 1)
+
+    # reconstruction from the component predictions
+
+    mean_z, unc_z, deriv_z = gp.gp.predict(x_star, processes = 1)
+    assert_allclose(mean, gp.reconstruct(mean_z))
+    assert_allclose(unc, np.dot(gp.basis**2, unc_z) + gp.get_truncation_variance()[:, None])
+    assert_allclose(deriv[:, :, 0], np.dot(gp.basis, deriv_z[:, :, 0]))
+    assert np.all(unc >= gp.get_truncation_variance()[:, None])
+
+    s = np.linspace(0., 1., 30)
+    y_star = np.sin(2.*x_star[:, 0])*s[:, None] + np.cos(3.*x_star[:, 0])*s[:, None]**2
+    assert_allclose(mean, y_star, atol = 1.e-2)
+
+    mean_2, unc_2, deriv_2 = gp.predict(x_star[0], do_deriv = False, do_unc = False, processes = 1)
+    assert_allclose(mean_2[:, 0], mean[:, 0])
+    assert unc_2 is None
+    assert deriv_2 is None
+
+def test_PCAMultiOutputGP_str():
+    "Test function for string method"
+    x, y = make_data()
+    gp = PCAMultiOutputGP(x, y, n_components = 2)
+    expected = ("PCA Multi-Output Gaussian Process with:\n"+
+                 "30 outputs\n"+
+                 "2 components\n"+
+                 "8 training examples\n"+
+                 "1 input variables")
+    assert str(gp) == expected
@@ -4,9 +4,11 @@ import pytest
 from inspect import signature
 import types
 from ..ExperimentalDesign import LatinHypercubeDesign
-from ..SequentialDesign import SequentialDesign, MICEDesign, MICEFastGP
+from ..SequentialDesign import SequentialDesign, MICEDesign, MICEFastGP, MultiOutputMICEDesign
 from ..GaussianProcess import GaussianProcess
-from tempfile import TemporaryFile
+from tempfile import TemporaryFile, TemporaryDirectory
+import os
+from concurrent.futures import ThreadPoolExecutor
 
 def test_SequentialDesign_init():
     "test the init method of ExperimentalDesign"
@@ -22,12 +24,17 @@ def test_SequentialDesign_init():
     assert sd.n_samples == None
     assert sd.n_init == 10
     assert sd.n_cand == 50
+    assert sd.n_pool == None
     assert sd.current_iteration == 0
     assert not sd.initialized
     assert sd.inputs == None
     assert sd.targets == None
     assert sd.candidates == None
 
+    sd = SequentialDesign(ed, f, n_samples = 100, n_init = 20, n_cand = 100, n_pool = 1000)
+    assert sd.n_pool == 1000
+    assert sd.get_n_pool() == 1000
+
     sd = SequentialDesign(ed, f, n_samples = 100, n_init = 20, n_cand = 100)
     assert type(sd.base_design).__name__ == 'LatinHypercubeDesign'
     assert callable(sd.f)
@@ -70,6 +77,9 @@ def test_SequentialDesign_init_failures():
     with pytest.raises(ValueError):
         sd = SequentialDesign(ed, f, n_cand = -1)
 
+    with pytest.raises(ValueError):
+        sd = SequentialDesign(ed, f, n_cand = 10, n_pool = 5)
+
 def test_SequentialDesign_save_design():
     "test the save_design method"
 
@@ -168,6 +178,115 @@ def test_SequentialDesign_load_design():
         with pytest.raises(AssertionError):
             sd.load_design(tmp)
 
+def test_SequentialDesign_journal():
+    "test recording a design in a journal and resuming it"
+
+    np.random.seed(74632)
+
+    ed = LatinHypercubeDesign(3)
+
+    def f(x):
+        return np.sum(x)
+
+    def tmp_eval_metric(self):
+        return 0
+
+    def tmp_estimate_next_target(self, next_point):
+        return np.array([1.])
+
+    with TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, "design.journal")
+
+        sd = SequentialDesign(ed, f, n_init = 4, n_cand = 5)
+        sd._eval_metric = types.MethodType(tmp_eval_metric, sd)
+        sd._estimate_next_target = types.MethodType(tmp_estimate_next_target, sd)
+        sd.open_journal(filename)
+
+        with pytest.raises(AssertionError):
+            sd.open_journal(filename)
+
+        sd.run_sequential_design(2)
+        sd.get_batch_points(2)
+        sd.close_journal()
+
+        # estimated batch targets are not recorded
+
+        sd_2 = SequentialDesign(ed, f, n_init = 4, n_cand = 5)
+        sd_2.open_journal(filename)
+
+        assert_allclose(sd_2.get_inputs(), sd.get_inputs())
+        assert_allclose(sd_2.get_targets(), sd.get_targets())
+        assert_allclose(sd_2.get_candidates(), sd.get_candidates())
+        assert sd_2.get_current_iteration() == 6
+        assert sd_2.initialized
+
+        with pytest.raises(AssertionError):
+            sd_2.load_design(filename)
+
+        sd_2.set_batch_targets(np.sum(sd_2.get_inputs()[-2:], axis = 1))
+        sd_2.close_journal()
+
+        sd_3 = SequentialDesign(ed, f, n_init = 4, n_cand = 5)
+        sd_3.open_journal(filename)
+
+        assert_allclose(sd_3.get_inputs(), sd_2.get_inputs())
+        assert_allclose(sd_3.get_targets(), np.sum(sd_2.get_inputs(), axis = 1))
+        assert sd_3.get_current_iteration() == 8
+        sd_3.close_journal()
+
+        # a partially written record at the end of the file is discarded
+
+        size = os.path.getsize(filename)
+        with open(filename, "ab") as journal:
+            journal.write(b"partial record")
+
+        sd_4 = SequentialDesign(ed, f, n_init = 4, n_cand = 5)
+        sd_4.open_journal(filename)
+
+        assert_allclose(sd_4.get_targets(), sd_3.get_targets())
+        assert os.path.getsize(filename) == size
+        sd_4.close_journal()
+
+        # journal must match the design
+
+        sd_5 = SequentialDesign(ed, f, n_init = 4, n_cand = 6)
+
+        with pytest.raises(ValueError):
+            sd_5.open_journal(filename)
+
+        # starting a journal for an existing design records its current state
+
+        filename_2 = os.path.join(tmpdir, "design_2.journal")
+
+        sd_6 = SequentialDesign(ed, f, n_init = 4, n_cand = 5)
+        sd_6.open_journal(filename_2)
+        sd_6.generate_initial_design()
+        sd_6.generate_initial_design()
+        sd_6.close_journal()
+
+        sd_7 = SequentialDesign(ed, f, n_init = 4, n_cand = 5)
+        sd_7.open_journal(filename_2)
+
+        assert_allclose(sd_7.get_inputs(), sd_6.get_inputs())
+        assert sd_7.get_targets() is None
+        assert sd_7.get_current_iteration() == 4
+        assert not sd_7.initialized
+
+        sd_7.set_initial_targets(np.sum(sd_7.get_inputs(), axis = 1))
+        sd_7.close_journal()
+
+        filename_3 = os.path.join(tmpdir, "design_3.journal")
+
+        sd_7.open_journal(filename_3)
+        sd_7.close_journal()
+
+        sd_8 = SequentialDesign(ed, f, n_init = 4, n_cand = 5)
+        sd_8.open_journal(filename_3)
+
+        assert_allclose(sd_8.get_inputs(), sd_7.get_inputs())
+        assert_allclose(sd_8.get_targets(), sd_7.get_targets())
+        sd_8.close_journal()
+
 def test_SequentialDesign_has_function():
     "test has_function method"
 
@@ -384,10 +503,27 @@ def test_SequentialDesign_run_initial_design():
     assert sd.initialized
     assert sd.current_iteration == 4
 
+    np.random.seed(74632)
+
+    sd = SequentialDesign(ed, f, n_init = 4)
+    with ThreadPoolExecutor(2) as executor:
+        sd.run_initial_design(executor = executor)
+    assert_allclose(sd.inputs, initial_design_expected)
+    assert_allclose(sd.targets, targets_expected)
+    assert sd.current_iteration == 4
+
     sd = SequentialDesign(ed)
     with pytest.raises(AssertionError):
         sd.run_initial_design()
 
+    def f_bad(x):
+        return np.array([1., 2.])
+
+    sd = SequentialDesign(ed, f_bad, n_init = 4)
+    with ThreadPoolExecutor(2) as executor:
+        with pytest.raises(ValueError):
+            sd.run_initial_design(executor = executor)
+
 def test_SequentialDesign_generate_candidates():
     "test the _generate_candidates method"
 
@@ -406,6 +542,240 @@ def test_SequentialDesign_generate_candidates():
     sd._generate_candidates()
     assert_allclose(sd.candidates, candidates_expected)
 
+def test_SequentialDesign_generate_candidates_pool():
+    "test the _generate_candidates method when screening a pool of candidates"
+
+    np.random.seed(74632)
+
+    ed = LatinHypercubeDesign(3)
+
+    def f(x):
+        return np.sum(x)
+
+    sd = SequentialDesign(ed, f, n_init = 4, n_cand = 5, n_pool = 250)
+    sd.pool_chunk_size = 250
+    sd.run_initial_design()
+
+    state = np.random.get_state()
+    pool = ed.sample(250)
+    np.random.set_state(state)
+
+    sd._generate_candidates()
+
+    scores = sd._screen_candidates(pool)
+    scores_expected = np.min(np.sum((pool[:, None, :] - sd.get_inputs()[None, :, :])**2, axis = 2), axis = 1)
+
+    assert_allclose(scores, scores_expected)
+
+    # candidates are picked greedily, each maximizing the distance to the design and earlier picks
+
+    design = sd.get_inputs()
+    candidates_expected = []
+    for i in range(5):
+        dist = np.min(np.sum((pool[:, None, :] - design[None, :, :])**2, axis = 2), axis = 1)
+        candidates_expected.append(pool[np.argmax(dist)])
+        design = np.concatenate((design, pool[np.argmax(dist)][None, :]))
+    candidates_expected = np.array(candidates_expected)
+
+    assert sd.get_candidates().shape == (5, 3)
+    assert_allclose(sd.get_candidates(), candidates_expected)
+
+    # pools drawn in chunks keep n_cand distinct points from the pool
+
+    np.random.seed(74632)
+    sd = SequentialDesign(ed, f, n_init = 4, n_cand = 5, n_pool = 250)
+    sd.pool_chunk_size = 100
+    sd.run_initial_design()
+
+    state = np.random.get_state()
+    pool = np.concatenate([ed.sample(100), ed.sample(100), ed.sample(50)])
+    np.random.set_state(state)
+
+    sd._generate_candidates()
+
+    assert sd.get_candidates().shape == (5, 3)
+    assert len(set(point.tobytes() for point in sd.get_candidates())) == 5
+    assert all([np.any(np.all(pool == point, axis = 1)) for point in sd.get_candidates()])
+
+    # pending points are included in the screening
+
+    sd.pending = {0: pool[0]}
+
+    assert_allclose(sd._screen_candidates(pool[:1]), 0.)
+
+    sd = SequentialDesign(ed, f, n_cand = 5, n_pool = 10)
+
+    assert_allclose(sd._screen_candidates(pool[:3]), np.zeros(3))
+
+def test_SequentialDesign_select_candidates_coverage():
+    "test that candidates selected from a pool are spread out rather than clustered in one gap"
+
+    np.random.seed(2741)
+
+    ed = LatinHypercubeDesign(2)
+
+    sd = SequentialDesign(ed, n_cand = 10, n_pool = 2000)
+    sd.inputs = np.array([[0., 0.], [0.1, 0.], [0., 0.1], [0.1, 0.1]])
+
+    pool = np.random.uniform(size = (2000, 2))
+    scores = sd._screen_candidates(pool)
+
+    selected = sd._select_candidates(pool, scores)
+
+    assert len(selected) == 10
+    assert len(set(selected)) == 10
+    assert selected[0] == np.argmax(scores)
+
+    def min_spacing(points):
+        dist = np.sum((points[:, None, :] - points[None, :, :])**2, axis = 2)
+        return np.sqrt(np.min(dist[np.triu_indices(len(points), 1)]))
+
+    top_k = pool[np.argsort(scores)[-10:]]
+
+    assert np.all(np.sum(top_k, axis = 1) > 1.)
+    assert min_spacing(pool[selected]) > 0.2
+    assert min_spacing(pool[selected]) > 5.*min_spacing(top_k)
+    assert np.any(pool[selected][:, 0] < 0.5)
+    assert np.any(pool[selected][:, 1] < 0.5)
+
+    # no more points than are available are selected
+
+    assert_allclose(np.sort(sd._select_candidates(pool[:3], scores[:3])), np.arange(3))
+
+def test_SequentialDesign_set_history_matching():
+    "test the set_history_matching method of a sequential design"
+
+    ed = LatinHypercubeDesign(3)
+
+    sd = SequentialDesign(ed)
+
+    assert sd.history_matching is None
+    assert sd.get_NROY_gp() is None
+
+    sd.set_history_matching([1., 0.1], threshold = 2., discrepancy = 0.5, refresh = 3,
+                            max_draws = 1000, nugget = 1.e-6)
+
+    assert len(sd.history_matching) == 1
+    assert_allclose(sd.history_matching[0].obs, [1., 0.1])
+    assert_allclose(sd.history_matching[0].threshold, 2.)
+    assert_allclose(sd.nroy_discrepancy, 0.5)
+    assert sd.nroy_refresh == 3
+    assert sd.nroy_max_draws == 1000
+    assert_allclose(sd.nroy_nugget, 1.e-6)
+
+    sd.set_history_matching(None)
+
+    assert sd.history_matching is None
+
+    with pytest.raises(ValueError):
+        sd.set_history_matching(1., refresh = 0)
+
+    with pytest.raises(ValueError):
+        sd.set_history_matching(1., max_draws = 0)
+
+    with pytest.raises(AssertionError):
+        sd.set_history_matching(1., discrepancy = -1.)
+
+    md = MultiOutputMICEDesign(ed, 2)
+
+    md.set_history_matching([1., [2., 0.1]])
+
+    assert len(md.history_matching) == 2
+    assert_allclose(md.history_matching[1].obs, [2., 0.1])
+
+    with pytest.raises(AssertionError):
+        md.set_history_matching([1.])
+
+def test_SequentialDesign_sample_candidates():
+    "test that candidates are drawn from the NROY space when using history matching"
+
+    np.random.seed(74632)
+
+    ed = LatinHypercubeDesign(2)
+
+    def f(x):
+        return 4.*x[0] + x[1]
+
+    sd = SequentialDesign(ed, f, n_init = 8, n_cand = 20)
+
+    sd.set_history_matching([2., 0.01], refresh = 2, nugget = 1.e-6)
+
+    assert sd._sample_candidates(3).shape == (3, 2)
+    assert sd.get_NROY_gp() is None
+
+    sd.run_initial_design()
+    sd._generate_candidates()
+
+    gp = sd.get_NROY_gp()
+
+    assert isinstance(gp, GaussianProcess)
+    assert sd.get_candidates().shape == (20, 2)
+    assert np.all(sd._get_implausibility(sd.get_candidates()) <= 3.)
+    assert np.all(np.abs(np.array([f(x) for x in sd.get_candidates()]) - 2.) < 0.5)
+
+    mean, unc, _ = gp.predict(sd.get_candidates(), do_deriv = False)
+    assert_allclose(sd._get_implausibility(sd.get_candidates()),
+                    np.abs(mean - 2.)/np.sqrt(unc + 0.01))
+
+    sd.current_iteration = 9
+    sd._generate_candidates()
+
+    assert sd.get_NROY_gp() is gp
+
+    sd.current_iteration = 8
+
+    sd.set_history_matching(10., max_draws = 100, nugget = 1.e-6)
+
+    with pytest.warns(UserWarning):
+        candidates = sd._sample_candidates(5)
+
+    assert candidates.shape == (5, 2)
+
+def test_SequentialDesign_predict_candidates():
+    "test the method to predict a GP on all candidates"
+
+    np.random.seed(74632)
+
+    ed = LatinHypercubeDesign(3)
+
+    def f(x):
+        return np.sum(x)
+
+    sd = SequentialDesign(ed, f, n_init = 4, n_cand = 6)
+
+    sd.run_initial_design()
+
+    with pytest.raises(AssertionError):
+        sd._predict_candidates(None)
+
+    sd._generate_candidates()
+
+    gp = GaussianProcess(sd.get_inputs(), sd.get_targets())
+    gp.learn_hyperparameters()
+
+    mean, unc = sd._predict_candidates(gp)
+    mean_expected, unc_expected, _ = gp.predict(sd.get_candidates())
+
+    assert_allclose(mean, mean_expected)
+    assert_allclose(unc, unc_expected)
+
+    mean_2, unc_2 = sd._predict_candidates(gp)
+
+    assert mean_2 is mean
+    assert unc_2 is unc
+
+    mean, unc = sd._predict_candidates(gp, do_unc = False)
+
+    assert_allclose(mean, mean_expected)
+
+    sd._generate_candidates()
+
+    mean, unc = sd._predict_candidates(gp, do_unc = False)
+    mean_expected, _, _ = gp.predict(sd.get_candidates())
+
+    assert_allclose(mean, mean_expected)
+    assert unc is None
+
 def test_SequentialDesign_eval_metric():
     "test the _eval_metric method"
 
@@ -483,6 +853,50 @@ def test_SequentialDesign_get_batch_points():
     with pytest.raises(AssertionError):
         sd.get_batch_points(-1)
 
+def test_SequentialDesign_get_batch_points_fixed():
+    "test the get_batch_points method with fixed hyperparameters"
+
+    np.random.seed(74632)
+
+    ed = LatinHypercubeDesign(3)
+
+    def f(x):
+        return np.sum(x)
+
+    sd = SequentialDesign(ed, f, n_init = 4, n_cand = 4)
+
+    with pytest.raises(ValueError):
+        sd.get_batch_points(2, fixed_hyperparameters = True)
+
+    sd.run_initial_design()
+
+    with pytest.raises(NotImplementedError):
+        sd.get_batch_points(2, fixed_hyperparameters = True)
+
+    def tmp_eval_batch_metric(self, n_points):
+        return [3, 1][:n_points]
+
+    sd._eval_batch_metric = types.MethodType(tmp_eval_batch_metric, sd)
+
+    inputs = sd.get_inputs()
+
+    batch_points = sd.get_batch_points(2, fixed_hyperparameters = True)
+
+    assert_allclose(batch_points, sd.get_candidates()[[3, 1]])
+    assert_allclose(sd.get_inputs(), np.concatenate((inputs, batch_points)))
+    assert sd.get_targets().shape == (4,)
+    assert sd.current_iteration == 4
+
+    sd.set_batch_targets(np.sum(batch_points, axis = 1))
+
+    assert sd.current_iteration == 6
+
+    with pytest.raises(AssertionError):
+        sd.get_batch_points(5, fixed_hyperparameters = True)
+
+    with pytest.raises(AssertionError):
+        sd.get_batch_points(3, fixed_hyperparameters = True)
+
 def test_SequentialDesign_get_next_point():
     "test the get_next_point method"
 
@@ -546,6 +960,92 @@ def test_SequentialDesign_get_next_point():
     with pytest.raises(AssertionError):
         next_point = sd.get_next_point()
 
+def test_SequentialDesign_pending_points():
+    "test the methods for choosing points and setting targets asynchronously"
+
+    np.random.seed(74632)
+
+    ed = LatinHypercubeDesign(3)
+
+    def f(x):
+        return np.sum(x)
+
+    def tmp_eval_metric(self):
+        return 0
+
+    sd = SequentialDesign(ed, f, n_init = 4, n_cand = 4)
+    sd._eval_metric = types.MethodType(tmp_eval_metric, sd)
+
+    with pytest.raises(ValueError):
+        sd.get_pending_point()
+
+    sd.run_initial_design()
+
+    assert sd.get_pending_points().shape == (0, 3)
+
+    label_1, point_1 = sd.get_pending_point()
+    label_2, point_2 = sd.get_pending_point()
+
+    assert label_1 != label_2
+    assert_allclose(sd.get_pending_points(), np.array([point_1, point_2]))
+    assert sd.get_current_iteration() == 4
+
+    sd.set_pending_target(label_2, f(point_2))
+
+    assert_allclose(sd.get_pending_points(), np.array([point_1]))
+    assert_allclose(sd.get_inputs()[-1], point_2)
+    assert_allclose(sd.get_targets()[-1], f(point_2))
+    assert sd.get_current_iteration() == 5
+
+    with pytest.raises(AssertionError):
+        sd.set_pending_target(label_2, f(point_2))
+
+    with pytest.raises(AssertionError):
+        sd.set_pending_target(label_1, [1., 2.])
+
+    sd.set_pending_target(label_1, f(point_1))
+
+    assert_allclose(sd.get_inputs()[-1], point_1)
+    assert_allclose(sd.get_targets(), np.sum(sd.get_inputs(), axis = 1))
+    assert sd.get_pending_points().shape == (0, 3)
+    assert sd.get_current_iteration() == 6
+
+def test_SequentialDesign_condition_on_pending():
+    "test that conditioning on pending points only reduces the variance"
+
+    np.random.seed(74632)
+
+    ed = LatinHypercubeDesign(3)
+
+    def f(x):
+        return np.sum(x)
+
+    def tmp_eval_metric(self):
+        return 0
+
+    sd = SequentialDesign(ed, f, n_init = 6, n_cand = 20)
+    sd._eval_metric = types.MethodType(tmp_eval_metric, sd)
+    sd.run_initial_design()
+
+    gp = GaussianProcess(sd.get_inputs(), sd.get_targets(), 1.e-6)
+    gp._set_params([0., 0., 0., 0.])
+
+    assert sd._condition_on_pending(gp) is gp
+
+    sd._generate_candidates()
+    candidates = sd.get_candidates()
+    mean, unc = sd._predict_candidates(gp)
+
+    label, point = sd.get_pending_point()
+    sd.candidates = np.concatenate((candidates, np.reshape(point, (1, 3))))
+
+    mean_pending, unc_pending = sd._predict_candidates(gp)
+
+    assert_allclose(mean_pending[:-1], mean, atol = 1.e-8)
+    assert np.all(unc_pending[:-1] <= unc + 1.e-10)
+    assert np.any(unc_pending[:-1] < unc)
+    assert_allclose(unc_pending[-1], 0., atol = 1.e-5)
+
 def test_SequentialDesign_set_batch_targets():
     "test the set_batch_targets method"
 
@@ -683,6 +1183,44 @@ def test_SequentialDesign_run_next_point():
         sd.run_next_point()
 
 
+def test_SequentialDesign_run_batch_points():
+    "test the run_batch_points method"
+
+    np.random.seed(74632)
+
+    ed = LatinHypercubeDesign(3)
+
+    def f(x):
+        return np.sum(x)
+
+    def tmp_eval_metric(self):
+        return 0
+
+    def tmp_estimate_next_target(self, next_point):
+        return np.array([1.])
+
+    sd = SequentialDesign(ed, f, n_init = 4, n_cand = 4)
+    sd._eval_metric = types.MethodType(tmp_eval_metric, sd)
+    sd._estimate_next_target = types.MethodType(tmp_estimate_next_target, sd)
+    sd.run_initial_design()
+
+    with ThreadPoolExecutor(2) as executor:
+        sd.run_batch_points(3, executor = executor)
+
+    assert sd.inputs.shape == (7, 3)
+    assert_allclose(sd.targets, np.sum(sd.inputs, axis = 1))
+    assert sd.current_iteration == 7
+
+    sd.run_batch_points(2)
+
+    assert sd.inputs.shape == (9, 3)
+    assert_allclose(sd.targets, np.sum(sd.inputs, axis = 1))
+    assert sd.current_iteration == 9
+
+    sd = SequentialDesign(ed)
+    with pytest.raises(AssertionError):
+        sd.run_batch_points(2)
+
 def test_SequentialDesign_run_sequential_design():
     "test the run_sequential_design method"
 
@@ -724,11 +1262,30 @@ def test_SequentialDesign_run_sequential_design():
     assert_allclose(sd.targets, targets_expected)
     assert sd.current_iteration == 8
 
+    def tmp_estimate_next_target(self, next_point):
+        return np.array([1.])
+
+    np.random.seed(74632)
+
+    sd = SequentialDesign(ed, f, n_init = 4, n_cand = 4)
+    sd._eval_metric = types.MethodType(tmp_eval_metric, sd)
+    sd._estimate_next_target = types.MethodType(tmp_estimate_next_target, sd)
+    with ThreadPoolExecutor(2) as executor:
+        sd.run_sequential_design(5, batch_size = 2, executor = executor)
+
+    assert_allclose(sd.inputs[:4], inputs_expected[:4])
+    assert sd.inputs.shape == (9, 3)
+    assert_allclose(sd.targets, np.sum(sd.inputs, axis = 1))
+    assert sd.current_iteration == 9
+
     sd = SequentialDesign(ed, f, n_init = 4, n_cand = 4)
 
     with pytest.raises(ValueError):
         sd.run_sequential_design()
 
+    with pytest.raises(AssertionError):
+        sd.run_sequential_design(4, batch_size = 0)
+
     sd = SequentialDesign(ed)
     with pytest.raises(AssertionError):
         sd.run_sequential_design()
@@ -737,6 +1294,37 @@ def test_SequentialDesign_run_sequential_design():
     with pytest.raises(AssertionError):
         sd.run_sequential_design(n_samples = -1)
 
+def test_SequentialDesign_run_async_design():
+    "test the run_async_design method"
+
+    np.random.seed(74632)
+
+    ed = LatinHypercubeDesign(3)
+
+    def f(x):
+        return np.sum(x)
+
+    md = MICEDesign(ed, f, n_init = 5, n_cand = 10, nugget = 1.e-6)
+
+    with ThreadPoolExecutor(2) as executor:
+        md.run_async_design(executor, 3, max_pending = 2)
+
+    assert md.get_inputs().shape == (8, 3)
+    assert_allclose(md.get_targets(), np.sum(md.get_inputs(), axis = 1))
+    assert md.get_pending_points().shape == (0, 3)
+    assert md.get_current_iteration() == 8
+
+    md = MICEDesign(ed, f, n_init = 5, n_cand = 10)
+
+    with ThreadPoolExecutor(2) as executor:
+        with pytest.raises(ValueError):
+            md.run_async_design(executor)
+        with pytest.raises(AssertionError):
+            md.run_async_design(executor, 3, max_pending = 0)
+
+    with pytest.raises(AssertionError):
+        md.run_async_design(None, 3)
+
 def test_SequentialDesign_str():
     "test string method of sequential design"
 
@@ -822,6 +1410,12 @@ def test_MICEDesign_init_failures():
     with pytest.raises(ValueError):
         md = MICEDesign(ed, nugget_s = -1.)
 
+    with pytest.raises(ValueError):
+        md = MICEDesign(ed, candidate_refresh = 0)
+
+    with pytest.raises(ValueError):
+        md = MICEDesign(ed, theta_tol = -1.)
+
 def test_MICEDesign_get_nugget():
     "test the get_nugget method of MICE Design"
 
@@ -892,6 +1486,106 @@ def test_MICEDesign_MICE_criterion():
     with pytest.raises(AssertionError):
         metric = md._MICE_criterion(5)
 
+def test_MICEDesign_eval_batch_metric():
+    "test the batch version of the MICE criterion with fixed hyperparameters"
+
+    np.random.seed(74632)
+
+    ed = LatinHypercubeDesign(3)
+
+    def f(x):
+        return np.sum(x)
+
+    md = MICEDesign(ed, f, n_init = 6, n_cand = 20, nugget = 1.e-6)
+
+    md.run_initial_design()
+    md._generate_candidates()
+
+    batch_indices = md._eval_batch_metric(3)
+
+    assert batch_indices.shape == (3,)
+    assert len(np.unique(batch_indices)) == 3
+
+    # each point should be the one chosen by the MICE criterion after conditioning
+    # on the previous points in the batch
+
+    for i in range(3):
+        md.pending = {j: md.candidates[batch_indices[j]] for j in range(i)}
+        metric = md._MICE_criteria()
+        metric[batch_indices[:i]] = -np.inf
+        assert np.argmax(metric) == batch_indices[i]
+
+    md.pending = {}
+
+    with pytest.raises(AssertionError):
+        md._eval_batch_metric(21)
+
+    batch_points = md.get_batch_points(4, fixed_hyperparameters = True)
+
+    assert batch_points.shape == (4, 3)
+    assert md.get_inputs().shape == (10, 3)
+    assert md.current_iteration == 6
+
+def test_MICEDesign_pool():
+    "test running a MICE design with a screened candidate pool"
+
+    np.random.seed(74632)
+
+    ed = LatinHypercubeDesign(3)
+
+    def f(x):
+        return np.sum(x)
+
+    md = MICEDesign(ed, f, n_init = 5, n_cand = 10, nugget = 1.e-6, n_pool = 1000)
+
+    assert md.get_n_pool() == 1000
+
+    md.run_sequential_design(2)
+
+    assert md.get_inputs().shape == (7, 3)
+    assert md.get_candidates().shape == (10, 3)
+
+def test_MICEDesign_candidate_refresh():
+    "test reusing the candidates and candidate GP between iterations of a MICE design"
+
+    np.random.seed(74632)
+
+    ed = LatinHypercubeDesign(3)
+
+    def f(x):
+        return np.sum(x)
+
+    md = MICEDesign(ed, f, n_init = 5, n_cand = 10, nugget = 1.e-6, candidate_refresh = 3,
+                    theta_tol = 1.e10)
+
+    assert md.get_candidate_refresh() == 3
+    assert_allclose(md.get_theta_tol(), 1.e10)
+
+    md.run_initial_design()
+    md.run_next_point()
+
+    candidates = np.array(md.get_candidates())
+    gp_fast = md.gp_fast
+
+    md.run_next_point()
+
+    assert md.gp_fast is gp_fast
+    assert md.get_candidates().shape == (10, 3)
+    assert np.sum(np.all(md.get_candidates()[:9] == candidates[:, None, :], axis = 2)) == 9
+    assert not np.any(np.all(md.get_candidates() == md.get_inputs()[:-1, None, :], axis = 2))
+    assert np.array_equal(gp_fast.inputs, md.get_candidates())
+
+    gp_new = MICEFastGP(md.get_candidates(), np.ones(10), gp_fast.nugget)
+    gp_new._set_params(gp_fast.theta)
+
+    assert_allclose(gp_fast.fast_predict_all(), gp_new.fast_predict_all(), rtol = 1.e-6, atol = 1.e-10)
+
+    md.run_next_point()
+    md.run_next_point()
+
+    assert not md.gp_fast is gp_fast
+    assert md.get_inputs().shape == (9, 3)
+
 def test_MICEDesign_eval_metric():
     "test the _eval_metric method of MICE Design"
 
@@ -913,6 +1607,171 @@ def test_MICEDesign_eval_metric():
 
     assert best_point == best_point_expected
 
+def test_MultiOutputMICEDesign_init():
+    "test the init method of the multiple output MICE design"
+
+    ed = LatinHypercubeDesign(3)
+
+    def f(x):
+        return np.array([np.sum(x), np.prod(x)])
+
+    md = MultiOutputMICEDesign(ed, 2, f, n_init = 5, n_cand = 10, nugget = 1.e-6, metric = "variance",
+                               processes = 2)
+
+    assert md.get_n_outputs() == 2
+    assert md.get_metric() == "variance"
+    assert md.get_aggregate() == "sum"
+    assert md.get_nugget() == 1.e-6
+    assert md.get_n_cand() == 10
+    assert md.processes == 2
+    assert md.executor is None
+
+    with pytest.raises(ValueError):
+        MultiOutputMICEDesign(ed, 0, f)
+
+    with pytest.raises(ValueError):
+        MultiOutputMICEDesign(ed, 2, f, metric = "entropy")
+
+    assert MultiOutputMICEDesign(ed, 2, f, aggregate = "max").get_aggregate() == "max"
+
+    with pytest.raises(ValueError):
+        MultiOutputMICEDesign(ed, 2, f, aggregate = "mean")
+
+    with pytest.raises(AssertionError):
+        MultiOutputMICEDesign(ed, 2, f, processes = 0)
+
+    with pytest.raises(AssertionError):
+        MultiOutputMICEDesign(ed, 2, f, executor = 1.)
+
+def test_MultiOutputMICEDesign_targets():
+    "test setting targets with multiple outputs"
+
+    np.random.seed(74632)
+
+    ed = LatinHypercubeDesign(3)
+
+    md = MultiOutputMICEDesign(ed, 2, n_init = 4)
+
+    inputs = md.generate_initial_design()
+
+    with pytest.raises(AssertionError):
+        md.set_initial_targets(np.sum(inputs, axis = 1))
+
+    targets = np.array([np.sum(inputs, axis = 1), np.prod(inputs, axis = 1)]).T
+
+    md.set_initial_targets(targets)
+
+    assert_allclose(md.get_targets(), targets)
+
+    md.inputs = np.concatenate((md.inputs, np.full((1, 3), 0.5)))
+
+    with pytest.raises(AssertionError):
+        md.set_next_target(1.)
+
+    md.set_next_target([1.5, 0.125])
+
+    assert md.get_targets().shape == (5, 2)
+    assert_allclose(md.get_targets()[-1], [1.5, 0.125])
+
+def test_MultiOutputMICEDesign_criteria():
+    "test that the criteria are the sums of the criteria for the outputs"
+
+    np.random.seed(74632)
+
+    ed = LatinHypercubeDesign(3)
+
+    def f(x):
+        return np.array([np.sum(x), np.sin(3.*x[0]) + x[1]**2])
+
+    with ThreadPoolExecutor(2) as executor:
+        md = MultiOutputMICEDesign(ed, 2, f, n_init = 8, n_cand = 10, nugget = 1.e-6, executor = executor)
+
+        md.run_initial_design()
+        md._generate_candidates()
+        md._fit_MICE_gps()
+
+        metric = md._MICE_criteria()
+
+        metric_expected = np.zeros(10)
+
+        for emulator in md.gp.emulators:
+            gp = GaussianProcess(md.get_inputs(), emulator.targets, 1.e-6)
+            gp._set_params(emulator.theta)
+            gp_fast = MICEFastGP(md.get_candidates(), np.ones(10), np.exp(emulator.theta[-1]))
+            gp_fast._set_params(emulator.theta)
+            _, unc, _ = gp.predict(md.get_candidates())
+            metric_expected += unc/gp_fast.fast_predict_all()
+
+        assert_allclose(metric, metric_expected)
+        assert_allclose(md._MICE_criterion(3), metric_expected[3])
+
+        md.metric = "variance"
+
+        metric = md._MICE_criteria()
+
+        _, unc, _ = md.gp.predict(md.get_candidates(), executor = executor)
+        scales = np.exp([[emulator.theta[-1]] for emulator in md.gp.emulators])
+        metric_expected = np.sum(unc/scales, axis = 0)
+
+        assert_allclose(metric, metric_expected)
+
+        # the largest scaled variance over the outputs is used when aggregating with a max
+
+        md.aggregate = "max"
+
+        assert_allclose(md._MICE_criteria(), np.max(unc/scales, axis = 0))
+
+        md.metric = "MICE"
+
+        batch_indices = md._eval_batch_metric(3)
+
+        assert len(np.unique(batch_indices)) == 3
+        assert batch_indices[0] == np.argmax(md._MICE_criteria())
+
+        md.aggregate = "sum"
+
+        batch_indices = md._eval_batch_metric(3)
+
+        assert len(np.unique(batch_indices)) == 3
+        assert batch_indices[0] == np.argmax(md._MICE_criteria())
+
+        # estimated targets are the predictions for each output
+
+        target = md._estimate_next_target(md.get_candidates()[0])
+        mean, _, _ = md.gp.predict(md.get_candidates()[:1], executor = executor)
+
+        assert_allclose(target, mean[:, 0])
+
+def test_MultiOutputMICEDesign_run_sequential_design():
+    "test running a multiple output MICE design"
+
+    np.random.seed(74632)
+
+    ed = LatinHypercubeDesign(3)
+
+    def f(x):
+        return np.array([np.sum(x), np.sin(3.*x[0]) + x[1]**2])
+
+    with ThreadPoolExecutor(2) as executor:
+        for metric in ["MICE", "variance"]:
+            md = MultiOutputMICEDesign(ed, 2, f, n_init = 6, n_cand = 10, nugget = 1.e-6, metric = metric,
+                                       executor = executor)
+
+            md.run_sequential_design(4, batch_size = 2, executor = executor)
+
+            assert md.get_inputs().shape == (10, 3)
+            assert md.get_targets().shape == (10, 2)
+            assert_allclose(md.get_targets(), np.array([f(x) for x in md.get_inputs()]))
+
+        md.run_batch_points(2, fixed_hyperparameters = True)
+
+        assert md.get_targets().shape == (12, 2)
+
+        label, point = md.get_pending_point()
+        md.set_pending_target(label, f(point))
+
+        assert md.get_targets().shape == (13, 2)
+
 def test_MICEFastGP():
     "test the correction formula for the modified GP for Fast MICE"
 
@@ -927,4 +1786,76 @@ def test_MICEFastGP():
         result = gp.fast_predict(-1)
 
     with pytest.raises(AssertionError):
-        result = gp.fast_predict(5)
\ No newline at end of file
+        result = gp.fast_predict(5)
+
+def test_MICEFastGP_add_remove_point():
+    "test that adding and removing points matches refitting the candidate GP"
+
+    np.random.seed(4217)
+
+    x = np.random.random((20, 2))
+
+    gp = MICEFastGP(x[:19], np.ones(19), 0.5)
+    gp._set_params([-1., 0., 0.5])
+
+    gp.remove_point(4)
+    gp.add_point(x[19])
+
+    x_new = np.concatenate((np.delete(x[:19], 4, axis = 0), x[19:]))
+
+    gp_new = MICEFastGP(x_new, np.ones(19), 0.5)
+    gp_new._set_params([-1., 0., 0.5])
+
+    assert_allclose(gp.inputs, x_new)
+    assert_allclose(gp.L, gp_new.L, atol = 1.e-10)
+    assert_allclose(gp.fast_predict_all(), gp_new.fast_predict_all(), rtol = 1.e-6, atol = 1.e-10)
+
+def test_MICEDesign_MICE_criteria():
+    "test that the vectorized MICE criterion agrees with the criterion for single points"
+
+    np.random.seed(74632)
+
+    ed = LatinHypercubeDesign(3)
+
+    def f(x):
+        return np.sum(x)
+
+    md = MICEDesign(ed, f, n_init = 4, n_cand = 4)
+
+    md.run_initial_design()
+    md._generate_candidates()
+
+    md.gp = GaussianProcess(md.get_inputs(), md.get_targets())
+    md.gp.learn_hyperparameters()
+
+    md.gp_fast = MICEFastGP(md.candidates, np.ones(4), 1.)
+    md.gp_fast._set_params(md.gp.theta)
+
+    metric = md._MICE_criteria()
+
+    assert metric.shape == (4,)
+    assert_allclose(metric[0], 0.0899338596342571, rtol = 1.e-6)
+    assert_allclose(metric, [md._MICE_criterion(i) for i in range(4)])
+
+def test_MICEFastGP_fast_predict_all():
+    "test that the fast predictions for all points match refitting without each point"
+
+    np.random.seed(4217)
+
+    x = np.random.random((20, 2))
+
+    for nugget in [None, 0.5]:
+        gp = MICEFastGP(x, np.ones(20), nugget)
+        gp._set_params([-1., 0., 0.5])
+
+        result = gp.fast_predict_all()
+
+        assert result.shape == (20,)
+
+        for i in range(20):
+            indices = (np.arange(20) != i)
+            gp_loo = GaussianProcess(x[indices], np.ones(19), gp.nugget)
+            gp_loo._set_params([-1., 0., 0.5])
+            _, unc, _ = gp_loo.predict(x[i], do_deriv = False)
+            assert_allclose(result[i], unc, rtol = 1.e-6, atol = 1.e-10)
+            assert_allclose(gp.fast_predict(i), unc, rtol = 1.e-6, atol = 1.e-10)
@@ -0,0 +1,74 @@
+import os
+import time
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose
+from .. import SocketExecutor, MultiOutputGP
+
+def wait_for_workers(executor, n_workers, timeout = 30.):
+    "Wait until a given number of workers has connected to the executor"
+    start = time.time()
+    while executor.get_n_workers() < n_workers:
+        assert time.time() - start < timeout, "workers failed to connect"
+        time.sleep(0.05)
+
+def test_SocketExecutor():
+    "Test submitting tasks to workers launched on the local machine"
+    with SocketExecutor() as executor:
+        assert executor.address[0] in ("localhost", "127.0.0.1")
+        executor.start_local_workers(2)
+        wait_for_workers(executor, 2)
+
+        future = executor.submit(pow, 2, 10)
+        assert future.result() == 1024
+
+        assert list(executor.map(abs, [-1, 2, -3])) == [1, 2, 3]
+
+        future = executor.submit(int, "a")
+        with pytest.raises(ValueError):
+            future.result()
+
+        # a task that kills its worker is retried once and then fails
+
+        future = executor.submit(os._exit, 1)
+        with pytest.raises(RuntimeError):
+            future.result(timeout = 30.)
+
+        wait_for_workers(executor, 0)
+
+    with pytest.raises(AssertionError):
+        executor.submit(pow, 2, 10)
+
+def test_SocketExecutor_MultiOutputGP():
+    "Test fitting and predicting with a MultiOutputGP using a SocketExecutor"
+    np.random.seed(2471)
+    x = np.random.uniform(size = (12, 2))
+    y = np.array([np.sin(3.*x[:, 0]) + x[:, 1], np.cos(2.*x[:, 1]) - x[:, 0]])
+    x_star = np.array([[0.1, 0.3], [0.3, 0.2]])
+    theta0 = np.zeros(3)
+
+    gp = MultiOutputGP(x, y, [1.e-6, 1.e-6])
+    l_expected = gp.learn_hyperparameters(n_tries = 1, theta0 = theta0, processes = 1)
+    predict_expected = gp.predict(x_star, processes = 1)
+
+    gp = MultiOutputGP(x, y, [1.e-6, 1.e-6])
+    with SocketExecutor() as executor:
+        executor.start_local_workers(2)
+        l_actual = gp.learn_hyperparameters(n_tries = 1, theta0 = theta0, executor = executor)
+        predict_actual = gp.predict(x_star, executor = executor)
+
+    for (loglike_actual, theta_actual), (loglike_exp, theta_exp) in zip(l_actual, l_expected):
+        assert_allclose(loglike_actual, loglike_exp, atol = 1.e-8, rtol = 1.e-5)
+        assert_allclose(theta_actual, theta_exp, atol = 1.e-8, rtol = 1.e-5)
+    for actual, expected in zip(predict_actual, predict_expected):
+        assert_allclose(actual, expected, atol = 1.e-8, rtol = 1.e-5)
+
+def test_SocketExecutor_failures():
+    "Test SocketExecutor with bad inputs"
+    with pytest.raises(AssertionError):
+        SocketExecutor(authkey = "key")
+    with pytest.raises(AssertionError):
+        SocketExecutor(max_attempts = 0)
+    with SocketExecutor() as executor:
+        with pytest.raises(AssertionError):
+            executor.start_local_workers(0)
@@ -4,7 +4,11 @@ Created on Wed Apr 24 05:32:45 2013
 
 @author: tisimst
 """
+import os
 import random
+import pickle
+import struct
+import zlib
 from copy import copy
 import numpy as np
 import scipy.stats as ss
@@ -42,3 +46,72 @@ def integer_bisect(bound, f):
             return integer_bisect((midpoint, bound[1]), f)
         else:
             return integer_bisect((bound[0], midpoint), f)
+
+_record_header = struct.Struct("<QI")
+
+def write_record(fileobj, record, fsync = True):
+    """
+    Appends a record to a binary file opened for appending and (optionally) forces it to disk.
+
+    Each record is stored as its length and CRC32 checksum followed by the pickled record,
+    so that a record that was only partially written (for instance, because the process
+    was killed) can be detected by ``read_records``.
+    """
+    write_raw_record(fileobj, pickle.dumps(record, protocol = pickle.HIGHEST_PROTOCOL), fsync)
+
+def write_raw_record(fileobj, payload, fsync = True):
+    """
+    Appends a record holding a bytes payload (rather than a pickled object) to a binary file.
+
+    Uses the same length and checksum framing as ``write_record``. Records written with this
+    function are read back with ``raw = True`` in ``read_records`` or ``open_record_file``.
+    """
+    fileobj.write(_record_header.pack(len(payload), zlib.crc32(payload)) + payload)
+    fileobj.flush()
+    if fsync:
+        os.fsync(fileobj.fileno())
+
+def read_records(filename, raw = False):
+    """
+    Reads all complete records written with ``write_record`` from a file.
+
+    Reading stops at the first record that is incomplete or fails its checksum. Returns
+    the list of records and the length in bytes of the valid part of the file, so that
+    the file can be truncated to that length before appending further records. A missing
+    file holds no records. If ``raw`` is true, the records are returned as bytes without
+    unpickling them (for records written with ``write_raw_record``).
+    """
+    records = []
+    valid_length = 0
+    if not os.path.exists(filename):
+        return records, valid_length
+    file_size = os.path.getsize(filename)
+    with open(filename, "rb") as f:
+        while True:
+            header = f.read(_record_header.size)
+            if len(header) < _record_header.size:
+                break
+            length, checksum = _record_header.unpack(header)
+            if length > file_size - f.tell():
+                break
+            payload = f.read(length)
+            if len(payload) < length or zlib.crc32(payload) != checksum:
+                break
+            if raw:
+                records.append(payload)
+            else:
+                records.append(pickle.loads(payload))
+            valid_length += _record_header.size + length
+    return records, valid_length
+
+def open_record_file(filename, raw = False):
+    """
+    Opens a file of records for appending, first removing any incomplete record at its end.
+
+    Returns the records already in the file and the file object, which is positioned at the
+    end of the last complete record. ``raw`` is passed to ``read_records``.
+    """
+    records, valid_length = read_records(filename, raw)
+    f = open(filename, "ab")
+    f.truncate(valid_length)
+    return records, f